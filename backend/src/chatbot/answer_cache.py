@@ -0,0 +1,85 @@
+"""
+Semantic answer cache for the RAG chains.
+
+A question whose embedding is within `threshold` cosine similarity of a cached
+question in the same scope ("hospital" / "pharmacy") gets the cached answer,
+skipping both the vector search and the LLM call. Only questions asked with
+no chat history are cached or served, since history can change what a
+question means. Entries expire after `ttl_sec` and a whole scope is dropped
+when its underlying documents change (EmbeddingSyncWatcher.on_flush, or a
+periodic index refresh through chatbot_rag.data_change_callbacks).
+"""
+import threading
+import time
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold=0.95, ttl_sec=600.0, max_entries=512):
+        self.threshold = threshold
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self._entries = {}  # scope -> list of (unit vector, question, answer, stored_at, cost_sec)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.saved_sec = 0.0
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _live(self, scope, now):
+        entries = [e for e in self._entries.get(scope, []) if now - e[3] < self.ttl_sec]
+        self._entries[scope] = entries
+        return entries
+
+    def lookup(self, scope, embedding):
+        """Cached answer for the closest question above threshold, else None."""
+        query = self._unit(embedding)
+        with self._lock:
+            entries = self._live(scope, time.monotonic())
+            if entries:
+                scores = np.stack([e[0] for e in entries]) @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.hits += 1
+                    self.saved_sec += entries[best][4]
+                    return entries[best][2]
+            self.misses += 1
+            return None
+
+    def store(self, scope, embedding, question, answer, cost_sec):
+        """cost_sec is how long the uncached answer took; credited on every hit."""
+        with self._lock:
+            entries = self._live(scope, time.monotonic())
+            entries.append((self._unit(embedding), question, answer, time.monotonic(), cost_sec))
+            if len(entries) > self.max_entries:
+                del entries[:len(entries) - self.max_entries]
+
+    def invalidate(self, scope=None):
+        """Drop every entry of a scope (or all scopes) after a data change."""
+        with self._lock:
+            if scope is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(scope, None)
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": sum(len(v) for v in self._entries.values()),
+                "threshold": self.threshold,
+                "ttl_sec": self.ttl_sec,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "latency_saved_sec": round(self.saved_sec, 3),
+            }
@@ -1,11 +1,15 @@
 import os
 import uuid
+import asyncio
 import threading
 import time 
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
@@ -22,10 +26,22 @@ from chatbot_rag import (
     create_pharmacy_rag_system,
     check_vector_indexes,
     check_appointment_status,
+    get_appointment_statuses,
+    ensure_appointment_indexes,
     PatientBookingSystem,
-    hospital_memory,
-    pharmacy_memory
+    doctor_name_index,
+    medicine_filter_fields,
+    MEDICINE_NAME_FIELDS,
+    SPECIALTY_FIELDS,
+    RAG_BRANCH_TIMEOUT_SEC,
+    query_embedding_model,
+    resources,
+    data_change_callbacks,
+    EMBEDDING_SERVICE,
 )
+from session_manager import SessionBusyError, create_session_backend
+from answer_cache import SemanticAnswerCache
+from fast_paths import FastPathRouter
 
 # ------------------------------------------------------------------
 # 1. GLOBALS AND CONFIG
@@ -36,67 +52,217 @@ global global_hospital_qa_chain
 global global_pharmacy_qa_chain
 global_hospital_qa_chain = None
 global_pharmacy_qa_chain = None
-global_session_store: Dict[str, Dict[str, Any]] = {}
+global_vectorstores: Dict[str, Any] = {}  # "hospital"/"pharmacy" -> vector store behind each chain
+# Per-session booking flow + chat memories; in-process or Mongo (SESSION_BACKEND)
+global_session_store = create_session_backend()
+
+# Semantic answer cache for history-free questions (see answer_cache.py)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+EMBEDDING_SYNC = os.getenv("EMBEDDING_SYNC", "0") == "1"
+# Without the change-stream watcher, deletes and text-only edits are not seen
+# until an index refresh notices them, so cached answers live much shorter
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+    ttl_sec=float(os.getenv("ANSWER_CACHE_TTL_SEC", "600" if EMBEDDING_SYNC else "60")),
+    max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512")),
+)
+# Periodic vector/lexical index refreshes that see changed documents drop the scope too
+data_change_callbacks.append(answer_cache.invalidate)
+
+# Structured lookups (stock, specialty, doctor phone) answered without the LLM
+FAST_PATHS_ENABLED = os.getenv("FAST_PATHS_ENABLED", "1") == "1"
+fast_path_router = FastPathRouter(
+    medicines_collection,
+    doctor_name_index,
+    medicine_fields_fn=medicine_filter_fields,
+    medicine_name_fields=MEDICINE_NAME_FIELDS,
+    specialty_fields=SPECIALTY_FIELDS,
+)
+# Turns per route; everything except "llm" was answered without a model call
+traffic_counters = Counter()
+
+# Bounded pool for the blocking pymongo work (booking flow, status lookups) so
+# it never runs on the event loop. Chains are awaited via ainvoke instead.
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "16"))
+db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+
+async def run_blocking(fn, *args):
+    """Run a blocking DB call on the bounded executor and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, fn, *args)
+
+async def ask_chain(chain, memory, question: str, scope: str) -> Dict[str, Any]:
+    """Invoke a stateless chain with this session's history, then record the turn.
+    History-free questions are served from / stored in the semantic answer cache."""
+    chat_history = memory.load_memory_variables({})["chat_history"]
+    cacheable = ANSWER_CACHE_ENABLED and not chat_history
+    if cacheable:
+        # Same text the retriever embeds, so this also warms the query embedding cache
+        question_embedding = await query_embedding_model.aembed_query(question)
+        cached_answer = answer_cache.lookup(scope, question_embedding)
+        if cached_answer is not None:
+            memory.save_context({"question": question}, {"answer": cached_answer})
+            return {"answer": cached_answer, "cached": True}
+
+    started = time.perf_counter()
+    result = await chain.ainvoke({"question": question, "chat_history": chat_history})
+    memory.save_context({"question": question}, {"answer": result.get("answer", "")})
+    if cacheable and result.get("answer"):
+        answer_cache.store(scope, question_embedding, question, result["answer"], time.perf_counter() - started)
+    return result
+
+async def invoke_branch(chain, memory, question: str, label: str, timeout: float = RAG_BRANCH_TIMEOUT_SEC):
+    """Await one chain with a timeout; returns None if it is slow or fails."""
+    try:
+        return await asyncio.wait_for(ask_chain(chain, memory, question, label), timeout=timeout)
+    except asyncio.TimeoutError:
+        print(f"[WARN] {label} chain timed out after {timeout:.0f}s; answering without it.")
+    except Exception as e:
+        print(f"[WARN] {label} chain failed: {e}")
+    return None
 
-# Utility function to call RAG system creation.
+# Utility function to call RAG system creation. Chains are built without
+# memory; each session passes its own chat history (see ask_chain).
 def create_hospital_rag_system_fixed():
-    return create_hospital_rag_system()
+    return create_hospital_rag_system(memory=None)
 
 # --- System Initialization ---
+# Startup runs in a background thread; /readyz reports its progress per component
+startup_state: Dict[str, Any] = {"phase": "starting", "started_at": time.time(), "ready_at": None, "components": {},
+                                 "step": None, "error": None}
+WARMUP_QUERIES = {
+    "hospital": os.getenv("WARMUP_HOSPITAL_QUERY", "cardiologist"),
+    "pharmacy": os.getenv("WARMUP_PHARMACY_QUERY", "paracetamol"),
+}
+# Also send one question through each chain so the LLM client's connection is open (costs tokens)
+WARMUP_LLM = os.getenv("WARMUP_LLM", "0") == "1"
+READY_PING_TIMEOUT_SEC = float(os.getenv("READY_PING_TIMEOUT_SEC", "2"))
+
+def mark_component(name: str, state: str, **details):
+    startup_state["components"][name] = {"state": state, **details}
+
+def timed(name: str, fn, *args):
+    """Run one startup step, recording ok/failed and how long it took."""
+    started = time.perf_counter()
+    try:
+        result = fn(*args)
+    except Exception as e:
+        mark_component(name, "failed", error=str(e), sec=round(time.perf_counter() - started, 3))
+        print(f"[STARTUP FAIL] {name}: {e}")
+        return None
+    mark_component(name, "ok", sec=round(time.perf_counter() - started, 3))
+    return result if result is not None else True
+
+def warmup_system(chains: Dict[str, Any]):
+    """Take the cold-start costs (tokenizer, first forward pass, lexical index
+    build, snapshot load, connection pools) before the first user does."""
+    print("[1] Warming up...")
+    timed("warmup_embed", lambda: query_embedding_model.embed_documents(["warmup", "warmup query"]))
+    for scope, chain in chains.items():
+        timed(f"warmup_retrieval_{scope}", chain.retriever.invoke, WARMUP_QUERIES[scope])
+        if WARMUP_LLM:
+            timed(f"warmup_llm_{scope}", chain.invoke, {"question": WARMUP_QUERIES[scope], "chat_history": []})
+
 def initialize_system():
-    """Performs synchronous, blocking startup operations."""
+    """Blocking startup (connect, build indexes and chains, warm up); runs in a
+    background thread while the server already answers /healthz and /readyz.
+    An unexpected exception marks startup failed instead of leaving it "starting"."""
+    try:
+        run_startup()
+    except Exception as e:
+        step = startup_state["step"] or "startup"
+        startup_state["phase"] = "failed"
+        startup_state["error"] = {"step": step, "error": f"{type(e).__name__}: {e}"}
+        mark_component(step, "failed", error=str(e) or type(e).__name__)
+        print(f"[STARTUP FAIL] {step}: {e}")
+
+def run_startup():
     global global_hospital_qa_chain, global_pharmacy_qa_chain
 
     print("[1] Starting API and initializing RAG system...")
 
-    try:
-        client.admin.command('ping')
-        print("[1] MongoDB Atlas connection OK")
-    except Exception as e:
-        print(f"[1] MongoDB connection failed: {e}")
+    # Mongo client and embedding model are built lazily; build them now
+    # rather than on the first request. With EMBEDDING_SERVICE=socket the
+    # model lives in the embedding service, so only the client is built here.
+    startup_state["step"] = "resources"
+    resources.init(["mongo_client", "query_embedding_model"])
+
+    if not timed("mongo", lambda: client.admin.command("ping")):
+        startup_state["phase"] = "failed"
         return
+    print("[1] MongoDB Atlas connection OK")
 
     # Check embeddings
     print("[1]")
+    startup_state["step"] = "vector_indexes"
     check_vector_indexes() 
 
+    # Doctor names for the booking flow (see doctor_index.py) and appointment indexes
+    timed("doctor_index", doctor_name_index.refresh)
+    startup_state["step"] = "appointment_indexes"
+    ensure_appointment_indexes()
+    startup_state["step"] = "session_indexes"
+    global_session_store.ensure_indexes()
+    startup_state["step"] = "fast_path_indexes"
+    try:
+        fast_path_router.ensure_indexes()
+    except Exception as e:
+        print(f"[INDEX FAIL] medicines name keys: {e}")
+
     # Create RAG systems 
     print("[1] Creating RAG systems...")
-    global_hospital_qa_chain, _ = create_hospital_rag_system_fixed()
-    global_pharmacy_qa_chain, _ = create_pharmacy_rag_system()
-
-    if not global_hospital_qa_chain or not global_pharmacy_qa_chain:
-        print("[1] Failed to create RAG systems.")
-        return
-    
-    # Clear memory objects upon successful startup
-    hospital_memory.clear()
-    pharmacy_memory.clear()
-
-    print("[1] Startup complete.")
+    startup_state["phase"] = startup_state["step"] = "building_chains"
+    chains = {}
+    for scope, create in (("hospital", create_hospital_rag_system_fixed),
+                          ("pharmacy", lambda: create_pharmacy_rag_system(memory=None))):
+        chain, global_vectorstores[scope] = timed(f"{scope}_chain", create) or (None, None)
+        if not chain:
+            mark_component(f"{scope}_chain", "failed", error="chain creation failed")
+            print("[1] Failed to create RAG systems.")
+            startup_state["phase"] = "failed"
+            return
+        chains[scope] = chain
+
+    startup_state["phase"] = startup_state["step"] = "warming"
+    warmup_system(chains)
+
+    # Publish the chains only now, so the first chat turn finds everything warm
+    global_hospital_qa_chain, global_pharmacy_qa_chain = chains["hospital"], chains["pharmacy"]
+    startup_state["phase"] = "ready"
+    startup_state["ready_at"] = time.time()
+    print(f"[1] Startup complete in {startup_state['ready_at'] - startup_state['started_at']:.1f}s. API is ready.")
+
+def refresh_local_vectorstore(scope: str):
+    """Pick up re-embedded documents right away in the in-process indexes
+    (local vector backend, hybrid retriever's lexical index, doctor names)."""
+    if scope == "hospital":
+        doctor_name_index.refresh()
+    vectorstore = global_vectorstores.get(scope)
+    if hasattr(vectorstore, "refresh"):
+        vectorstore.refresh()
+    chain = global_hospital_qa_chain if scope == "hospital" else global_pharmacy_qa_chain
+    retriever = getattr(chain, "retriever", None)
+    if hasattr(retriever, "refresh"):
+        retriever.refresh()
 
 # --- FastAPI lifespan ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Manages startup and shutdown events, ensuring RAG init is complete."""
-    print("[1] Running startup initialization...")
-    init_thread = threading.Thread(target=initialize_system)
-    init_thread.start()
-    init_thread.join()  # Block until initialize_system returns 
-    
-    # Enhanced Check: Wait briefly if initialization finished but RAG variables aren't set
-    timeout_sec = 5
-    start_time = time.time()
-    while (not global_hospital_qa_chain or not global_pharmacy_qa_chain) and (time.time() - start_time < timeout_sec):
-        print("Waiting for RAG variables to be fully established...")
-        time.sleep(0.5)
-
-    if not global_hospital_qa_chain or not global_pharmacy_qa_chain:
-        print("[ERROR] RAG initialization failed or timed out. API endpoints will return 503.")
-    else:
-        print("[1] Startup complete. API is available.")
+    """Starts initialization in the background and cleans up on shutdown."""
+    # Don't block: the server takes traffic (health probes, 503s) while init runs
+    print("[1] Running startup initialization in the background...")
+    threading.Thread(target=initialize_system, name="startup", daemon=True).start()
+
+    # Optional: keep embeddings in sync with live Mongo changes
+    sync_watcher = None
+    if EMBEDDING_SYNC:
+        from embedding_sync import start_embedding_sync
+        sync_watcher = start_embedding_sync(on_flush=[answer_cache.invalidate, refresh_local_vectorstore])
         
     yield
+    if sync_watcher:
+        sync_watcher.stop()
+    db_executor.shutdown(wait=False)
     print("Shutting down...")
 
 # --- FastAPI App ---
@@ -118,6 +284,10 @@ app.add_middleware(
 class ChatRequest(BaseModel):
     query: str
     session_id: Optional[str] = None 
+    language: Optional[str] = None  # e.g. "en", "hi"; used by the templated fast-path replies
+
+class AppointmentStatusRequest(BaseModel):
+    appointment_ids: List[str]
 
 class ChatResponse(BaseModel):
     response: str
@@ -141,15 +311,24 @@ async def chat(request: ChatRequest):
 
     # 3.2 Session Management
     session_id = request.session_id or str(uuid.uuid4())
-    if session_id not in global_session_store:
-        # Create a new session with a dedicated booking system instance
-        global_session_store[session_id] = {
-            "booking_system": PatientBookingSystem(),
-        }
-    
-    booking_system: PatientBookingSystem = global_session_store[session_id]["booking_system"]
-    user_query = request.query
     
+    try:
+        async with global_session_store.lock_for(session_id):
+            session = await run_blocking(global_session_store.load, session_id)
+            try:
+                return await answer_query(session, session_id, request.query, request.language)
+            finally:
+                # Persist booking progress + memory so any worker can take the next turn
+                await run_blocking(global_session_store.save, session_id, session)
+    except SessionBusyError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail="A previous message in this session is still being processed.")
+
+async def answer_query(session: Dict[str, Any], session_id: str, user_query: str, language: Optional[str] = None) -> ChatResponse:
+    """Routes one user turn to booking, status or the RAG chains without blocking the loop."""
+    booking_system: PatientBookingSystem = session["booking_system"]
+    hospital_memory = session["hospital_memory"]
+    pharmacy_memory = session["pharmacy_memory"]
     try:
         # 3.3 Booking Handling (Highest Priority)
         
@@ -157,19 +336,31 @@ async def chat(request: ChatRequest):
         is_booking_init = booking_system.current_booking_step > 0 or any(keyword in user_query.lower() for keyword in ['book', 'appointment', 'schedule', 'see a doctor'])
         
         # NOTE: The booking system's initial call also acts as a check to see if a flow should start
-        booking_response = booking_system.collect_booking_details(user_query, detected_lang=None)
+        booking_response = await run_blocking(booking_system.collect_booking_details, user_query, None)
         
         if booking_response:
              # If the booking system returned a response, it's either continuing the flow or finalizing it.
+            traffic_counters["booking"] += 1
             return ChatResponse(response=booking_response, session_id=session_id, context="booking")
 
 
         # 3.4 Appointment Status Check
         if any(keyword in user_query.lower() for keyword in ['check', 'status', 'my appointment']):
-            status_response = check_appointment_status(user_query)
+            status_response = await run_blocking(check_appointment_status, user_query)
+            traffic_counters["status"] += 1
             return ChatResponse(response=status_response, session_id=session_id, context="status")
 
-        # 3.5 RAG Classification & Query
+        # 3.5 Structured lookups answered straight from the data (falls through to RAG if unsure)
+        if FAST_PATHS_ENABLED:
+            fast_answer = await run_blocking(fast_path_router.answer, user_query, language)
+            if fast_answer:
+                answer, scope = fast_answer
+                memory = hospital_memory if scope == "hospital" else pharmacy_memory
+                memory.save_context({"question": user_query}, {"answer": answer})
+                traffic_counters["fast_path"] += 1
+                return ChatResponse(response=answer, session_id=session_id, context=scope)
+
+        # 3.6 RAG Classification & Query
         pharmacy_keywords = ['medicine', 'drug', 'pharmacy', 'tablet', 'capsule', 'syrup', 'injection', 'prescription']
         hospital_keywords = ['doctor', 'physician', 'specialist', 'cardiologist', 'neurologist', 'surgeon', 'hours', 'department', 'ward']
 
@@ -178,21 +369,37 @@ async def chat(request: ChatRequest):
 
         if is_pharmacy_query and not is_hospital_query:
             # Pharmacy Query (only)
-            result = global_pharmacy_qa_chain.invoke({"question": user_query})
+            result = await ask_chain(global_pharmacy_qa_chain, pharmacy_memory, user_query, "pharmacy")
+            traffic_counters["answer_cache" if result.get("cached") else "llm"] += 1
             answer = result['answer']
             return ChatResponse(response=answer, session_id=session_id, context="pharmacy")
 
         # *** CORRECTED RAG ROUTING LOGIC (Hospital Query only) ***
         elif is_hospital_query and not is_pharmacy_query:
             # Hospital Query (only)
-            result = global_hospital_qa_chain.invoke({"question": user_query})
+            result = await ask_chain(global_hospital_qa_chain, hospital_memory, user_query, "hospital")
+            traffic_counters["answer_cache" if result.get("cached") else "llm"] += 1
             answer = result['answer']
             return ChatResponse(response=answer, session_id=session_id, context="hospital")
 
         else:
-            # Mixed or Unclassified Query: Query both and combine responses
-            h_res = global_hospital_qa_chain.invoke({"question": user_query})
-            p_res = global_pharmacy_qa_chain.invoke({"question": user_query})
+            # Mixed or Unclassified Query: Query both concurrently and combine responses
+            h_res, p_res = await asyncio.gather(
+                invoke_branch(global_hospital_qa_chain, hospital_memory, user_query, "hospital"),
+                invoke_branch(global_pharmacy_qa_chain, pharmacy_memory, user_query, "pharmacy"),
+            )
+
+            branch_results = [r for r in (h_res, p_res) if r is not None]
+            all_cached = bool(branch_results) and all(r.get("cached") for r in branch_results)
+            traffic_counters["answer_cache" if all_cached else "llm"] += 1
+
+            # If one branch was slow or failed, answer with the other one alone
+            if h_res is None and p_res is None:
+                raise RuntimeError("both hospital and pharmacy chains failed or timed out")
+            if h_res is None:
+                return ChatResponse(response=p_res.get('answer', "I couldn't find pharmacy information on that."), session_id=session_id, context="pharmacy")
+            if p_res is None:
+                return ChatResponse(response=h_res.get('answer', "I couldn't find hospital information on that."), session_id=session_id, context="hospital")
             
             h_answer = h_res.get('answer', "I couldn't find hospital information on that.")
             p_answer = p_res.get('answer', "I couldn't find pharmacy information on that.")
@@ -236,15 +443,113 @@ async def chat(request: ChatRequest):
             return ChatResponse(response=answer, session_id=session_id, context=context_type)
 
     except Exception as e:
-        # 3.6 Catch-all Internal Error Handler (Prevents unhandled crashes)
+        # 3.7 Catch-all Internal Error Handler (Prevents unhandled crashes)
         print(f"[FAIL] UNHANDLED EXCEPTION in /api/chat for session {session_id}: {e}") 
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
             detail=f"An internal error occurred during RAG processing. Error: {str(e)[:50]}"
         )
 
+MAX_STATUS_BATCH = int(os.getenv("MAX_STATUS_BATCH", "100"))
+
+@app.post("/api/appointments/status")
+async def appointment_statuses(request: AppointmentStatusRequest):
+    """Status of several appointments in one query; unknown IDs come back with found=false."""
+    appointment_ids = list(dict.fromkeys(a.strip().upper() for a in request.appointment_ids if a.strip()))
+    if not appointment_ids:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No appointment IDs given.")
+    if len(appointment_ids) > MAX_STATUS_BATCH:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"At most {MAX_STATUS_BATCH} appointment IDs per request.")
+    try:
+        statuses = await run_blocking(get_appointment_statuses, appointment_ids)
+    except Exception as e:
+        print(f"[FAIL] Batch status lookup error: {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Appointment lookup failed.")
+    return {"appointments": [
+        {"appointment_id": apt_id, "found": apt is not None, **(apt or {})}
+        for apt_id, apt in statuses.items()
+    ]}
+
+@app.get("/api/traffic/stats")
+async def traffic_stats():
+    """Turns per route and the share answered without an LLM call."""
+    turns = sum(traffic_counters.values())
+    return {
+        "turns": turns,
+        "by_route": dict(traffic_counters),
+        "llm_free_share": (turns - traffic_counters["llm"]) / turns if turns else 0.0,
+        "fast_paths": fast_path_router.stats(),
+    }
+
+@app.get("/api/sessions/stats")
+async def session_stats():
+    """Live session count, eviction counters and approximate memory held."""
+    return await run_blocking(global_session_store.stats)
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Hit/miss counters and sizes of the retrieval-side caches."""
+    built = resources.built("query_embedding_model")
+    return {
+        "query_embeddings": query_embedding_model.stats() if built else {},
+        # Batch-size histogram and queue wait of the micro-batcher (EMBEDDING_SERVICE=batched/socket)
+        "embedding_service": query_embedding_model.base.stats()
+        if built and hasattr(query_embedding_model.base, "stats") else {"service": EMBEDDING_SERVICE},
+        "answers": answer_cache.stats(),
+    }
+
+@app.get("/api/retrieval/stats")
+async def retrieval_stats():
+    """Per-stage retrieval timings (lexical vs vector) when the hybrid retriever is on."""
+    stats = {}
+    for scope, chain in (("hospital", global_hospital_qa_chain), ("pharmacy", global_pharmacy_qa_chain)):
+        retriever = getattr(chain, "retriever", None)
+        if hasattr(retriever, "timing_stats"):
+            stats[scope] = retriever.timing_stats()
+    stats["doctor_names"] = doctor_name_index.stats()
+    return stats
+
+# ------------------------------------------------------------------
+# 4. HEALTH PROBES
+# ------------------------------------------------------------------
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and its event loop is responding."""
+    return {"status": "ok", "uptime_sec": round(time.time() - startup_state["started_at"], 1)}
+
+async def ping_mongo() -> Dict[str, Any]:
+    if not resources.built("mongo_client"):
+        return startup_state["components"].get("mongo", {"state": "pending"})
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(run_blocking(client.admin.command, "ping"), timeout=READY_PING_TIMEOUT_SEC)
+    except Exception as e:
+        return {"state": "failed", "error": str(e) or type(e).__name__}
+    return {"state": "ok", "ping_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 once startup and warmup are done and Mongo answers, 503
+    (with the same per-component report) until then."""
+    components = startup_state["components"]
+    model = resources.status()["query_embedding_model"]
+    embedding = {**model, "state": "ok" if model["state"] == "ready" else model["state"], "service": EMBEDDING_SERVICE}
+    if embedding["state"] == "ok" and hasattr(query_embedding_model.base, "probe"):
+        # Socket mode: the model lives in embedding_service.py, which may still be starting
+        embedding.update(await run_blocking(query_embedding_model.base.probe))
+    report = {"mongo": await ping_mongo(), "embedding_model": embedding}
+    for scope, chain in (("hospital", global_hospital_qa_chain), ("pharmacy", global_pharmacy_qa_chain)):
+        report[f"{scope}_chain"] = {"state": "ok"} if chain else components.get(f"{scope}_chain", {"state": "pending"})
+    report["warmup"] = {name: step for name, step in components.items() if name.startswith("warmup_")}
+    ready = startup_state["phase"] == "ready" and report["mongo"]["state"] == "ok" and embedding["state"] == "ok"
+    body = {"ready": ready, "phase": startup_state["phase"], "components": report}
+    if startup_state["error"]:
+        body["error"] = startup_state["error"]
+    return JSONResponse(body, status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE)
+
 # ------------------------------------------------------------------
-# 4. RUN SERVER
+# 5. RUN SERVER
 # ------------------------------------------------------------------
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,127 @@
+"""
+Real-time-factor benchmark for the ASR backends over a directory of WAVs.
+
+Every backend transcribes every file from memory, the same way
+listen_to_voice() does. RTF = processing time / audio duration, so an RTF
+below 1 keeps up with speech. Local models are loaded once per backend, and
+their load time is reported separately. If `name.txt` sits next to
+`name.wav`, the word error rate against it is reported too.
+
+Backends: "groq" (hosted, GROQ_API_KEY) or "<engine>:<size>[:<compute_type>]"
+for local Whisper, e.g. openai:large-v3, faster:small:int8, faster:distil-large-v3:int8.
+Record samples with chatbot_rag.record_to_wav("samples/q1.wav").
+
+    python asr_benchmark.py samples/ --backends faster:small:int8 faster:large-v3:int8 openai:large-v3
+"""
+import argparse
+import gc
+import glob
+import os
+import re
+import time
+
+import numpy as np
+
+from chatbot_rag import ASR_LANGUAGE_HINT, LOCAL_WHISPER_THREADS, transcribe_with_groq_whisper
+from local_asr import LocalWhisper, WHISPER_SAMPLE_RATE, wav_bytes_to_array
+
+
+def load_samples(directory):
+    samples = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.wav"))):
+        with open(path, "rb") as f:
+            wav_bytes = f.read()
+        reference_path = os.path.splitext(path)[0] + ".txt"
+        reference = None
+        if os.path.exists(reference_path):
+            with open(reference_path, encoding="utf-8") as f:
+                reference = f.read()
+        duration = len(wav_bytes_to_array(wav_bytes)) / WHISPER_SAMPLE_RATE
+        samples.append((os.path.basename(path), wav_bytes, duration, reference))
+    return samples
+
+
+def words(text):
+    return re.findall(r"\w+", (text or "").lower())
+
+
+def word_errors(reference, hypothesis):
+    """Word-level Levenshtein distance (substitutions + insertions + deletions)."""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1]
+
+
+def make_backend(spec, threads, language):
+    """(transcribe(wav_bytes) -> (text, lang), load seconds, model object or None)"""
+    if spec == "groq":
+        return (lambda wav: transcribe_with_groq_whisper(wav, language_hint=language)), 0.0, None
+    engine, size, *rest = spec.split(":")
+    started = time.perf_counter()
+    model = LocalWhisper(size, engine=engine, compute_type=rest[0] if rest else "int8", threads=threads)
+    load_sec = time.perf_counter() - started
+    return (lambda wav: model.transcribe(wav, language=language)), load_sec, model
+
+
+def run_backend(spec, samples, args):
+    try:
+        transcribe, load_sec, model = make_backend(spec, args.threads, args.language)
+    except Exception as e:
+        print(f"\n[{spec}] [FAIL] could not load: {e}")
+        return
+    label = model.describe() if model else spec
+    print(f"\n[{label}] load {load_sec:.1f}s")
+    if samples and model is not None:
+        transcribe(samples[0][1])  # untimed warmup, as the CLI does at startup
+
+    rtfs, audio_sec, busy_sec, errors, reference_words = [], 0.0, 0.0, 0, 0
+    for name, wav_bytes, duration, reference in samples:
+        started = time.perf_counter()
+        text, lang = transcribe(wav_bytes)
+        elapsed = time.perf_counter() - started
+        audio_sec += duration
+        busy_sec += elapsed
+        rtfs.append(elapsed / duration if duration else 0.0)
+        wer_note = ""
+        if reference is not None:
+            ref_words = words(reference)
+            file_errors = word_errors(ref_words, words(text))
+            errors += file_errors
+            reference_words += len(ref_words)
+            wer_note = f" wer={file_errors / max(1, len(ref_words)):.2f}"
+        print(f"  {name:<28} {duration:6.1f}s audio  {elapsed:6.2f}s  rtf={rtfs[-1]:.3f}{wer_note}  [{lang}]"
+              + (f"  {text[:60]!r}" if args.show_text else ""))
+
+    if rtfs:
+        summary = (f"  total: {audio_sec:.1f}s audio in {busy_sec:.1f}s -> rtf={busy_sec / audio_sec:.3f} "
+                   f"(per file p50={np.percentile(rtfs, 50):.3f} p95={np.percentile(rtfs, 95):.3f})")
+        if reference_words:
+            summary += f", WER={errors / reference_words:.3f}"
+        print(summary)
+    del transcribe, model
+    gc.collect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", help="directory of .wav files (optional .txt references)")
+    parser.add_argument("--backends", nargs="+", default=["faster:small:int8", "openai:large-v3"])
+    parser.add_argument("--threads", type=int, default=LOCAL_WHISPER_THREADS, help="CPU threads, 0 = library default")
+    parser.add_argument("--language", default=ASR_LANGUAGE_HINT, help="language hint; default auto-detect")
+    parser.add_argument("--show-text", action="store_true")
+    args = parser.parse_args()
+
+    samples = load_samples(args.directory)
+    if not samples:
+        raise SystemExit(f"No .wav files in {args.directory}")
+    print(f"[ASR BENCH] {len(samples)} files, {sum(s[2] for s in samples):.1f}s of audio")
+    for spec in args.backends:
+        run_backend(spec, samples, args)
+
+
+if __name__ == "__main__":
+    main()
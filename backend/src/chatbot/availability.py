@@ -0,0 +1,241 @@
+"""
+Per-doctor availability calendar for the booking flow.
+
+A day is a 24-bit int, one bit per hourly slot (bit 9 = 09:00). Each doctor
+has a template mask from their shift on record, and each (doctor, day) has a
+booked mask built from active appointments and unexpired holds. A slot is
+free when it is in the template and not booked, and (for today) not already
+past.
+
+Booked masks for the next `horizon_days` days come from one indexed query per
+doctor (doctor_name + appointment_date + status), kept for `max_age_sec`, and
+updated in place when this process books or cancels. So "next N free slots"
+is a scan over ints with no further round trips.
+"""
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+
+ACTIVE_STATUSES = ["scheduled", "confirmed"]
+# Slot picked but not confirmed yet; counts as booked until hold_expires_at
+HELD_STATUS = "held"
+
+
+def utc_now():
+    """Naive UTC, as pymongo reads datetimes back; hold_expires_at must be UTC for its TTL index."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+# Standard clinic hours, used when a doctor has no parseable shift on record
+DEFAULT_SLOT_HOURS = (9, 10, 11, 14, 15, 16, 17)
+SHIFT_FIELDS = ['shift', 'working_hours', 'schedule', 'timing']
+NAMED_SHIFTS = {"morning": (9, 13), "afternoon": (13, 17), "evening": (17, 21), "night": (21, 24)}
+
+
+def hours_to_mask(hours):
+    mask = 0
+    for hour in hours:
+        if 0 <= hour < 24:
+            mask |= 1 << hour
+    return mask
+
+
+def mask_to_hours(mask):
+    return [hour for hour in range(24) if mask >> hour & 1]
+
+
+def slot_label(hour):
+    return f"{hour:02d}:00"
+
+
+def slot_hour(time_str):
+    """Hour of a "HH:MM" string; slots are hourly, so 10:30 falls in the 10:00 slot."""
+    try:
+        return int(str(time_str).split(":")[0])
+    except (TypeError, ValueError):
+        return None
+
+
+def as_date(day):
+    if isinstance(day, datetime):
+        return day.date()
+    if isinstance(day, date):
+        return day
+    return datetime.strptime(str(day), "%Y-%m-%d").date()
+
+
+def parse_clock_hour(value, period=None):
+    hour = int(value)
+    if period == "pm" and hour < 12:
+        hour += 12
+    elif period == "am" and hour == 12:
+        hour = 0
+    return hour
+
+
+def shift_range(shift):
+    """(start hour, end hour) from {"start": 9, "end": 17}, "9 AM - 5 PM", "09:00-17:00"
+    or "Morning"; None if it can't be read."""
+    if isinstance(shift, dict):
+        try:
+            return parse_clock_hour(str(shift["start"]).split(":")[0]), parse_clock_hour(str(shift["end"]).split(":")[0])
+        except (KeyError, TypeError, ValueError):
+            return None
+    text = str(shift or "").lower()
+    times = re.findall(r"(\d{1,2})(?::\d{2})?\s*(am|pm)?", text)
+    if len(times) >= 2:
+        (start, start_period), (end, end_period) = times[0], times[1]
+        # "2-5 pm" shares the end's period; in "9-5 pm" the start is morning
+        if not start_period and int(start) < int(end):
+            start_period = end_period
+        start_hour, end_hour = parse_clock_hour(start, start_period), parse_clock_hour(end, end_period)
+        if not (start_period or end_period) and end_hour <= start_hour < 12:
+            end_hour += 12  # "10-2" means 10:00-14:00; "22-6" stays an overnight shift
+        return start_hour, end_hour
+    for name, hours in NAMED_SHIFTS.items():
+        if name in text:
+            return hours
+    return None
+
+
+def shift_mask(doctor_doc):
+    """Bookable hours for a doctor on any day, as a mask."""
+    if doctor_doc.get("isAvailable", True) is False or doctor_doc.get("isActive", True) is False:
+        return 0
+    shift = next((doctor_doc[f] for f in SHIFT_FIELDS if doctor_doc.get(f)), None)
+    hours = shift_range(shift) if shift else None
+    if hours:
+        start, end = hours
+        # Overnight shifts (22-6) wrap past midnight
+        mask = hours_to_mask(range(start, end)) if start < end else hours_to_mask(list(range(start, 24)) + list(range(0, end)))
+    else:
+        mask = hours_to_mask(DEFAULT_SLOT_HOURS)
+    # Slots the doctor has switched off (doctorSchema `bookings`: [{time: 9, isAvailable: false}])
+    for booking in doctor_doc.get("bookings") or []:
+        if isinstance(booking, dict) and booking.get("isAvailable") is False and booking.get("time") is not None:
+            mask &= ~hours_to_mask([int(booking["time"])])
+    return mask
+
+
+class AvailabilityCalendar:
+    def __init__(self, appointments_collection, name_fields, horizon_days=30, max_age_sec=60.0):
+        self.collection = appointments_collection
+        self.name_fields = name_fields
+        self.horizon_days = horizon_days
+        self.max_age_sec = max_age_sec
+        self._lock = threading.Lock()
+        self._booked = {}  # doctor name -> (loaded_at, first day, {date: booked mask})
+        self.loads = 0
+        self.hits = 0
+
+    def ensure_indexes(self):
+        self.collection.create_index(
+            [("doctor_name", 1), ("appointment_date", 1), ("status", 1)], name="doctor_date_status"
+        )
+
+    def doctor_name(self, doctor_doc):
+        return next((str(doctor_doc[f]) for f in self.name_fields if doctor_doc.get(f)), "N/A")
+
+    # --- booked masks ---------------------------------------------------------
+    def _query_booked(self, doctor_name, first_day, last_day):
+        booked = {}
+        cursor = self.collection.find(
+            {
+                "doctor_name": doctor_name,
+                "appointment_date": {"$gte": first_day.isoformat(), "$lte": last_day.isoformat()},
+                "status": {"$in": ACTIVE_STATUSES + [HELD_STATUS]},
+            },
+            {"_id": 0, "appointment_date": 1, "appointment_time": 1, "status": 1, "hold_expires_at": 1},
+        )
+        now = utc_now()
+        for apt in cursor:
+            if apt.get("status") == HELD_STATUS and (apt.get("hold_expires_at") or now) <= now:
+                continue  # lapsed hold (see slot_reservation.py)
+            hour = slot_hour(apt.get("appointment_time"))
+            if hour is not None:
+                day = as_date(apt["appointment_date"])
+                booked[day] = booked.get(day, 0) | hours_to_mask([hour])
+        return booked
+
+    def _booked_window(self, doctor_name):
+        today = date.today()
+        with self._lock:
+            entry = self._booked.get(doctor_name)
+            if entry and entry[1] == today and time.monotonic() - entry[0] < self.max_age_sec:
+                self.hits += 1
+                return entry
+        booked = self._query_booked(doctor_name, today, today + timedelta(days=self.horizon_days))
+        entry = (time.monotonic(), today, booked)
+        with self._lock:
+            self._booked[doctor_name] = entry
+            self.loads += 1
+        return entry
+
+    def booked_mask(self, doctor_name, day):
+        day = as_date(day)
+        _, first_day, booked = self._booked_window(doctor_name)
+        if first_day <= day <= first_day + timedelta(days=self.horizon_days):
+            return booked.get(day, 0)
+        return self._query_booked(doctor_name, day, day).get(day, 0)
+
+    def mark_booked(self, doctor_name, day, time_str):
+        self._update(doctor_name, as_date(day), slot_hour(time_str), booked=True)
+
+    def mark_released(self, doctor_name, day, time_str):
+        self._update(doctor_name, as_date(day), slot_hour(time_str), booked=False)
+
+    def _update(self, doctor_name, day, hour, booked):
+        if hour is None:
+            return
+        with self._lock:
+            entry = self._booked.get(doctor_name)
+            if not entry:
+                return
+            masks = entry[2]
+            bit = hours_to_mask([hour])
+            masks[day] = masks.get(day, 0) | bit if booked else masks.get(day, 0) & ~bit
+
+    def invalidate(self, doctor_name=None):
+        with self._lock:
+            if doctor_name is None:
+                self._booked.clear()
+            else:
+                self._booked.pop(doctor_name, None)
+
+    # --- queries ---------------------------------------------------------------
+    def free_mask(self, doctor_doc, day, template=None):
+        day = as_date(day)
+        today = date.today()
+        if day < today:
+            return 0
+        mask = (shift_mask(doctor_doc) if template is None else template) & ~self.booked_mask(self.doctor_name(doctor_doc), day)
+        if day == today:
+            mask &= ~hours_to_mask(range(0, datetime.now().hour + 1))
+        return mask
+
+    def free_slots(self, doctor_doc, day):
+        """["09:00", ...] still free for the doctor on that day."""
+        return [slot_label(hour) for hour in mask_to_hours(self.free_mask(doctor_doc, day))]
+
+    def is_free(self, doctor_doc, day, time_str):
+        hour = slot_hour(time_str)
+        return hour is not None and bool(self.free_mask(doctor_doc, day) >> hour & 1)
+
+    def next_free_slots(self, doctor_doc, start_day=None, n=5, max_days=None):
+        """Up to n (date, "HH:00") pairs, earliest first, from start_day onwards."""
+        template = shift_mask(doctor_doc)
+        if not template:
+            return []
+        day = max(as_date(start_day or date.today()), date.today())
+        found = []
+        for _ in range(max_days or self.horizon_days):
+            for hour in mask_to_hours(self.free_mask(doctor_doc, day, template)):
+                found.append((day, slot_label(hour)))
+                if len(found) >= n:
+                    return found
+            day += timedelta(days=1)
+        return found
+
+    def stats(self):
+        with self._lock:
+            return {"doctors_cached": len(self._booked), "loads": self.loads, "hits": self.hits}
@@ -1,20 +1,23 @@
 import os
 import re
-import certifi
+import sys
+import hashlib
+import time
 import tempfile
-import speech_recognition as sr
-from pymongo import MongoClient
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
 from bson.dbref import DBRef
 from bson import ObjectId
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_mongodb import MongoDBAtlasVectorSearch
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferWindowMemory
-from langchain.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from dotenv import load_dotenv
+from resources import ResourceContainer, LazyDatabase, resolve
+from vector_codec import encode_vector, EMBEDDING_STORAGE_FORMATS
+from doctor_index import DoctorNameIndex
+from fast_paths import name_key
+from availability import AvailabilityCalendar, ACTIVE_STATUSES
+from slot_reservation import SlotReservations
 
 load_dotenv()
 
@@ -33,6 +36,12 @@ ASR_BACKEND = os.getenv("ASR_BACKEND", "groq_whisper")  # "groq_whisper" or "loc
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GROQ_ASR_MODEL = os.getenv("GROQ_ASR_MODEL", "whisper-large-v3-turbo")
 ASR_LANGUAGE_HINT = os.getenv("ASR_LANGUAGE_HINT", None)  # e.g., "ta", "te", or None for auto
+# Local Whisper is loaded once and kept resident (see local_asr.py). Engine "openai" (openai-whisper)
+# or "faster" (faster-whisper; e.g. LOCAL_WHISPER_MODEL=small with compute type int8 on CPU)
+LOCAL_WHISPER_ENGINE = os.getenv("LOCAL_WHISPER_ENGINE", "openai")
+LOCAL_WHISPER_MODEL = os.getenv("LOCAL_WHISPER_MODEL", "large-v3")
+LOCAL_WHISPER_COMPUTE_TYPE = os.getenv("LOCAL_WHISPER_COMPUTE_TYPE", "int8")  # faster engine only
+LOCAL_WHISPER_THREADS = int(os.getenv("LOCAL_WHISPER_THREADS", "0"))  # 0 = library default
 
 # TTS (output) via ElevenLabs
 TTS_BACKEND = "elevenlabs"
@@ -43,25 +52,155 @@ ELEVENLABS_MODEL_ID = os.getenv("ELEVENLABS_MODEL_ID", "eleven_multilingual_v2")
 AUDIO_SAMPLE_RATE = 16000
 AUDIO_CHANNELS = 1
 
-client = MongoClient(MONGO_URI, tlsCAFile=certifi.where())
-embedding_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+# Embedding ingestion: docs per embed_documents() call / per Mongo cursor batch
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_CURSOR_BATCH_SIZE = int(os.getenv("EMBED_CURSOR_BATCH_SIZE", "500"))
+
+# Max seconds to wait for each chain when hospital + pharmacy run side by side
+RAG_BRANCH_TIMEOUT_SEC = float(os.getenv("RAG_BRANCH_TIMEOUT_SEC", "20"))
+
+# Embedding backend: "torch" (sentence-transformers) or "onnx" (int8 ONNX Runtime export, see onnx_embeddings.py)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx_minilm"))
+ONNX_MODEL_FILE = os.getenv("ONNX_MODEL_FILE", "model_int8.onnx")
+# CPU threads for the embedding forward pass; 0 leaves the library default (all cores)
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+
+# Query embeddings: "direct" (call the model), "batched" (in-process micro-batching) or
+# "socket" (one shared embedding_service.py process for all workers, see embedding_service.py)
+EMBEDDING_SERVICE = os.getenv("EMBEDDING_SERVICE", "direct")
+EMBEDDING_SOCKET = os.getenv("EMBEDDING_SOCKET", "/tmp/chatbot-embeddings.sock")
+# Micro-batch flush: this many queued queries, or the oldest has waited this long
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "32"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+
+# Query-side embedding cache limits (entries / megabytes of float32 vectors)
+QUERY_EMBED_CACHE_ENTRIES = int(os.getenv("QUERY_EMBED_CACHE_ENTRIES", "2048"))
+QUERY_EMBED_CACHE_MB = float(os.getenv("QUERY_EMBED_CACHE_MB", "16"))
+
+# Retrieval backend: "atlas" ($vectorSearch) or "local" (in-process NumPy index)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "atlas")
+# "hybrid" fuses a BM25 index over name/generic/specialty fields with the vector ranking; "vector" is vector-only
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+RETRIEVAL_K = 3
+# Only rank in-stock, unexpired medicines. Needs the `filters` fields written by the
+# pharmacy ingest (either mode; for atlas also filter paths in the vector index); off by default
+PHARMACY_PREFILTER = os.getenv("PHARMACY_PREFILTER", "0") == "1"
+# Rebuild the in-memory doctor name index after this many seconds even without change events
+DOCTOR_INDEX_MAX_AGE_SEC = float(os.getenv("DOCTOR_INDEX_MAX_AGE_SEC", "300"))
+# Booking calendar: days of appointments cached per doctor, cache lifetime, alternatives offered
+AVAILABILITY_HORIZON_DAYS = int(os.getenv("AVAILABILITY_HORIZON_DAYS", "30"))
+AVAILABILITY_MAX_AGE_SEC = float(os.getenv("AVAILABILITY_MAX_AGE_SEC", "60"))
+ALTERNATIVE_SLOT_COUNT = int(os.getenv("ALTERNATIVE_SLOT_COUNT", "5"))
+# How long a picked time stays reserved while the patient confirms
+SLOT_HOLD_SEC = int(os.getenv("SLOT_HOLD_SEC", "300"))
+VECTOR_REFRESH_SEC = float(os.getenv("VECTOR_REFRESH_SEC", "60"))  # local backend only; 0 disables
+LEXICAL_REFRESH_SEC = float(os.getenv("LEXICAL_REFRESH_SEC", "60"))  # hybrid BM25 postings; 0 disables
+# Hybrid: re-read the top-k text from Mongo per query (one extra round trip) instead of the in-memory copies
+HYBRID_FETCH_CURRENT = os.getenv("HYBRID_FETCH_CURRENT", "0") == "1"
+# Memory-mappable embedding snapshots written by the ingest ("" disables)
+VECTOR_SNAPSHOT_DIR = os.getenv("VECTOR_SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "vector_snapshots"))
+VECTOR_SNAPSHOT_DTYPE = os.getenv("VECTOR_SNAPSHOT_DTYPE", "float32")  # "float32" or "float16"
+
+# How `embeddings` is stored in Mongo: "float" (array, needed by Atlas $vectorSearch),
+# or quantized BSON binary "float16" / "int8" (only readable with VECTOR_BACKEND=local)
+EMBEDDING_STORAGE = os.getenv("EMBEDDING_STORAGE", "float")
+if EMBEDDING_STORAGE not in EMBEDDING_STORAGE_FORMATS:
+    print(f"[WARN] Unknown EMBEDDING_STORAGE '{EMBEDDING_STORAGE}', using 'float'.")
+    EMBEDDING_STORAGE = "float"
+if EMBEDDING_STORAGE != "float" and VECTOR_BACKEND != "local":
+    print(f"[WARN] EMBEDDING_STORAGE={EMBEDDING_STORAGE} cannot be indexed by Atlas $vectorSearch; set VECTOR_BACKEND=local.")
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Heavy resources are built on first use (or by resources.init() at startup),
+# so importing this module connects to nothing and loads no model.
+def build_mongo_client():
+    import certifi
+    from pymongo import MongoClient
+    return MongoClient(MONGO_URI, tlsCAFile=certifi.where())
+
+def build_embedding_model(backend=None, threads=None):
+    """EMBEDDING_BACKEND model; "onnx" falls back to PyTorch if its export is missing.
+    Both produce the same (normalized MiniLM) vectors, so stored embeddings stay valid."""
+    backend = backend or EMBEDDING_BACKEND
+    threads = EMBEDDING_THREADS if threads is None else threads
+    if backend == "onnx":
+        try:
+            from onnx_embeddings import OnnxEmbeddings
+            return OnnxEmbeddings(ONNX_MODEL_DIR, model_file=ONNX_MODEL_FILE, threads=threads or None)
+        except Exception as e:
+            print(f"[WARN] ONNX embedding backend unavailable ({e}); using the PyTorch model.")
+    elif backend != "torch":
+        print(f"[WARN] Unknown EMBEDDING_BACKEND '{backend}', using 'torch'.")
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+
+def build_query_embedding_model():
+    """Retrieval goes through this so repeated questions skip the forward pass;
+    misses go to the model directly or through the EMBEDDING_SERVICE batcher."""
+    from embedding_cache import CachedQueryEmbeddings
+    if EMBEDDING_SERVICE == "socket":
+        from embedding_service import UnixSocketEmbeddings
+        base = UnixSocketEmbeddings(EMBEDDING_SOCKET)  # this worker never loads the model
+    elif EMBEDDING_SERVICE == "batched":
+        from embedding_service import MicroBatchingEmbeddings
+        base = MicroBatchingEmbeddings(resources.get("embedding_model"), max_batch=EMBED_MAX_BATCH, max_wait_ms=EMBED_MAX_WAIT_MS)
+    else:
+        if EMBEDDING_SERVICE != "direct":
+            print(f"[WARN] Unknown EMBEDDING_SERVICE '{EMBEDDING_SERVICE}', using 'direct'.")
+        base = resources.get("embedding_model")
+    return CachedQueryEmbeddings(
+        base,
+        max_entries=QUERY_EMBED_CACHE_ENTRIES,
+        max_bytes=int(QUERY_EMBED_CACHE_MB * 1024 * 1024),
+    )
+
+def build_local_whisper():
+    from local_asr import LocalWhisper
+    return LocalWhisper(LOCAL_WHISPER_MODEL, engine=LOCAL_WHISPER_ENGINE,
+                        compute_type=LOCAL_WHISPER_COMPUTE_TYPE, threads=LOCAL_WHISPER_THREADS)
+
+resources = ResourceContainer()
+resources.register("mongo_client", build_mongo_client)
+resources.register("embedding_model", build_embedding_model)
+resources.register("query_embedding_model", build_query_embedding_model)
+resources.register("local_whisper", build_local_whisper)
+
+client = resources.handle("mongo_client")
+embedding_model = resources.handle("embedding_model")
+query_embedding_model = resources.handle("query_embedding_model")
 
 # ------------------------------------------------------------------
 # 2. DATABASE / COLLECTION REFERENCES
 # ------------------------------------------------------------------
-hospital_db = client["rag_db"]
+hospital_db = LazyDatabase(client, "rag_db")
 hospital_collection = hospital_db["documents"]
 appointments_collection = hospital_db["appointments"]  # Using existing appointments collection
+# Free/booked hourly slots per doctor and day (see availability.py)
+availability_calendar = AvailabilityCalendar(
+    appointments_collection,
+    name_fields=['doctor_name', 'name', 'full_name'],
+    horizon_days=AVAILABILITY_HORIZON_DAYS,
+    max_age_sec=AVAILABILITY_MAX_AGE_SEC,
+)
+# Unique-index guarded holds and bookings (see slot_reservation.py)
+slot_reservations = SlotReservations(appointments_collection, hold_sec=SLOT_HOLD_SEC)
 
-pharma_db = client["test"]
+pharma_db = LazyDatabase(client, "test")
 medicines_collection = pharma_db["medicines"]
 pharmacies_collection = pharma_db["pharmacies"]
 
 # ------------------------------------------------------------------
 # 3. MEMORY SETUP
 # ------------------------------------------------------------------
-hospital_memory = ConversationBufferWindowMemory(k=10, memory_key="chat_history", output_key="answer", return_messages=True)
-pharmacy_memory = ConversationBufferWindowMemory(k=10, memory_key="chat_history", output_key="answer", return_messages=True)
+def new_chat_memory():
+    """Windowed chat memory in the shape the RAG chains expect."""
+    from langchain.memory import ConversationBufferWindowMemory
+    return ConversationBufferWindowMemory(k=10, memory_key="chat_history", output_key="answer", return_messages=True)
 
 # ------------------------------------------------------------------
 # 4. DBREF RESOLUTION & UTILITIES
@@ -104,78 +243,96 @@ def get_safe_field_value(doc, possible_names, default="N/A"):
 # ------------------------------------------------------------------
 # 5. EMBEDDING CREATION
 # ------------------------------------------------------------------
-def create_hospital_embeddings():
-    # EMOJI REMOVED
-    print("\n[HOSPITAL] DATASET: creating/updating embeddings...")
-    sample_doc = inspect_document_structure(hospital_collection, "hospital/documents")
-    if not sample_doc:
-        return
-    docs = list(hospital_collection.find())
-    print(f"[HOSPITAL] Processing {len(docs)} hospital documents for embeddings...")
-    for doc in docs:
-        doctor_name = get_safe_field_value(doc, ['doctor_name', 'doctorName', 'name', 'fullName', 'full_name'])
-        specialty = get_safe_field_value(doc, ['speciality', 'specialty', 'specialization', 'department'])
-        phone = get_safe_field_value(doc, ['phone', 'phoneNumber', 'phone_number', 'contact', 'mobile'])
-        shift = get_safe_field_value(doc, ['shift', 'working_hours', 'schedule', 'timing'])
-        hospital_name = get_safe_field_value(doc, ['hospital_name', 'hospitalName', 'hospital', 'clinic'])
-        hospital_address = get_safe_field_value(doc, ['hospital_address', 'hospitalAddress', 'address', 'location'])
-        is_available = doc.get("isAvailable", True)
-        text_content = f"""Doctor: {doctor_name}
+DOCTOR_NAME_FIELDS = ['doctor_name', 'doctorName', 'name', 'fullName', 'full_name']
+SPECIALTY_FIELDS = ['speciality', 'specialty', 'specialization', 'department']
+MEDICINE_NAME_FIELDS = ['name', 'medicine_name', 'medicineName', 'drug_name']
+GENERIC_NAME_FIELDS = ['genericName', 'generic_name', 'generic', 'composition']
+
+def render_hospital_text(doc):
+    """Build the text blob that gets embedded for a hospital/doctor document."""
+    doctor_name = get_safe_field_value(doc, DOCTOR_NAME_FIELDS)
+    specialty = get_safe_field_value(doc, SPECIALTY_FIELDS)
+    phone = get_safe_field_value(doc, ['phone', 'phoneNumber', 'phone_number', 'contact', 'mobile'])
+    shift = get_safe_field_value(doc, ['shift', 'working_hours', 'schedule', 'timing'])
+    hospital_name = get_safe_field_value(doc, ['hospital_name', 'hospitalName', 'hospital', 'clinic'])
+    hospital_address = get_safe_field_value(doc, ['hospital_address', 'hospitalAddress', 'address', 'location'])
+    is_available = doc.get("isAvailable", True)
+    return f"""Doctor: {doctor_name}
 Speciality: {specialty}
 Phone: {phone}
 Shift: {shift}
 Hospital: {hospital_name}
 Address: {hospital_address}
 Available: {is_available}"""
+
+def pharmacy_ref_key(ref):
+    """(database, collection, _id) key for a medicine's pharmacy reference."""
+    if isinstance(ref, DBRef):
+        return (ref.database or pharma_db.name, ref.collection, ref.id)
+    return (pharma_db.name, pharmacies_collection.name, ref)
+
+def build_pharmacy_lookup(query=None):
+    """Prefetch every pharmacy referenced by a medicine in one query per target
+    collection, so rendering medicines needs no per-document round trips."""
+    refs_by_target = {}
+    for ref in medicines_collection.distinct("pharmacy", query or {}):
+        if ref is None:
+            continue
+        database_name, collection_name, ref_id = pharmacy_ref_key(ref)
+        refs_by_target.setdefault((database_name, collection_name), []).append(ref_id)
+    lookup = {}
+    for (database_name, collection_name), ids in refs_by_target.items():
         try:
-            embedding = embedding_model.embed_query(text_content)
+            for pharmacy_doc in client[database_name][collection_name].find({"_id": {"$in": ids}}):
+                lookup[(database_name, collection_name, pharmacy_doc["_id"])] = pharmacy_doc
         except Exception as e:
-            print(f"  [WARN] Embedding failed for {doctor_name}: {e}")
-            embedding = []
-        hospital_collection.update_one(
-            {"_id": doc["_id"]},
-            {"$set": {"text": text_content, "embeddings": embedding}}
-        )
-        print(f"  [OK] Updated embeddings for: {doctor_name}")
-    print("[HOSPITAL] embeddings updated.")
+            print(f"Warning: Could not prefetch pharmacies from {database_name}.{collection_name}: {e}")
+    print(f"[PHARMACY] Prefetched {len(lookup)} pharmacies in {len(refs_by_target) + 1} queries")
+    return lookup
 
-def create_pharmacy_embeddings():
-    # EMOJI REMOVED
-    print("\n[PHARMACY] DATASET: creating/updating embeddings...")
-    sample_doc = inspect_document_structure(medicines_collection, "medicines")
-    if not sample_doc:
-        return
-    docs = list(medicines_collection.find())
-    print(f"[PHARMACY] Processing {len(docs)} medicine documents for embeddings...")
-    for doc in docs:
-        medicine_name = get_safe_field_value(doc, ['name', 'medicine_name', 'medicineName', 'drug_name'])
-        generic_name = get_safe_field_value(doc, ['genericName', 'generic_name', 'generic', 'composition'])
-        description = get_safe_field_value(doc, ['description', 'details', 'info', 'about'])
-        dosage_form = get_safe_field_value(doc, ['dosageForm', 'dosage_form', 'form', 'type'])
-        manufacturer = get_safe_field_value(doc, ['manufacturer', 'company', 'brand', 'mfg'])
-        quantity = get_safe_field_value(doc, ['quantity', 'qty', 'stock', 'available'])
-        expiry_date = get_safe_field_value(doc, ['expiryDate', 'expiry_date', 'expiry', 'exp_date'])
-        prescription_required = get_safe_field_value(doc, ['prescriptionRequired', 'prescription_required', 'prescription'])
-        pharmacy_text = ""
-        if 'pharmacy' in doc and isinstance(doc['pharmacy'], DBRef):
+def render_pharmacy_block(doc, pharmacy_lookup=None):
+    """Resolve the pharmacy referenced by a medicine and render its text lines.
+
+    pharmacy_lookup is the map from build_pharmacy_lookup(); without it the
+    pharmacy is fetched from Mongo for this one document."""
+    if 'pharmacy' in doc and isinstance(doc['pharmacy'], DBRef):
+        if pharmacy_lookup is not None:
+            pharmacy_doc = pharmacy_lookup.get(pharmacy_ref_key(doc['pharmacy']))
+        else:
             pharmacy_doc = resolve_dbref(client, doc['pharmacy'])
+        if pharmacy_doc:
+            pharmacy_name = get_safe_field_value(pharmacy_doc, ['name', 'pharmacy_name', 'pharmacyName'])
+            contact_number = get_safe_field_value(pharmacy_doc, ['contactNumber', 'contact_number', 'phone', 'mobile'])
+            address = get_safe_field_value(pharmacy_doc, ['address', 'location', 'addr'])
+            return f"Pharmacy: {pharmacy_name}\nContact: {contact_number}\nAddress: {address}"
+    elif 'pharmacy' in doc:
+        try:
+            pharmacy_id = doc['pharmacy']
+            if pharmacy_lookup is not None:
+                pharmacy_doc = pharmacy_lookup.get(pharmacy_ref_key(pharmacy_id))
+            else:
+                pharmacy_doc = pharmacies_collection.find_one({"_id": pharmacy_id})
             if pharmacy_doc:
                 pharmacy_name = get_safe_field_value(pharmacy_doc, ['name', 'pharmacy_name', 'pharmacyName'])
-                contact_number = get_safe_field_value(pharmacy_doc, ['contactNumber', 'contact_number', 'phone', 'mobile'])
-                address = get_safe_field_value(pharmacy_doc, ['address', 'location', 'addr'])
-                pharmacy_text = f"Pharmacy: {pharmacy_name}\nContact: {contact_number}\nAddress: {address}"
-        elif 'pharmacy' in doc:
-            try:
-                pharmacy_id = doc['pharmacy']
-                pharmacy_doc = pharmacies_collection.find_one({"_id": pharmacy_id})
-                if pharmacy_doc:
-                    pharmacy_name = get_safe_field_value(pharmacy_doc, ['name', 'pharmacy_name', 'pharmacyName'])
-                    contact_number = get_safe_field_value(pharmacy_doc, ['contactNumber', 'phone'])
-                    address = get_safe_field_value(pharmacy_doc, ['address', 'location'])
-                    pharmacy_text = f"Pharmacy: {pharmacy_name}\nContact: {contact_number}\nAddress: {address}"
-            except Exception:
-                pharmacy_text = ""
-        text_content = f"""Medicine: {medicine_name}
+                contact_number = get_safe_field_value(pharmacy_doc, ['contactNumber', 'phone'])
+                address = get_safe_field_value(pharmacy_doc, ['address', 'location'])
+                return f"Pharmacy: {pharmacy_name}\nContact: {contact_number}\nAddress: {address}"
+        except Exception:
+            return ""
+    return ""
+
+def render_medicine_text(doc, pharmacy_lookup=None):
+    """Build the text blob that gets embedded for a medicine document."""
+    medicine_name = get_safe_field_value(doc, MEDICINE_NAME_FIELDS)
+    generic_name = get_safe_field_value(doc, GENERIC_NAME_FIELDS)
+    description = get_safe_field_value(doc, ['description', 'details', 'info', 'about'])
+    dosage_form = get_safe_field_value(doc, ['dosageForm', 'dosage_form', 'form', 'type'])
+    manufacturer = get_safe_field_value(doc, ['manufacturer', 'company', 'brand', 'mfg'])
+    quantity = get_safe_field_value(doc, ['quantity', 'qty', 'stock', 'available'])
+    expiry_date = get_safe_field_value(doc, ['expiryDate', 'expiry_date', 'expiry', 'exp_date'])
+    prescription_required = get_safe_field_value(doc, ['prescriptionRequired', 'prescription_required', 'prescription'])
+    pharmacy_text = render_pharmacy_block(doc, pharmacy_lookup)
+    return f"""Medicine: {medicine_name}
 Generic Name: {generic_name}
 Description: {description}
 Dosage Form: {dosage_form}
@@ -184,17 +341,243 @@ Quantity: {quantity}
 Expiry Date: {expiry_date}
 Prescription Required: {prescription_required}
 {pharmacy_text}"""
+
+# Typed copies of the stock/expiry/prescription/pharmacy values, stored under
+# `filters` so retrieval can pre-filter instead of relying on the LLM to read
+# them out of the text. For Atlas these paths must be declared as "filter"
+# fields in medicine_vector_index:
+#   {"type": "filter", "path": "filters.in_stock"}, {"type": "filter", "path": "filters.expiry"},
+#   {"type": "filter", "path": "filters.prescription_required"}, {"type": "filter", "path": "filters.pharmacy_id"}
+# Unknown expiry is stored as NO_EXPIRY so "not expired" filters keep the item.
+NO_EXPIRY = datetime(9999, 12, 31)
+
+def parse_quantity(value):
+    try:
+        return int(float(str(value).strip()))
+    except (TypeError, ValueError):
+        return None
+
+def parse_expiry(value):
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    if value in (None, "N/A", ""):
+        return NO_EXPIRY
+    try:
+        import dateutil.parser
+        return dateutil.parser.parse(str(value)).replace(tzinfo=None)
+    except Exception:
+        return NO_EXPIRY
+
+def parse_flag(value):
+    if isinstance(value, bool):
+        return value
+    if str(value).strip().lower() in ("true", "yes", "y", "1"):
+        return True
+    if str(value).strip().lower() in ("false", "no", "n", "0"):
+        return False
+    return None
+
+def medicine_filter_fields(doc):
+    """{"filters": {...}} for a medicine document (see NO_EXPIRY note above)."""
+    quantity = parse_quantity(get_safe_field_value(doc, ['quantity', 'qty', 'stock', 'available'], default=None))
+    pharmacy_ref = doc.get('pharmacy')
+    return {"filters": {
+        "quantity": quantity,
+        # Unknown quantity stays searchable; the text still shows it to the LLM
+        "in_stock": quantity is None or quantity > 0,
+        "expiry": parse_expiry(get_safe_field_value(doc, ['expiryDate', 'expiry_date', 'expiry', 'exp_date'], default=None)),
+        "prescription_required": parse_flag(get_safe_field_value(doc, ['prescriptionRequired', 'prescription_required', 'prescription'], default=None)),
+        "pharmacy_id": pharmacy_ref_key(pharmacy_ref)[2] if pharmacy_ref is not None else None,
+        # Normalized names for the indexed exact/prefix lookups in fast_paths.py
+        "name_key": name_key(get_safe_field_value(doc, MEDICINE_NAME_FIELDS, default="")),
+        "generic_key": name_key(get_safe_field_value(doc, GENERIC_NAME_FIELDS, default="")),
+    }}
+
+def sellable_medicine_filter():
+    """Pre-filter for in-stock, unexpired medicines, evaluated at query time."""
+    today = datetime.combine(date.today(), datetime.min.time())
+    return {"filters.in_stock": True, "filters.expiry": {"$gte": today}}
+
+def pharmacy_prefilter_supported(collection, index_name):
+    """False if the medicines have no `filters` yet, or the Atlas index lacks the
+    filter paths; either would make the pre-filter match nothing or fail."""
+    if collection.find_one({"filters.in_stock": {"$exists": True}}, {"_id": 1}) is None:
+        print(f"[WARN] PHARMACY_PREFILTER ignored: no {collection.name} document has `filters` "
+              "(run the ingest first)")
+        return False
+    if VECTOR_BACKEND != "local":
+        try:
+            definitions = [index.get("latestDefinition", {}) for index in resolve(collection).list_search_indexes(index_name)]
+        except Exception:
+            return True  # listing needs a recent server; let $vectorSearch report it
+        paths = {field.get("path") for d in definitions for field in d.get("fields", []) if field.get("type") == "filter"}
+        missing = {"filters.in_stock", "filters.expiry"} - paths
+        if definitions and missing:
+            print(f"[WARN] PHARMACY_PREFILTER ignored: {index_name} has no filter path for {sorted(missing)}")
+            return False
+    return True
+
+def embed_texts_batched(texts, labels, tag):
+    """Embed a batch in one forward pass; fall back per-text if the batch fails."""
+    try:
+        return embedding_model.embed_documents(texts)
+    except Exception as e:
+        print(f"  [WARN] {tag} batch embedding failed ({e}); retrying one by one...")
+    embeddings = []
+    for text, label in zip(texts, labels):
         try:
-            embedding = embedding_model.embed_query(text_content)
+            embeddings.append(embedding_model.embed_query(text))
         except Exception as e:
-            print(f"  [WARN] Embedding failed for {medicine_name}: {e}")
-            embedding = []
-        medicines_collection.update_one(
-            {"_id": doc["_id"]},
-            {"$set": {"text": text_content, "embeddings": embedding}}
-        )
-        print(f"  [OK] Updated embeddings for: {medicine_name}")
+            print(f"  [WARN] Embedding failed for {label}: {e}")
+            embeddings.append([])
+    return embeddings
+
+def text_content_hash(text):
+    """Hash of the rendered text; stored next to the embedding to detect edits."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def run_embedding_pipeline(collection, render_fn, label_fields, tag, batch_size=None, changed_only=False, query=None,
+                           extra_fields_fn=None):
+    """Stream a collection in cursor batches, embed with embed_documents() and
+    write back with unordered bulk_write. Returns a stats dict.
+
+    With changed_only=True, documents whose stored text_hash, embedding_model
+    and embedding_storage match the freshly rendered text are skipped. query
+    restricts the run to a subset of the collection. extra_fields_fn(doc)
+    returns additional fields to $set alongside the embedding; if only those
+    differ, they are $set without re-embedding."""
+    query = query or {}
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    stats = {"docs": 0, "skipped": 0, "fields_updated": 0, "batches": 0, "written": 0, "batch_latencies": []}
+    started = time.perf_counter()
+
+    missing_ids = set()
+    if changed_only:
+        missing_ids = set(collection.distinct("_id", {"$and": [query, {"$or": [
+            {"embeddings": {"$exists": False}},
+            {"embeddings": {"$size": 0}},
+        ]}]}))
+
+    def flush(batch):
+        batch_started = time.perf_counter()
+        texts = [text for _, text, _, _ in batch]
+        labels = [get_safe_field_value(doc, label_fields) for doc, _, _, _ in batch]
+        embeddings = embed_texts_batched(texts, labels, tag)
+        ops = [
+            UpdateOne({"_id": doc["_id"]}, {"$set": {
+                "text": text,
+                "text_hash": text_hash if embedding else None,
+                "embedding_model": EMBEDDING_MODEL_NAME,
+                "embedding_storage": EMBEDDING_STORAGE,
+                "embeddings": encode_vector(embedding, EMBEDDING_STORAGE),
+                **extra_fields,
+            }})
+            for (doc, text, text_hash, extra_fields), embedding in zip(batch, embeddings)
+        ]
+        result = collection.bulk_write(ops, ordered=False)
+        stats["written"] += result.modified_count + result.upserted_count
+        stats["docs"] += len(batch)
+        stats["batches"] += 1
+        stats["batch_latencies"].append(time.perf_counter() - batch_started)
+        print(f"  [OK] {tag} batch {stats['batches']}: {len(batch)} docs ({stats['docs']} total)")
+
+    def flush_fields(field_ops):
+        result = collection.bulk_write(field_ops, ordered=False)
+        stats["written"] += result.modified_count
+        stats["fields_updated"] += len(field_ops)
+
+    batch, field_ops = [], []
+    # The stored vectors are never needed here, so don't pull them over the wire
+    for doc in collection.find(query, {"embeddings": 0}, batch_size=EMBED_CURSOR_BATCH_SIZE):
+        text = render_fn(doc)
+        text_hash = text_content_hash(text)
+        extra_fields = extra_fields_fn(doc) if extra_fields_fn else {}
+        if (changed_only
+                and doc["_id"] not in missing_ids
+                and doc.get("text_hash") == text_hash
+                and doc.get("embedding_model") == EMBEDDING_MODEL_NAME
+                and doc.get("embedding_storage", "float") == EMBEDDING_STORAGE):
+            stale = {key: value for key, value in extra_fields.items() if doc.get(key) != value}
+            if not stale:
+                stats["skipped"] += 1
+                continue
+            # Same text and vector, only filter fields moved (stock, expiry): no forward pass
+            field_ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": stale}))
+            if len(field_ops) >= EMBED_CURSOR_BATCH_SIZE:
+                flush_fields(field_ops)
+                field_ops = []
+            continue
+        batch.append((doc, text, text_hash, extra_fields))
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    if field_ops:
+        flush_fields(field_ops)
+
+    stats["elapsed"] = time.perf_counter() - started
+    print_embedding_report(tag, stats)
+    return stats
+
+def print_embedding_report(tag, stats):
+    latencies = sorted(stats["batch_latencies"])
+    elapsed = stats.get("elapsed", 0.0)
+    rate = stats["docs"] / elapsed if elapsed > 0 else 0.0
+    print(f"[{tag}] Throughput report:")
+    print(f" - Docs embedded: {stats['docs']} in {stats['batches']} batches ({stats['written']} modified)")
+    print(f" - Docs skipped (unchanged): {stats['skipped']}")
+    if stats.get("fields_updated"):
+        print(f" - Docs with only filter fields updated (not re-embedded): {stats['fields_updated']}")
+    print(f" - Elapsed: {elapsed:.2f}s ({rate:.1f} docs/sec)")
+    if latencies:
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        avg = sum(latencies) / len(latencies)
+        print(f" - Batch latency: avg {avg * 1000:.0f}ms, p95 {p95 * 1000:.0f}ms, max {latencies[-1] * 1000:.0f}ms")
+
+def export_vector_snapshot(collection):
+    """Write the collection's vectors to VECTOR_SNAPSHOT_DIR for fast, shared cold starts."""
+    if not VECTOR_SNAPSHOT_DIR:
+        return
+    try:
+        from local_vector_store import write_snapshot
+        write_snapshot(collection, VECTOR_SNAPSHOT_DIR, EMBEDDING_MODEL_NAME, dtype=VECTOR_SNAPSHOT_DTYPE)
+    except Exception as e:
+        print(f"[WARN] Could not write vector snapshot for {collection.name}: {e}")
+
+def create_hospital_embeddings(batch_size=None, changed_only=False):
+    # EMOJI REMOVED
+    print("\n[HOSPITAL] DATASET: creating/updating embeddings...")
+    sample_doc = inspect_document_structure(hospital_collection, "hospital/documents")
+    if not sample_doc:
+        return
+    print(f"[HOSPITAL] Processing hospital documents in batches of {batch_size or EMBED_BATCH_SIZE}...")
+    stats = run_embedding_pipeline(
+        hospital_collection, render_hospital_text, DOCTOR_NAME_FIELDS,
+        "HOSPITAL", batch_size=batch_size, changed_only=changed_only,
+    )
+    print("[HOSPITAL] embeddings updated.")
+    export_vector_snapshot(hospital_collection)
+    return stats
+
+def create_pharmacy_embeddings(batch_size=None, changed_only=False):
+    # EMOJI REMOVED
+    print("\n[PHARMACY] DATASET: creating/updating embeddings...")
+    sample_doc = inspect_document_structure(medicines_collection, "medicines")
+    if not sample_doc:
+        return
+    pharmacy_lookup = build_pharmacy_lookup()
+    print(f"[PHARMACY] Processing medicine documents in batches of {batch_size or EMBED_BATCH_SIZE}...")
+    stats = run_embedding_pipeline(
+        medicines_collection, lambda doc: render_medicine_text(doc, pharmacy_lookup),
+        MEDICINE_NAME_FIELDS, "PHARMACY", batch_size=batch_size, changed_only=changed_only,
+        extra_fields_fn=medicine_filter_fields,
+    )
     print("[PHARMACY] Medicine embeddings updated.")
+    export_vector_snapshot(medicines_collection)
+    return stats
 
 # ------------------------------------------------------------------
 # 6. ENHANCED BOOKING SYSTEM USING EXISTING APPOINTMENTS COLLECTION
@@ -203,6 +586,7 @@ class PatientBookingSystem:
     def __init__(self):
         self.booking_data = {}
         self.current_booking_step = 0
+        self.slot_taken = False
         self.booking_steps = [
             'doctor_selection',
             'patient_name', 
@@ -216,9 +600,67 @@ class PatientBookingSystem:
     
     def reset_booking(self):
         """Reset booking session"""
+        self.release_hold()
         self.booking_data = {}
         self.current_booking_step = 0
     
+    def release_hold(self):
+        """Give back a slot this session is holding but hasn't confirmed."""
+        hold_id = self.booking_data.pop('hold_id', None)
+        if not hold_id:
+            return
+        try:
+            if slot_reservations.release(hold_id):
+                doctor_name = get_safe_field_value(self.booking_data['doctor'], ['doctor_name', 'name', 'full_name'])
+                availability_calendar.mark_released(doctor_name, self.booking_data['appointment_date'], self.booking_data['appointment_time'])
+        except Exception as e:
+            print(f"[DB WARN] Could not release hold {hold_id}: {e}")
+    
+    def slot_unavailable_reply(self, selected_time, target_date):
+        """Offer the remaining slots that day, or step back to the date if it is full."""
+        doctor = self.booking_data['doctor']
+        free_slots = availability_calendar.free_slots(doctor, target_date)
+        if free_slots:
+            slots_text = "\n".join([f"- {slot}" for slot in free_slots])
+            return f"Sorry, {selected_time} is not available on {target_date.strftime('%B %d, %Y')}. Available time slots:\n\n{slots_text}\n\nWhich time would you prefer?"
+        self.current_booking_step = self.booking_steps.index('preferred_date')
+        alternatives = availability_calendar.next_free_slots(doctor, target_date + timedelta(days=1), n=ALTERNATIVE_SLOT_COUNT)
+        return f"Sorry, {target_date.strftime('%B %d, %Y')} is now fully booked. The next available slots are:\n\n{format_slot_options(alternatives)}\n\nWhich date would you prefer?"
+    
+    def to_state(self):
+        """Compact, BSON/JSON-friendly snapshot of the booking progress.
+        The doctor is stored by _id only and reloaded in from_state()."""
+        data = {}
+        for key, value in self.booking_data.items():
+            if key == 'doctor':
+                data['doctor_id'] = value.get('_id')
+            elif isinstance(value, date):
+                data[key] = value.isoformat()
+            else:
+                data[key] = value
+        return {"step": self.current_booking_step, "data": data}
+    
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild a booking system from to_state() output."""
+        booking = cls()
+        if not state:
+            return booking
+        booking.current_booking_step = state.get("step", 0)
+        for key, value in (state.get("data") or {}).items():
+            if key == 'doctor_id':
+                doctor_doc = hospital_collection.find_one({"_id": value}, {"embeddings": 0})
+                if not doctor_doc:
+                    # Doctor was removed mid-booking: start over rather than crash later
+                    booking.reset_booking()
+                    return booking
+                booking.booking_data['doctor'] = doctor_doc
+            elif key == 'appointment_date':
+                booking.booking_data[key] = date.fromisoformat(value)
+            else:
+                booking.booking_data[key] = value
+        return booking
+    
     def collect_booking_details(self, user_input, detected_lang=None):
         """Conversational booking flow using existing appointments collection"""
         
@@ -278,6 +720,9 @@ class PatientBookingSystem:
         # Find doctor in hospital collection
         doctor_doc = find_doctor_doc_by_name(doctor_name)
         if not doctor_doc:
+            suggestions = suggest_doctor_names(doctor_name)
+            if suggestions:
+                return f"I couldn't find a doctor named '{doctor_name}'. Did you mean: {', '.join(suggestions)}?"
             return f"I couldn't find a doctor named '{doctor_name}' in our system. Could you please check the spelling or try a different doctor's name?"
         
         # Simple availability check (only checking existence in DB)
@@ -349,25 +794,16 @@ class PatientBookingSystem:
         if not target_date:
             return "I couldn't understand that date. Please try saying 'tomorrow', 'next Monday', or a specific date like 'September 25th'."
         
-        # Check availability for that doctor on the requested date
-        doctor_name = get_safe_field_value(self.booking_data['doctor'], ['doctor_name', 'name', 'full_name'])
-        
-        existing_appointments = list(appointments_collection.find({
-            "doctor_name": doctor_name,
-            "appointment_date": target_date.strftime("%Y-%m-%d"),
-            "status": {"$in": ["scheduled", "confirmed"]}
-        }))
-        
-        # Generate available time slots (excluding booked ones)
-        all_slots = ["09:00", "10:00", "11:00", "14:00", "15:00", "16:00", "17:00"]
-        booked_times = [apt.get("appointment_time", "").split(":")[0] + ":00" 
-                        for apt in existing_appointments if apt.get("appointment_time")]
-        
-        available_slots = [slot for slot in all_slots if slot not in booked_times]
+        # Check availability for that doctor on the requested date (shift minus booked slots)
+        doctor = self.booking_data['doctor']
+        doctor_name = get_safe_field_value(doctor, ['doctor_name', 'name', 'full_name'])
+        available_slots = availability_calendar.free_slots(doctor, target_date)
         
         if not available_slots:
-            next_date = target_date + timedelta(days=1)
-            return f"Sorry, {doctor_name} has no available slots on {target_date.strftime('%B %d, %Y')}. Would you like to try {next_date.strftime('%B %d, %Y')} instead?"
+            alternatives = availability_calendar.next_free_slots(doctor, target_date + timedelta(days=1), n=ALTERNATIVE_SLOT_COUNT)
+            if not alternatives:
+                return f"Sorry, {doctor_name} has no available slots on {target_date.strftime('%B %d, %Y')} or in the following {AVAILABILITY_HORIZON_DAYS} days. Please try another doctor or a later date."
+            return f"Sorry, {doctor_name} has no available slots on {target_date.strftime('%B %d, %Y')}. The next available slots are:\n\n{format_slot_options(alternatives)}\n\nWhich date would you prefer?"
         
         self.booking_data['appointment_date'] = target_date
         slots_text = "\n".join([f"- {slot}" for slot in available_slots])
@@ -409,6 +845,29 @@ class PatientBookingSystem:
         if not selected_time:
             return "Please specify a time like '10:00 AM', '2:30 PM', or just '10' for 10 AM."
         
+        doctor = self.booking_data['doctor']
+        target_date = self.booking_data['appointment_date']
+        doctor_name = get_safe_field_value(doctor, ['doctor_name', 'name', 'full_name'])
+        self.release_hold()  # picking again replaces any earlier hold
+        if not availability_calendar.is_free(doctor, target_date, selected_time):
+            return self.slot_unavailable_reply(selected_time, target_date)
+        
+        # Reserve the slot now so nobody else can take it while the patient confirms
+        for attempt in range(3):
+            hold_id = str(uuid.uuid4())[:8].upper()
+            try:
+                held = slot_reservations.hold(hold_id, doctor_name, target_date, selected_time, extra={"doctor_id": doctor.get('_id')})
+                break
+            except DuplicateKeyError:
+                # Short ids can collide with an existing appointment; draw another one
+                if attempt == 2:
+                    raise
+        if not held:
+            availability_calendar.invalidate(doctor_name)
+            return self.slot_unavailable_reply(selected_time, target_date)
+        availability_calendar.mark_booked(doctor_name, target_date, selected_time)
+        self.booking_data['hold_id'] = hold_id
+        
         self.booking_data['appointment_time'] = selected_time
         self.current_booking_step += 1
         
@@ -439,6 +898,7 @@ Type 'YES' to confirm or 'NO' to cancel.
         
         if response in ['yes', 'y', 'confirm', 'ok']:
             # Create appointment in existing collection
+            self.slot_taken = False
             appointment_id = self.create_appointment_record()
             
             if appointment_id:
@@ -463,6 +923,10 @@ Thank you for choosing our healthcare services!
                 
                 self.reset_booking()
                 return confirmation_msg.strip()
+            elif self.slot_taken:
+                # Our hold lapsed and someone else booked the slot meanwhile
+                self.current_booking_step = self.booking_steps.index('time_selection')
+                return self.slot_unavailable_reply(self.booking_data['appointment_time'], self.booking_data['appointment_date'])
             else:
                 return "[FAIL] Sorry, there was an error creating your appointment. Please try again or contact our support team."
         
@@ -514,7 +978,8 @@ Thank you for choosing our healthcare services!
         """Create appointment record in existing appointments collection"""
         try:
             doctor = self.booking_data['doctor']
-            appointment_id = str(uuid.uuid4())[:8].upper()
+            # The hold placed at time selection becomes the appointment
+            appointment_id = self.booking_data.get('hold_id') or str(uuid.uuid4())[:8].upper()
             
             # Create appointment record matching your existing structure
             appointment_record = {
@@ -535,30 +1000,57 @@ Thank you for choosing our healthcare services!
                 "updated_at": datetime.now()
             }
             
-            # Insert into existing appointments collection
-            result = appointments_collection.insert_one(appointment_record)
-            
-            if result.inserted_id:
+            # Confirm the hold (or reserve the slot outright) in one atomic write
+            if slot_reservations.confirm(appointment_id, appointment_record):
+                self.booking_data.pop('hold_id', None)
+                availability_calendar.mark_booked(appointment_record['doctor_name'], appointment_record['appointment_date'], appointment_record['appointment_time'])
                 print(f"[DB OK] Appointment created with ID: {appointment_id}")
                 return appointment_id
             else:
-                print("[DB FAIL] Failed to create appointment")
+                self.booking_data.pop('hold_id', None)
+                self.slot_taken = True
+                availability_calendar.invalidate(appointment_record['doctor_name'])
+                print(f"[DB FAIL] Slot already taken for appointment {appointment_id}")
                 return None
                 
         except Exception as e:
             print(f"[DB FAIL] Error creating appointment: {e}")
             return None
 
+def format_slot_options(slots):
+    """Bullet list of (date, "HH:00") alternatives."""
+    return "\n".join(f"- {day.strftime('%A, %B %d')} at {slot}" for day, slot in slots)
+
 # Initialize booking system
 booking_system = PatientBookingSystem() 
 
 # ------------------------------------------------------------------
 # 7. DOCTOR LOOKUP FUNCTIONS
 # ------------------------------------------------------------------
+# Built lazily on first lookup (api.py warms it at startup); refreshed on hospital
+# changes by the sync watcher and whenever it is older than DOCTOR_INDEX_MAX_AGE_SEC
+doctor_name_index = DoctorNameIndex(hospital_collection, DOCTOR_NAME_FIELDS, max_age_sec=DOCTOR_INDEX_MAX_AGE_SEC)
+
 def find_doctor_doc_by_name(name):
+    """Exact, prefix, then fuzzy match against the in-memory name index."""
     if not name:
         return None
-    fields = ['doctor_name', 'doctorName', 'name', 'fullName', 'full_name']
+    doc, _ = doctor_name_index.lookup(name)
+    if doc:
+        return doc
+    if doctor_name_index.ready:
+        # The doctor may have been added since the last build; rebuilds are rate-limited
+        if doctor_name_index.refresh_on_miss():
+            doc, _ = doctor_name_index.lookup(name)
+        return doc
+    # Index could not be built (e.g. Mongo hiccup at startup): query directly
+    return find_doctor_doc_in_mongo(name)
+
+def suggest_doctor_names(name, n=3):
+    return doctor_name_index.suggest(name, n)
+
+def find_doctor_doc_in_mongo(name):
+    fields = DOCTOR_NAME_FIELDS
     for f in fields:
         # Exact match attempt
         doc = hospital_collection.find_one({f: name})
@@ -602,13 +1094,36 @@ def handle_booking_conversation(user_query, detected_lang=None):
 # ------------------------------------------------------------------
 # 8. APPOINTMENT MANAGEMENT FUNCTIONS
 # ------------------------------------------------------------------
+# Only what the status messages show
+APPOINTMENT_STATUS_PROJECTION = {
+    "_id": 0, "appointment_id": 1, "doctor_name": 1, "appointment_date": 1, "appointment_time": 1, "status": 1,
+}
+
+def ensure_appointment_indexes():
+    """Create the indexes behind the status lookups, the slot calendar and
+    slot reservation. Idempotent; run at API startup."""
+    bootstrap = [
+        ("phone_status_datetime", lambda: appointments_collection.create_index(
+            [("patient_phone", 1), ("status", 1), ("appointment_datetime", 1)], name="phone_status_datetime")),
+        ("appointment_id_unique", lambda: appointments_collection.create_index(
+            "appointment_id", name="appointment_id_unique", unique=True)),
+        ("doctor_date_status", availability_calendar.ensure_indexes),
+        ("unique_active_slot", slot_reservations.ensure_indexes),
+    ]
+    for name, create in bootstrap:
+        try:
+            create()
+            print(f"[INDEX OK] appointments.{name}")
+        except Exception as e:
+            print(f"[INDEX FAIL] appointments.{name}: {e}")
+
 def get_patient_appointments(patient_phone):
     """Retrieve appointments for a patient"""
     try:
         appointments = list(appointments_collection.find({
             "patient_phone": patient_phone,
-            "status": {"$in": ["scheduled", "confirmed"]}
-        }).sort("appointment_datetime", 1))
+            "status": {"$in": ACTIVE_STATUSES}
+        }, APPOINTMENT_STATUS_PROJECTION).sort("appointment_datetime", 1))
         
         return appointments
     except Exception as e:
@@ -618,12 +1133,12 @@ def get_patient_appointments(patient_phone):
 def cancel_appointment(appointment_id):
     """Cancel an existing appointment"""
     try:
-        result = appointments_collection.update_one(
-            {"appointment_id": appointment_id},
-            {"$set": {"status": "cancelled", "updated_at": datetime.now()}}
-        )
-        
-        return result.modified_count > 0
+        # Only active or held appointments match, so cancelling twice reports failure
+        previous = slot_reservations.cancel(appointment_id)
+        if previous is None:
+            return False
+        availability_calendar.mark_released(previous.get("doctor_name"), previous.get("appointment_date"), previous.get("appointment_time"))
+        return True
     except Exception as e:
         print(f"[FAIL] Error cancelling appointment: {e}")
         return False
@@ -650,7 +1165,7 @@ def check_appointment_status(query):
     
     elif id_match:
         apt_id = id_match.group(1)
-        appointment = appointments_collection.find_one({"appointment_id": apt_id})
+        appointment = appointments_collection.find_one({"appointment_id": apt_id}, APPOINTMENT_STATUS_PROJECTION)
         if appointment:
             return f"Appointment {apt_id}: {appointment.get('doctor_name')} on {appointment.get('appointment_date')} at {appointment.get('appointment_time')} - Status: {appointment.get('status')}"
         else:
@@ -658,17 +1173,31 @@ def check_appointment_status(query):
     
     return "Please provide your phone number or appointment ID to check status."
 
+def get_appointment_statuses(appointment_ids):
+    """{appointment_id: status fields or None} for many IDs in one query."""
+    found = {
+        apt["appointment_id"]: apt
+        for apt in appointments_collection.find({"appointment_id": {"$in": list(appointment_ids)}}, APPOINTMENT_STATUS_PROJECTION)
+    }
+    return {apt_id: found.get(apt_id) for apt_id in appointment_ids}
+
 # ------------------------------------------------------------------
 # 9. SPEECH: ASR (Whisper) + TTS (ElevenLabs)
 # ------------------------------------------------------------------
-def record_to_wav(tmp_path=None, sample_rate=AUDIO_SAMPLE_RATE):
+def record_audio(sample_rate=AUDIO_SAMPLE_RATE):
+    """One utterance from the microphone as in-memory 16-bit mono WAV bytes."""
+    import speech_recognition as sr
     recognizer = sr.Recognizer()
     mic = sr.Microphone(sample_rate=sample_rate)
     print("Listening... (speak now)")
     with mic as source:
         recognizer.adjust_for_ambient_noise(source, duration=0.8)
         audio = recognizer.listen(source)
-    wav_bytes = audio.get_wav_data(convert_rate=sample_rate, convert_width=2)
+    return audio.get_wav_data(convert_rate=sample_rate, convert_width=2)
+
+def record_to_wav(tmp_path=None, sample_rate=AUDIO_SAMPLE_RATE):
+    """Record an utterance to a WAV file (e.g. to collect samples for asr_benchmark.py)."""
+    wav_bytes = record_audio(sample_rate)
     if not tmp_path:
         tmp_fd, tmp_path = tempfile.mkstemp(suffix=".wav")
         os.close(tmp_fd)
@@ -676,15 +1205,23 @@ def record_to_wav(tmp_path=None, sample_rate=AUDIO_SAMPLE_RATE):
         f.write(wav_bytes)
     return tmp_path
 
-def transcribe_with_groq_whisper(wav_path, model=GROQ_ASR_MODEL, language_hint=ASR_LANGUAGE_HINT):
+def read_audio(audio):
+    """WAV bytes as given, or read from a file path."""
+    if isinstance(audio, (bytes, bytearray)):
+        return bytes(audio)
+    with open(audio, "rb") as f:
+        return f.read()
+
+def transcribe_with_groq_whisper(audio, model=GROQ_ASR_MODEL, language_hint=ASR_LANGUAGE_HINT):
+    """audio: WAV bytes (or a path to a WAV file)."""
     import requests
     url = "https://api.groq.com/openai/v1/audio/transcriptions"
     headers = {"Authorization": f"Bearer {GROQ_API_KEY}"}
     data = {"model": model}
     if language_hint:
         data["language"] = language_hint
-    files = {"file": (os.path.basename(wav_path), open(wav_path, "rb"), "audio/wav")}
     try:
+        files = {"file": ("speech.wav", read_audio(audio), "audio/wav")}
         resp = requests.post(url, headers=headers, data=data, files=files, timeout=60)
         if resp.status_code == 200:
             out = resp.json()
@@ -698,14 +1235,10 @@ def transcribe_with_groq_whisper(wav_path, model=GROQ_ASR_MODEL, language_hint=A
         print(f"[ASR FAIL] Groq ASR exception: {e}")
         return "", None
 
-def transcribe_with_local_whisper(wav_path, language_hint=ASR_LANGUAGE_HINT):
+def transcribe_with_local_whisper(audio, language_hint=ASR_LANGUAGE_HINT):
+    """audio: WAV bytes (or a path). The model is loaded on first use and reused."""
     try:
-        import whisper
-        model = whisper.load_model("large-v3")
-        result = model.transcribe(wav_path, language=language_hint)
-        text = (result.get("text") or "").strip()
-        detected_lang = result.get("language")
-        return text, detected_lang
+        return resources.get("local_whisper").transcribe(read_audio(audio), language=language_hint)
     except Exception as e:
         print(f"[ASR FAIL] Local Whisper error: {e}")
         return "", None
@@ -743,11 +1276,11 @@ def speak_text(text, detected_lang=None):
         print("(TTS disabled or unsupported backend)")
 
 def listen_to_voice():
-    wav_path = record_to_wav()
+    wav_bytes = record_audio()
     if ASR_BACKEND == "groq_whisper":
-        text, detected_lang = transcribe_with_groq_whisper(wav_path)
+        text, detected_lang = transcribe_with_groq_whisper(wav_bytes)
     elif ASR_BACKEND == "local_whisper":
-        text, detected_lang = transcribe_with_local_whisper(wav_path)
+        text, detected_lang = transcribe_with_local_whisper(wav_bytes)
     else:
         print("WARN: No ASR backend configured")
         return "", None
@@ -759,20 +1292,77 @@ def listen_to_voice():
 # ------------------------------------------------------------------
 # 10. CONVERSATIONAL RAG SYSTEMS
 # ------------------------------------------------------------------
-def create_hospital_rag_system():
-    try:
-        vectorstore = MongoDBAtlasVectorSearch(
-            collection=hospital_collection,
-            embedding=embedding_model,
-            index_name="hospital_vector_index",
-            text_key="text",
-            embedding_key="embeddings",
+# Callbacks run with the scope ("hospital"/"pharmacy") when a periodic index
+# refresh sees changed documents; api.py drops cached answers this way when
+# EMBEDDING_SYNC is off
+data_change_callbacks = []
+
+def notify_data_change(collection):
+    namespace = (collection.database.name, collection.name)
+    if namespace == (hospital_collection.database.name, hospital_collection.name):
+        scope = "hospital"
+    elif namespace == (medicines_collection.database.name, medicines_collection.name):
+        scope = "pharmacy"
+    else:
+        return
+    for callback in data_change_callbacks:
+        try:
+            callback(scope)
+        except Exception as e:
+            print(f"[WARN] Data change callback failed: {e}")
+
+def create_vectorstore(collection, index_name):
+    """Vector store for a collection using the configured VECTOR_BACKEND."""
+    if VECTOR_BACKEND == "local":
+        from local_vector_store import LocalVectorStore
+        vectorstore = LocalVectorStore(
+            collection, resources.get("query_embedding_model"), text_key="text", embedding_key="embeddings",
+            snapshot_dir=VECTOR_SNAPSHOT_DIR or None, model_name=EMBEDDING_MODEL_NAME,
+        )
+        if VECTOR_REFRESH_SEC > 0:
+            vectorstore.start_auto_refresh(VECTOR_REFRESH_SEC, on_change=lambda: notify_data_change(collection))
+        return vectorstore
+    from langchain_mongodb import MongoDBAtlasVectorSearch
+    return MongoDBAtlasVectorSearch(
+        collection=resolve(collection),
+        embedding=resources.get("query_embedding_model"),
+        index_name=index_name,
+        text_key="text",
+        embedding_key="embeddings",
+    )
+
+def create_retriever(vectorstore, collection, lexical_field_groups, filter_fn=None):
+    """Retriever for a chain: vector-only, or hybrid BM25 + vector per RETRIEVAL_MODE.
+    filter_fn() returns a pre-filter applied to every query."""
+    if RETRIEVAL_MODE == "hybrid":
+        from hybrid_retriever import BM25Index, HybridRetriever
+        lexical_index = BM25Index(collection, lexical_field_groups)
+        if LEXICAL_REFRESH_SEC > 0:
+            lexical_index.start_auto_refresh(LEXICAL_REFRESH_SEC, on_change=lambda: notify_data_change(collection))
+        return HybridRetriever(
+            vectorstore=vectorstore,
+            lexical_index=lexical_index,
+            k=RETRIEVAL_K,
+            fetch_current=HYBRID_FETCH_CURRENT,
+            filter_fn=filter_fn,
         )
+    if filter_fn:
+        from hybrid_retriever import FilteredVectorRetriever
+        return FilteredVectorRetriever(vectorstore=vectorstore, k=RETRIEVAL_K, filter_fn=filter_fn)
+    return vectorstore.as_retriever(search_kwargs={"k": RETRIEVAL_K})
+
+def create_hospital_rag_system(memory=None):
+    """Without memory the chain is stateless and takes chat_history as input."""
+    try:
+        from langchain.chains import ConversationalRetrievalChain
+        from langchain.prompts import PromptTemplate
+        from langchain_openai import ChatOpenAI
+        vectorstore = create_vectorstore(hospital_collection, "hospital_vector_index")
         llm = ChatOpenAI(model="gpt-4o-mini", api_key=open_api)
         qa_chain = ConversationalRetrievalChain.from_llm(
             llm=llm,
-            retriever=vectorstore.as_retriever(search_kwargs={"k": 3}),
-            memory=hospital_memory,
+            retriever=create_retriever(vectorstore, hospital_collection, [DOCTOR_NAME_FIELDS, SPECIALTY_FIELDS]),
+            memory=memory,
             return_source_documents=True,
             verbose=False,
             combine_docs_chain_kwargs={
@@ -796,20 +1386,22 @@ Answer:""",
         print(f"[RAG FAIL] Hospital RAG creation failed: {e}")
         return None, None
 
-def create_pharmacy_rag_system():
+def create_pharmacy_rag_system(memory=None):
+    """Without memory the chain is stateless and takes chat_history as input."""
     try:
-        vectorstore = MongoDBAtlasVectorSearch(
-            collection=medicines_collection,
-            embedding=embedding_model,
-            index_name="medicine_vector_index",
-            text_key="text",
-            embedding_key="embeddings",
-        )
+        from langchain.chains import ConversationalRetrievalChain
+        from langchain.prompts import PromptTemplate
+        from langchain_openai import ChatOpenAI
+        vectorstore = create_vectorstore(medicines_collection, "medicine_vector_index")
         llm = ChatOpenAI(model="gpt-4o-mini", api_key=open_api)
         qa_chain = ConversationalRetrievalChain.from_llm(
             llm=llm,
-            retriever=vectorstore.as_retriever(search_kwargs={"k": 3}),
-            memory=pharmacy_memory,
+            retriever=create_retriever(
+                vectorstore, medicines_collection, [MEDICINE_NAME_FIELDS, GENERIC_NAME_FIELDS],
+                filter_fn=sellable_medicine_filter if PHARMACY_PREFILTER and pharmacy_prefilter_supported(
+                    medicines_collection, "medicine_vector_index") else None,
+            ),
+            memory=memory,
             return_source_documents=True,
             verbose=False,
             combine_docs_chain_kwargs={
@@ -831,6 +1423,28 @@ Answer:""",
         print(f"[RAG FAIL] Pharmacy RAG creation failed: {e}")
         return None, None
 
+# Shared pool for fanning out the two chains; a timed-out branch keeps its
+# worker until it finishes, so leave headroom beyond the 2 branches.
+branch_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="rag-branch")
+
+def invoke_chains_concurrently(chains, question, timeout=RAG_BRANCH_TIMEOUT_SEC):
+    """Invoke several chains in parallel. Returns {label: result or None}; a
+    branch that fails or exceeds the timeout yields None instead of blocking."""
+    futures = {label: branch_executor.submit(chain.invoke, {"question": question})
+               for label, chain in chains.items()}
+    deadline = time.monotonic() + timeout
+    results = {}
+    for label, future in futures.items():
+        try:
+            results[label] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            print(f"[RAG WARN] {label} chain timed out after {timeout:.0f}s; answering without it.")
+            results[label] = None
+        except Exception as e:
+            print(f"[RAG WARN] {label} chain failed: {e}")
+            results[label] = None
+    return results
+
 # ------------------------------------------------------------------
 # 11. DEBUG HELPERS
 # ------------------------------------------------------------------
@@ -886,12 +1500,16 @@ def main_system():
         print(f"[DB FAIL] MongoDB ping failed: {e}")
         return
 
-    hospital_qa, _ = create_hospital_rag_system()
-    pharmacy_qa, _ = create_pharmacy_rag_system()
+    hospital_qa, _ = create_hospital_rag_system(memory=new_chat_memory())
+    pharmacy_qa, _ = create_pharmacy_rag_system(memory=new_chat_memory())
     if not hospital_qa or not pharmacy_qa:
         print("[FATAL] Could not create RAG systems. Abort.")
         return
 
+    if ASR_BACKEND == "local_whisper":
+        # Load the model now rather than on the first spoken query
+        resources.init(["local_whisper"])
+
     print("\n[ASSISTANT] ready. Type or speak queries. Type 'exit' to quit.")
     print("Examples:")
     print(" - 'I need a cardiologist'")
@@ -972,12 +1590,13 @@ def main_system():
                 print(f"\n[HOSPITAL] Hospital Assistant: {answer}")
                 speak_text(answer, detected_lang=detected_lang_for_tts)
             else:
-                # Mixed/Ambiguous query
-                h_res = hospital_qa.invoke({"question": user_query})
-                p_res = pharmacy_qa.invoke({"question": user_query})
+                # Mixed/Ambiguous query: both chains run side by side
+                results = invoke_chains_concurrently({"hospital": hospital_qa, "pharmacy": pharmacy_qa}, user_query)
+                h_res, p_res = results["hospital"], results["pharmacy"]
                 
-                h_answer = h_res.get('answer', "I don't have information on that.")
-                p_answer = p_res.get('answer', "I don't have information on that.")
+                # A failed/timed-out branch counts as "I don't know" so the other answer is used alone
+                h_answer = h_res.get('answer', "I don't have information on that.") if h_res else "I don't know."
+                p_answer = p_res.get('answer', "I don't have information on that.") if p_res else "I don't know."
                 
                 print(f"\n[HOSPITAL] Hospital Info: {h_answer}")
                 print(f"\n[PHARMACY] Pharmacy Info: {p_answer}")
@@ -1007,6 +1626,12 @@ if __name__ == "__main__":
     check_vector_indexes()
     test_dbref_resolution()
     
+    # Non-interactive incremental refresh (e.g. nightly cron): only new/edited docs
+    if "--changed-only" in sys.argv:
+        create_hospital_embeddings(changed_only=True)
+        create_pharmacy_embeddings(changed_only=True)
+        sys.exit(0)
+
     # Optional: Skip heavy embedding operations if they're already done
     setup_choice = input("Run embedding setup (create/update embeddings)? (y/n, default n): ").strip().lower()
     if setup_choice == 'y':
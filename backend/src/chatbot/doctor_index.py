@@ -0,0 +1,232 @@
+"""
+In-memory doctor name index for the booking flow.
+
+Names are normalized (lowercased, honorifics like "Dr." dropped, split into
+tokens) and held in three structures built from one projected scan of the
+hospital collection:
+
+  exact    normalized full name -> doctor ids
+  tokens   sorted token vocabulary, so prefix lookups are a bisect
+  postings token -> doctor ids
+
+lookup() tries exact, then prefix ("manoj jo", "joshi"), then fuzzy
+(per-token edit distance, so "Manoj Joshy" still resolves), and
+suggest() ranks near misses for a "did you mean" reply. refresh() rebuilds
+everything and swaps it in atomically. It runs at startup, on hospital
+change notifications, and whenever the index is older than max_age_sec.
+"""
+import bisect
+import re
+import threading
+import time
+from collections import defaultdict
+
+HONORIFICS = {"dr", "doctor", "mr", "mrs", "ms", "miss", "prof", "professor", "sir"}
+
+# Excluded from the cached documents; the booking flow never reads them
+HEAVY_FIELDS = {"embeddings": 0, "text": 0, "text_hash": 0}
+
+
+def normalize_name_tokens(name):
+    return [t for t in re.findall(r"[a-z0-9]+", str(name or "").lower()) if t not in HONORIFICS]
+
+
+def allowed_edits(token):
+    """Typos tolerated per token: none for short tokens, more for longer ones."""
+    if len(token) <= 3:
+        return 0
+    return 1 if len(token) <= 6 else 2
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance, or limit + 1 as soon as it must exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class DoctorNameIndex:
+    def __init__(self, collection, name_fields, max_age_sec=300.0, miss_refresh_sec=30.0):
+        self.collection = collection
+        self.name_fields = name_fields
+        self.max_age_sec = max_age_sec
+        self.miss_refresh_sec = miss_refresh_sec
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        # (docs by id, display names, exact map, sorted vocabulary, postings, tokens per id), swapped atomically
+        self._state = None
+        self._built_at = 0.0
+        self._stale = False
+        self.counters = defaultdict(int)
+
+    # --- maintenance -----------------------------------------------------------
+    def refresh(self):
+        """Rebuild from the collection in one projected scan."""
+        started = time.perf_counter()
+        docs, names, exact, postings, doc_tokens = {}, {}, defaultdict(list), defaultdict(set), {}
+        for doc in self.collection.find({}, HEAVY_FIELDS):
+            name = next((doc[f] for f in self.name_fields if doc.get(f)), None)
+            tokens = normalize_name_tokens(name)
+            if not tokens:
+                continue
+            doc_id = doc["_id"]
+            docs[doc_id] = doc
+            names[doc_id] = str(name).strip()
+            doc_tokens[doc_id] = tokens
+            exact[" ".join(tokens)].append(doc_id)
+            for token in tokens:
+                postings[token].add(doc_id)
+        with self._lock:
+            self._state = (docs, names, dict(exact), sorted(postings), dict(postings), doc_tokens)
+            self._built_at = time.monotonic()
+        print(f"[DOCTOR INDEX] {len(docs)} doctors, {len(postings)} name tokens "
+              f"in {(time.perf_counter() - started) * 1000:.0f}ms")
+        return len(docs)
+
+    def _current(self):
+        stale = (self._state is None or self._stale
+                 or (self.max_age_sec and time.monotonic() - self._built_at > self.max_age_sec))
+        # Only one caller rebuilds a stale index; the rest keep using the old one meanwhile
+        if stale and self._refreshing.acquire(blocking=self._state is None):
+            try:
+                if self._state is None or self._stale or time.monotonic() - self._built_at > (self.max_age_sec or 0):
+                    self._stale = False
+                    self.refresh()
+            except Exception as e:
+                print(f"[DOCTOR INDEX WARN] Refresh failed: {e}")
+            finally:
+                self._refreshing.release()
+        return self._state
+
+    def mark_stale(self):
+        """Rebuild on the next lookup."""
+        self._stale = True
+
+    def refresh_on_miss(self):
+        """Rebuild now after a lookup miss (a doctor added since the last build),
+        at most once every miss_refresh_sec; True if the index was rebuilt."""
+        if self._state is None or time.monotonic() - self._built_at < self.miss_refresh_sec:
+            return False
+        built_at = self._built_at
+        self.mark_stale()
+        self._current()
+        rebuilt = self._built_at != built_at
+        if rebuilt:
+            self.counters["miss_refreshes"] += 1
+        return rebuilt
+
+    @property
+    def ready(self):
+        return bool(self._state and self._state[0])
+
+    # --- lookup ----------------------------------------------------------------
+    @staticmethod
+    def _prefix_ids(vocabulary, postings, token):
+        ids = set()
+        start = bisect.bisect_left(vocabulary, token)
+        for candidate in vocabulary[start:]:
+            if not candidate.startswith(token):
+                break
+            ids |= postings[candidate]
+        return ids
+
+    @staticmethod
+    def _fuzzy_costs(vocabulary, postings, token, limit):
+        """{doctor id: smallest edit distance from token to one of its name tokens}."""
+        costs = {}
+        for candidate in vocabulary:
+            distance = edit_distance(token, candidate, limit)
+            if distance <= limit:
+                for doc_id in postings[candidate]:
+                    costs[doc_id] = min(distance, costs.get(doc_id, distance))
+        return costs
+
+    def _best(self, ids, doc_tokens, query_tokens, costs=None):
+        """Lowest edit cost, then most whole-token hits, then fewest extra tokens."""
+        def rank(doc_id):
+            tokens = doc_tokens[doc_id]
+            whole = sum(1 for t in query_tokens if t in tokens)
+            return ((costs or {}).get(doc_id, 0), -whole, len(tokens) - len(query_tokens), str(doc_id))
+        return sorted(ids, key=rank)
+
+    def lookup(self, name):
+        """(doctor document, "exact" | "prefix" | "fuzzy"), or (None, None) on a miss."""
+        query_tokens = normalize_name_tokens(name)
+        state = self._current()
+        if not query_tokens or not state:
+            self.counters["miss"] += 1
+            return None, None
+        docs, _, exact, vocabulary, postings, doc_tokens = state
+
+        ids = exact.get(" ".join(query_tokens))
+        if ids:
+            self.counters["exact"] += 1
+            return docs[self._best(ids, doc_tokens, query_tokens)[0]], "exact"
+
+        ids = None
+        for token in query_tokens:
+            matches = self._prefix_ids(vocabulary, postings, token)
+            ids = matches if ids is None else ids & matches
+            if not ids:
+                break
+        if ids:
+            self.counters["prefix"] += 1
+            return docs[self._best(ids, doc_tokens, query_tokens)[0]], "prefix"
+
+        ids, total = None, defaultdict(int)
+        for token in query_tokens:
+            costs = self._fuzzy_costs(vocabulary, postings, token, allowed_edits(token))
+            ids = set(costs) if ids is None else ids & set(costs)
+            if not ids:
+                break
+            for doc_id, cost in costs.items():
+                total[doc_id] += cost
+        if ids:
+            self.counters["fuzzy"] += 1
+            return docs[self._best(ids, doc_tokens, query_tokens, total)[0]], "fuzzy"
+
+        self.counters["miss"] += 1
+        return None, None
+
+    def suggest(self, name, n=3):
+        """Up to n display names for a "did you mean" reply, closest first.
+        Each query token may be up to half its length away from some name token."""
+        query_tokens = normalize_name_tokens(name)
+        state = self._current()
+        if not query_tokens or not state:
+            return []
+        _, names, _, vocabulary, postings, doc_tokens = state
+        total, hits = defaultdict(int), defaultdict(int)
+        for token in query_tokens:
+            limit = max(1, len(token) // 2)
+            costs = self._fuzzy_costs(vocabulary, postings, token, limit)
+            for doc_id in self._prefix_ids(vocabulary, postings, token):
+                costs[doc_id] = 0
+            for doc_id, cost in costs.items():
+                total[doc_id] += cost
+                hits[doc_id] += 1
+        # Missing tokens count as a full miss, so matching more of the name ranks higher
+        ranked = sorted(total, key=lambda doc_id: (total[doc_id] + 10 * (len(query_tokens) - hits[doc_id]),
+                                                   len(doc_tokens[doc_id]), names[doc_id]))
+        return [names[doc_id] for doc_id in ranked[:n]]
+
+    def documents(self):
+        """All indexed doctor documents (heavy fields excluded)."""
+        state = self._current()
+        return list(state[0].values()) if state else []
+
+    def stats(self):
+        docs = self._state[0] if self._state else {}
+        return {
+            "doctors": len(docs),
+            "age_sec": round(time.monotonic() - self._built_at, 1) if self._state else None,
+            "lookups": dict(self.counters),
+        }
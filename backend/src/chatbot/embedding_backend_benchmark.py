@@ -0,0 +1,198 @@
+"""
+Export, equivalence check and benchmark for the embedding backends.
+
+  export  write the ONNX model + int8 copy to ONNX_MODEL_DIR (needs torch,
+          transformers and onnxruntime)
+  check   embed our corpus (the rendered `text` of hospital and medicine
+          documents) with both backends; fails if any cosine similarity is
+          below --threshold. Also reports recall@k when ONNX query vectors
+          are searched against PyTorch document vectors, which is what
+          happens when serving switches backend without re-embedding.
+  bench   per backend, in a fresh process: model load time, single-query
+          latency (p50/p95), batch throughput and resident memory
+
+    python embedding_backend_benchmark.py export
+    python embedding_backend_benchmark.py check --threshold 0.98
+    python embedding_backend_benchmark.py bench --threads 1 2 4
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from chatbot_rag import (
+    EMBEDDING_MODEL_NAME,
+    ONNX_MODEL_DIR,
+    build_embedding_model,
+    hospital_collection,
+    medicines_collection,
+)
+
+QUERIES = [
+    "I need a cardiologist", "paracetamol", "is insulin available", "doctor for skin allergy",
+    "cough syrup for children", "phone number of the neurologist", "मुझे बुखार की दवा चाहिए",
+]
+
+
+def load_corpus(args):
+    if args.texts_file:
+        with open(args.texts_file, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()][:args.limit]
+    texts = []
+    for collection in (hospital_collection, medicines_collection):
+        for doc in collection.find({"text": {"$exists": True, "$ne": ""}}, {"text": 1}).limit(args.limit):
+            texts.append(doc["text"])
+    return texts
+
+
+def rss_mb():
+    """(current, peak) resident memory of this process in MB."""
+    values = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    key, kb = line.split()[:2]
+                    values[key] = int(kb) / 1024
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+        return peak, peak
+    return values.get("VmRSS:", 0.0), values.get("VmHWM:", 0.0)
+
+
+def cmd_export(args):
+    from onnx_embeddings import export_onnx_model
+    export_onnx_model(EMBEDDING_MODEL_NAME, args.output_dir, quantize=not args.no_quantize)
+
+
+def cmd_check(args):
+    texts = load_corpus(args) + QUERIES
+    reference = build_embedding_model("torch", args.threads[0])
+    candidate = build_embedding_model("onnx", args.threads[0])
+    if type(candidate).__name__ != "OnnxEmbeddings":
+        sys.exit("[FAIL] ONNX backend could not be loaded; run `export` first.")
+
+    print(f"[CHECK] {len(texts)} texts, reference={type(reference).__name__}, candidate={candidate.model_path}")
+    ref = np.asarray(reference.embed_documents(texts), dtype=np.float64)
+    cand = np.asarray(candidate.embed_documents(texts), dtype=np.float64)
+    ref_unit = ref / np.linalg.norm(ref, axis=1, keepdims=True)
+    cand_unit = cand / np.linalg.norm(cand, axis=1, keepdims=True)
+    cosines = np.sum(ref_unit * cand_unit, axis=1)
+    worst = np.argsort(cosines)[:3]
+    print(f"  cosine: min={cosines.min():.5f} p1={np.percentile(cosines, 1):.5f} mean={cosines.mean():.5f}")
+    for i in worst:
+        print(f"    {cosines[i]:.5f}  {texts[i][:70]!r}")
+
+    # Queries embedded by the candidate, searched against reference document vectors
+    k = min(args.k, len(texts) - 1)
+    if k > 0:
+        scores_ref = ref_unit @ ref_unit.T
+        scores_mixed = cand_unit @ ref_unit.T
+        np.fill_diagonal(scores_ref, -np.inf)
+        np.fill_diagonal(scores_mixed, -np.inf)
+        truth = np.argsort(-scores_ref, axis=1)[:, :k]
+        found = np.argsort(-scores_mixed, axis=1)[:, :k]
+        recall = np.mean([len(set(t) & set(f)) / k for t, f in zip(truth, found)])
+        print(f"  recall@{k} (onnx queries vs stored torch vectors): {recall:.4f}")
+
+    if cosines.min() < args.threshold:
+        print(f"[FAIL] min cosine {cosines.min():.5f} < threshold {args.threshold}")
+        sys.exit(1)
+    print(f"[OK] every text within cosine {args.threshold} of the PyTorch model")
+
+
+def cmd_bench_one(args):
+    """Child process: measure one backend and print a JSON line."""
+    with open(args.corpus_file, encoding="utf-8") as f:
+        texts = json.load(f)
+    rss_before, _ = rss_mb()
+    started = time.perf_counter()
+    model = build_embedding_model(args.backend, args.threads[0])
+    load_sec = time.perf_counter() - started
+    model.embed_query("warmup")
+    rss_loaded, _ = rss_mb()
+
+    latencies = []
+    for i in range(args.queries):
+        started = time.perf_counter()
+        model.embed_query(QUERIES[i % len(QUERIES)] + f" {i}")  # defeat any caching
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+
+    started = time.perf_counter()
+    model.embed_documents(texts)
+    batch_sec = time.perf_counter() - started
+    rss_after, rss_peak = rss_mb()
+    print(json.dumps({
+        "backend": args.backend, "class": type(model).__name__, "threads": args.threads[0], "load_sec": load_sec,
+        "p50_ms": latencies[len(latencies) // 2] * 1000, "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+        "docs_per_sec": len(texts) / batch_sec if batch_sec else 0.0,
+        "model_rss_mb": rss_loaded - rss_before, "rss_mb": rss_after, "peak_rss_mb": rss_peak,
+    }))
+
+
+def cmd_bench(args):
+    texts = load_corpus(args) or QUERIES * 50
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf-8") as f:
+        json.dump(texts, f)
+        corpus_file = f.name
+    print(f"[BENCH] {len(texts)} documents, {args.queries} single queries per run")
+    print(f"  {'backend':<8} {'threads':>7} {'load s':>7} {'p50 ms':>7} {'p95 ms':>7} {'docs/s':>8} "
+          f"{'model MB':>9} {'RSS MB':>7} {'peak MB':>8}")
+    try:
+        for backend in args.backends:
+            for threads in args.threads:
+                proc = subprocess.run(
+                    [sys.executable, __file__, "bench-one", "--backend", backend, "--threads", str(threads),
+                     "--corpus-file", corpus_file, "--queries", str(args.queries)],
+                    capture_output=True, text=True,
+                )
+                lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+                if proc.returncode != 0 or not lines:
+                    print(f"  {backend:<8} {threads:>7} [FAIL] {proc.stderr.strip().splitlines()[-1:]}")
+                    continue
+                r = json.loads(lines[-1])
+                label = "onnx!" if backend == "onnx" and r["class"] != "OnnxEmbeddings" else backend
+                print(f"  {label:<8} {threads or 'all':>7} {r['load_sec']:>7.2f} {r['p50_ms']:>7.2f} {r['p95_ms']:>7.2f} "
+                      f"{r['docs_per_sec']:>8.1f} {r['model_rss_mb']:>9.0f} {r['rss_mb']:>7.0f} {r['peak_rss_mb']:>8.0f}")
+    finally:
+        os.unlink(corpus_file)
+    print("  ('onnx!' = the ONNX model failed to load and the PyTorch fallback was measured)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export")
+    export.add_argument("--output-dir", default=ONNX_MODEL_DIR)
+    export.add_argument("--no-quantize", action="store_true", help="only write the fp32 model")
+
+    for name in ("check", "bench", "bench-one"):
+        p = sub.add_parser(name)
+        p.add_argument("--threads", type=int, nargs="+", default=[0], help="0 = library default (all cores)")
+        p.add_argument("--limit", type=int, default=1000, help="documents per collection")
+        p.add_argument("--texts-file", help="one text per line instead of the Mongo corpus")
+        if name == "check":
+            p.add_argument("--threshold", type=float, default=0.98, help="minimum cosine vs the PyTorch model")
+            p.add_argument("--k", type=int, default=3)
+        else:
+            p.add_argument("--queries", type=int, default=200, help="single-query calls for the latency numbers")
+        if name == "bench":
+            p.add_argument("--backends", nargs="+", default=["torch", "onnx"])
+        if name == "bench-one":
+            p.add_argument("--backend", required=True)
+            p.add_argument("--corpus-file", required=True)
+
+    args = parser.parse_args()
+    {"export": cmd_export, "check": cmd_check, "bench": cmd_bench, "bench-one": cmd_bench_one}[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
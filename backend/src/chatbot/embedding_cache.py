@@ -0,0 +1,97 @@
+"""
+Bounded, thread-safe LRU cache for query-side embeddings.
+
+Wraps an Embeddings model so repeated questions ("I need a cardiologist",
+"paracetamol") skip the CPU forward pass. Only embed_query() is cached;
+embed_documents() (ingestion) passes straight through.
+"""
+import re
+import threading
+from array import array
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_query_text(text):
+    """Cache key for a query. all-MiniLM-L6-v2 uses an uncased tokenizer, so
+    case and runs of whitespace do not change the embedding."""
+    return re.sub(r"\s+", " ", text.strip().lower())
+
+
+class CachedQueryEmbeddings(Embeddings):
+    def __init__(self, base, max_entries=2048, max_bytes=16 * 1024 * 1024):
+        self.base = base
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._cache = OrderedDict()  # key -> array('f'), least recently used first
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def embed_documents(self, texts):
+        return self.base.embed_documents(texts)
+
+    def _lookup(self, key):
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return list(vector)
+            self.misses += 1
+            return None
+
+    def embed_query(self, text):
+        key = normalize_query_text(text)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        # Forward pass outside the lock so other lookups aren't blocked on it
+        embedding = self.base.embed_query(key)
+        self._store(key, embedding)
+        return embedding
+
+    async def aembed_query(self, text):
+        key = normalize_query_text(text)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        # Lets a batching base (embedding_service.py) await the forward pass without a thread
+        embedding = await self.base.aembed_query(key)
+        self._store(key, embedding)
+        return embedding
+
+    def _store(self, key, embedding):
+        vector = array("f", embedding)
+        size = vector.itemsize * len(vector)
+        with self._lock:
+            if key in self._cache:
+                return
+            self._cache[key] = vector
+            self._bytes += size
+            while self._cache and (len(self._cache) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._cache.popitem(last=False)
+                self._bytes -= evicted.itemsize * len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._cache),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
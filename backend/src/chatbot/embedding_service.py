@@ -0,0 +1,360 @@
+"""
+Micro-batching service for query embeddings.
+
+Under concurrency every chat turn used to run its own single-text forward
+pass. Here concurrent embed_query() / aembed_query() calls are queued and run
+together as one embed_documents() call. A batch is flushed when max_batch
+texts are waiting or the oldest has waited max_wait_ms. Texts that piled up
+while the previous batch was running go straight into the next one.
+
+Two ways to use it (EMBEDDING_SERVICE in chatbot_rag):
+  "batched"  MicroBatchingEmbeddings inside each worker process
+  "socket"   one `python embedding_service.py` process owns the model and the
+             batcher; every uvicorn worker talks to it through
+             UnixSocketEmbeddings on EMBEDDING_SOCKET, so the model is loaded
+             once per machine instead of once per worker
+
+    python embedding_service.py --max-batch 32 --max-wait-ms 5 &
+    EMBEDDING_SERVICE=socket uvicorn api:app --workers 4
+    python embedding_service.py --stats
+
+Wire format, both directions: 4-byte big-endian header length, JSON header,
+then (embedding replies only) n * dim little-endian float32 values.
+"""
+import argparse
+import asyncio
+import json
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+LENGTH = struct.Struct(">I")
+
+
+class MicroBatcher:
+    """Runs embed_fn(texts) on a background thread over batches of submitted texts."""
+
+    def __init__(self, embed_fn, max_batch=32, max_wait_ms=5.0, name="embed-batcher"):
+        self.embed_fn = embed_fn
+        self.max_batch = max_batch
+        self.max_wait_sec = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.batch_sizes = Counter()
+        self.flush_reasons = Counter()
+        self._waits = deque(maxlen=4096)  # recent submit -> batch start, seconds
+        self.requests = 0
+        self.batches = 0
+        self.forward_sec = 0.0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, text):
+        future = Future()
+        self._queue.put((text, future, time.monotonic()))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = first[2] + self.max_wait_sec
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    # Past the deadline, still take whatever is already queued
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            self._flush(batch, "full" if len(batch) >= self.max_batch else "deadline")
+
+    def _flush(self, batch, reason):
+        started = time.monotonic()
+        live = [(text, future, queued_at) for text, future, queued_at in batch if future.set_running_or_notify_cancel()]
+        if not live:
+            return
+        unique = list(dict.fromkeys(text for text, _, _ in live))  # same question twice -> one row
+        try:
+            vectors = dict(zip(unique, self.embed_fn(unique)))
+        except Exception as e:
+            for _, future, _ in live:
+                future.set_exception(e)
+            vectors = None
+        forward_sec = time.monotonic() - started
+        if vectors is not None:
+            for text, future, _ in live:
+                future.set_result(vectors[text])
+        with self._lock:
+            self.batches += 1
+            self.requests += len(live)
+            self.batch_sizes[len(live)] += 1
+            self.flush_reasons[reason] += 1
+            self.forward_sec += forward_sec
+            self._waits.extend(started - queued_at for _, _, queued_at in live)
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                "requests": self.requests,
+                "batches": self.batches,
+                "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+                "batch_size_histogram": {str(size): n for size, n in sorted(self.batch_sizes.items())},
+                "flush_reasons": dict(self.flush_reasons),
+                "queue_wait_ms": {
+                    "p50": waits[len(waits) // 2] * 1000 if waits else 0.0,
+                    "p95": waits[int(len(waits) * 0.95)] * 1000 if waits else 0.0,
+                    "max": waits[-1] * 1000 if waits else 0.0,
+                },
+                "mean_forward_ms": self.forward_sec / self.batches * 1000 if self.batches else 0.0,
+                "queued": self._queue.qsize(),
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait_sec * 1000,
+            }
+
+
+class MicroBatchingEmbeddings(Embeddings):
+    """Query embeddings go through the batcher; embed_documents() (ingest) is
+    already batched and calls the model directly. For MiniLM both give the
+    same vector for the same text."""
+
+    def __init__(self, base, max_batch=32, max_wait_ms=5.0):
+        self.base = base
+        self.batcher = MicroBatcher(base.embed_documents, max_batch=max_batch, max_wait_ms=max_wait_ms)
+
+    def embed_documents(self, texts):
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.batcher.submit(text).result()
+
+    async def aembed_query(self, text):
+        return await asyncio.wrap_future(self.batcher.submit(text))
+
+    def stats(self):
+        return {"service": "batched", **self.batcher.stats()}
+
+
+# --- wire format --------------------------------------------------------------
+def encode_message(header, payload=b""):
+    body = json.dumps(header).encode("utf-8")
+    return LENGTH.pack(len(body)) + body + payload
+
+
+def vectors_to_bytes(vectors):
+    matrix = np.asarray(vectors, dtype="<f4")
+    return matrix.shape, matrix.tobytes()
+
+
+def vectors_from_bytes(header, payload):
+    return np.frombuffer(payload, dtype="<f4").reshape(header["n"], header["dim"]).tolist()
+
+
+def recv_exactly(sock, n):
+    chunks = []
+    while n:
+        chunk = sock.recv(n)
+        if not chunk:
+            raise ConnectionError("embedding service closed the connection")
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_reply(sock):
+    header = json.loads(recv_exactly(sock, LENGTH.unpack(recv_exactly(sock, LENGTH.size))[0]))
+    payload = recv_exactly(sock, header["n"] * header["dim"] * 4) if header.get("n") else b""
+    return header, payload
+
+
+class UnixSocketEmbeddings(Embeddings):
+    """Client for the shared embedding process. Connections are pooled, and a
+    stale one (service restarted) is replaced and the request retried once.
+
+    Nothing connects at construction, so workers may start before the service.
+    A connect that finds no listener is retried with backoff for up to
+    connect_wait_sec; probe() reports "pending" until the first success."""
+
+    def __init__(self, socket_path, timeout=30.0, connect_wait_sec=30.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.connect_wait_sec = connect_wait_sec
+        self._pool = queue.LifoQueue()
+        self.connected_once = False
+
+    def _connect_once(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.connected_once = True
+        return sock
+
+    def _connect(self, wait_sec=None):
+        deadline = time.monotonic() + (self.connect_wait_sec if wait_sec is None else wait_sec)
+        delay = 0.1
+        while True:
+            try:
+                return self._connect_once()
+            except (FileNotFoundError, ConnectionRefusedError):
+                # Service not started yet, or restarting
+                if time.monotonic() + delay > deadline:
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 2, 2.0)
+
+    def _request(self, header):
+        for attempt in range(2):
+            try:
+                sock = self._pool.get_nowait()
+                pooled = True
+            except queue.Empty:
+                sock, pooled = self._connect(), False
+            try:
+                sock.sendall(encode_message(header))
+                reply, payload = recv_reply(sock)
+            except OSError:
+                sock.close()
+                if pooled and attempt == 0:
+                    continue
+                raise
+            self._pool.put(sock)
+            if not reply.get("ok"):
+                raise RuntimeError(f"embedding service error: {reply.get('error')}")
+            return reply, payload
+
+    def _embed(self, texts, mode):
+        if not texts:
+            return []
+        reply, payload = self._request({"op": "embed", "mode": mode, "texts": list(texts)})
+        return vectors_from_bytes(reply, payload)
+
+    def embed_documents(self, texts):
+        return self._embed(texts, "documents")
+
+    def embed_query(self, text):
+        return self._embed([text], "query")[0]
+
+    async def aembed_query(self, text):
+        return await asyncio.to_thread(self.embed_query, text)
+
+    def remote_stats(self):
+        return self._request({"op": "stats"})[0]["stats"]
+
+    def probe(self):
+        """Readiness without waiting: "ok", "pending" (never reached yet) or "failed"."""
+        try:
+            sock = self._connect(wait_sec=0)
+        except OSError as e:
+            return {"state": "failed" if self.connected_once else "pending", "socket": self.socket_path,
+                    "error": str(e) or type(e).__name__}
+        sock.close()
+        return {"state": "ok", "socket": self.socket_path}
+
+    def stats(self):
+        try:
+            return {"service": "socket", "socket": self.socket_path, **self.remote_stats()}
+        except Exception as e:
+            return {"service": "socket", "socket": self.socket_path, "error": str(e)}
+
+
+# --- server -------------------------------------------------------------------
+class EmbeddingServer:
+    def __init__(self, model, socket_path, max_batch=32, max_wait_ms=5.0):
+        self.model = model
+        self.socket_path = socket_path
+        self.batching = MicroBatchingEmbeddings(model, max_batch=max_batch, max_wait_ms=max_wait_ms)
+        self.connections = 0
+        self.document_requests = 0
+
+    async def _reply(self, header):
+        if header.get("op") == "stats":
+            stats = {**self.batching.batcher.stats(), "connections": self.connections,
+                     "document_requests": self.document_requests}
+            return encode_message({"ok": True, "stats": stats})
+        texts = header.get("texts") or []
+        if header.get("mode") == "documents":
+            self.document_requests += 1
+            vectors = await asyncio.get_running_loop().run_in_executor(None, self.model.embed_documents, texts)
+        else:
+            vectors = await asyncio.gather(*(self.batching.aembed_query(text) for text in texts))
+        (n, dim), payload = vectors_to_bytes(vectors) if vectors else ((0, 0), b"")
+        return encode_message({"ok": True, "n": n, "dim": dim}, payload)
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                length = LENGTH.unpack(await reader.readexactly(LENGTH.size))[0]
+                header = json.loads(await reader.readexactly(length))
+                try:
+                    message = await self._reply(header)
+                except Exception as e:
+                    message = encode_message({"ok": False, "error": str(e)})
+                writer.write(message)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def serve(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # left over from a previous run
+        server = await asyncio.start_unix_server(self.handle, path=self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        print(f"[EMBED SERVICE] Listening on {self.socket_path} "
+              f"(max_batch={self.batching.batcher.max_batch}, max_wait={self.batching.batcher.max_wait_sec * 1000:.1f}ms)")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    from chatbot_rag import EMBEDDING_SOCKET, EMBED_MAX_BATCH, EMBED_MAX_WAIT_MS, build_embedding_model
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=EMBEDDING_SOCKET)
+    parser.add_argument("--max-batch", type=int, default=EMBED_MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=EMBED_MAX_WAIT_MS)
+    parser.add_argument("--backend", default=None, help="embedding backend (default EMBEDDING_BACKEND)")
+    parser.add_argument("--threads", type=int, default=None, help="model threads (default EMBEDDING_THREADS)")
+    parser.add_argument("--stats", action="store_true", help="print a running service's stats and exit")
+    args = parser.parse_args()
+
+    if args.stats:
+        print(json.dumps(UnixSocketEmbeddings(args.socket, connect_wait_sec=0).remote_stats(), indent=2))
+        return
+    model = build_embedding_model(args.backend, args.threads)
+    model.embed_documents(["warmup"])
+    try:
+        asyncio.run(EmbeddingServer(model, args.socket, args.max_batch, args.max_wait_ms).serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+"""
+Live embedding sync: keeps hospital/medicine embeddings fresh by following
+MongoDB change streams instead of waiting for a manual `chatbot_rag.py` run.
+
+Run standalone with `python embedding_sync.py`, or set EMBEDDING_SYNC=1 to
+start it in the background of the FastAPI app. With several workers (or
+several app hosts) only the process holding the lease document in
+embedding_sync_state follows the stream; the others stand by, take over when
+the lease expires, and run their on_flush callbacks when the leader records a
+flush. Change streams need a replica set; locally a single-node one is enough:
+
+    mongod --replSet rs0 --dbpath ./data   # then rs.initiate() in mongosh
+    MONGO_URI="mongodb://localhost:27017/?replicaSet=rs0" python embedding_sync.py
+"""
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from chatbot_rag import (
+    client,
+    hospital_db,
+    hospital_collection,
+    medicines_collection,
+    pharmacies_collection,
+    run_embedding_pipeline,
+    build_pharmacy_lookup,
+    create_hospital_embeddings,
+    create_pharmacy_embeddings,
+    render_hospital_text,
+    render_medicine_text,
+    medicine_filter_fields,
+    DOCTOR_NAME_FIELDS,
+    MEDICINE_NAME_FIELDS,
+)
+
+# Flush a micro-batch when this many documents are pending or the oldest
+# pending change has waited this long.
+SYNC_MAX_BATCH = int(os.getenv("EMBEDDING_SYNC_MAX_BATCH", "64"))
+SYNC_MAX_WAIT_SEC = float(os.getenv("EMBEDDING_SYNC_MAX_WAIT_SEC", "2.0"))
+
+# Where the resume token is kept between restarts
+sync_state_collection = hospital_db["embedding_sync_state"]
+SYNC_STATE_ID = "embedding_sync"
+# Single-watcher election: the lease is renewed every third of its lifetime,
+# and standbys poll for it (and for the leader's flushes) at the same rate
+SYNC_LEASE_ID = "embedding_sync_lease"
+SYNC_LEASE_SEC = float(os.getenv("EMBEDDING_SYNC_LEASE_SEC", "30"))
+
+# Server errors meaning the stored resume token is no longer in the oplog:
+# ChangeStreamFatalError (280) and ChangeStreamHistoryLost (286)
+HISTORY_LOST_CODES = {280, 286}
+
+# Fields written by the embedding pipeline itself. Updates touching only these
+# must be ignored, otherwise every re-embed would trigger another one.
+PIPELINE_FIELDS = {"text", "text_hash", "embedding_model", "embedding_storage", "embeddings", "filters"}
+
+WATCHED_NAMESPACES = [
+    (hospital_collection.database.name, hospital_collection.name),
+    (medicines_collection.database.name, medicines_collection.name),
+    (pharmacies_collection.database.name, pharmacies_collection.name),
+]
+
+
+def load_resume_token():
+    state = sync_state_collection.find_one({"_id": SYNC_STATE_ID})
+    return state.get("resume_token") if state else None
+
+
+def clear_resume_token():
+    sync_state_collection.update_one(
+        {"_id": SYNC_STATE_ID},
+        {"$unset": {"resume_token": ""}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+    )
+
+
+def save_resume_token(token):
+    if token is None:
+        return
+    sync_state_collection.update_one(
+        {"_id": SYNC_STATE_ID},
+        {"$set": {"resume_token": token, "updated_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+
+
+def acquire_lease(owner, lease_sec=SYNC_LEASE_SEC):
+    """Take or renew the watcher lease; False while another live process holds it."""
+    now = datetime.now(timezone.utc)
+    try:
+        sync_state_collection.update_one(
+            {"_id": SYNC_LEASE_ID, "$or": [{"owner": owner}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=lease_sec)}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False  # the filter missed a live lease held by someone else, and the upsert collided
+    return True
+
+
+def release_lease(owner):
+    sync_state_collection.delete_one({"_id": SYNC_LEASE_ID, "owner": owner})
+
+
+def record_flush(scope):
+    """Let standby processes know that `scope` changed."""
+    sync_state_collection.update_one(
+        {"_id": SYNC_STATE_ID}, {"$set": {f"flushed_at.{scope}": datetime.now(timezone.utc)}}, upsert=True,
+    )
+
+
+def load_flush_times():
+    state = sync_state_collection.find_one({"_id": SYNC_STATE_ID}, {"flushed_at": 1})
+    return (state or {}).get("flushed_at") or {}
+
+
+def is_pipeline_write(change):
+    """True for update events caused by our own embedding writes."""
+    if change.get("operationType") != "update":
+        return False
+    description = change.get("updateDescription") or {}
+    touched = set(description.get("updatedFields", {})) | set(description.get("removedFields", []))
+    return bool(touched) and touched <= PIPELINE_FIELDS
+
+
+def medicines_for_pharmacies_query(pharmacy_ids):
+    """Medicines referencing any of the pharmacies, by plain id or DBRef."""
+    ids = list(pharmacy_ids)
+    return {"$or": [{"pharmacy": {"$in": ids}}, {"pharmacy.$id": {"$in": ids}}]}
+
+
+class EmbeddingSyncWatcher:
+    def __init__(self, max_batch=SYNC_MAX_BATCH, max_wait_sec=SYNC_MAX_WAIT_SEC, on_flush=None,
+                 lease_sec=SYNC_LEASE_SEC):
+        self.max_batch = max_batch
+        self.max_wait_sec = max_wait_sec
+        self.lease_sec = lease_sec
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._seen_flushes = None
+        # Callbacks run with the scope ("hospital"/"pharmacy") whose documents were re-embedded or deleted
+        self.on_flush = list(on_flush or [])
+        self.stop_event = threading.Event()
+        self.stats = {"events": 0, "ignored": 0, "flushes": 0, "reembedded": 0, "deleted": 0}
+        self._reset_pending()
+
+    def _reset_pending(self):
+        self.pending_hospital_ids = set()
+        self.pending_medicine_ids = set()
+        self.pending_pharmacy_ids = set()
+        self.deleted_scopes = set()  # scopes with deletes since the last flush
+        self.pending_since = None
+
+    def pending_count(self):
+        return (len(self.pending_hospital_ids) + len(self.pending_medicine_ids) + len(self.pending_pharmacy_ids)
+                + len(self.deleted_scopes))
+
+    def handle_change(self, change):
+        """Record the document affected by one change event."""
+        self.stats["events"] += 1
+        if is_pipeline_write(change) or "documentKey" not in change:
+            self.stats["ignored"] += 1
+            return
+        ns = change.get("ns", {})
+        doc_id = change["documentKey"]["_id"]
+        namespace = (ns.get("db"), ns.get("coll"))
+        deleted = change["operationType"] == "delete"
+        if namespace == WATCHED_NAMESPACES[0]:
+            if deleted:
+                # Nothing to embed, but in-process indexes and cached answers still hold it
+                self.pending_hospital_ids.discard(doc_id)
+                self.deleted_scopes.add("hospital")
+                self.stats["deleted"] += 1
+            else:
+                self.pending_hospital_ids.add(doc_id)
+        elif namespace == WATCHED_NAMESPACES[1]:
+            if deleted:
+                self.pending_medicine_ids.discard(doc_id)
+                self.deleted_scopes.add("pharmacy")
+                self.stats["deleted"] += 1
+            else:
+                self.pending_medicine_ids.add(doc_id)
+        elif namespace == WATCHED_NAMESPACES[2]:
+            # Pharmacy details are rendered into every medicine that references it
+            self.pending_pharmacy_ids.add(doc_id)
+        else:
+            self.stats["ignored"] += 1
+            return
+        if self.pending_since is None:
+            self.pending_since = time.monotonic()
+
+    def flush_due(self):
+        if not self.pending_count():
+            return False
+        waited = time.monotonic() - self.pending_since
+        return self.pending_count() >= self.max_batch or waited >= self.max_wait_sec
+
+    def flush(self):
+        """Re-render and re-embed the pending documents (unchanged ones are skipped),
+        then notify on_flush for every scope that was re-embedded or had deletes."""
+        changed_scopes = set(self.deleted_scopes)
+        if self.pending_hospital_ids:
+            stats = run_embedding_pipeline(
+                hospital_collection, render_hospital_text, DOCTOR_NAME_FIELDS,
+                "SYNC-HOSPITAL", batch_size=self.max_batch, changed_only=True,
+                query={"_id": {"$in": list(self.pending_hospital_ids)}},
+            )
+            self.stats["reembedded"] += stats["docs"]
+            if stats["docs"] or stats["fields_updated"]:
+                changed_scopes.add("hospital")
+
+        medicine_clauses = []
+        if self.pending_medicine_ids:
+            medicine_clauses.append({"_id": {"$in": list(self.pending_medicine_ids)}})
+        if self.pending_pharmacy_ids:
+            medicine_clauses.append(medicines_for_pharmacies_query(self.pending_pharmacy_ids))
+        if medicine_clauses:
+            query = {"$or": medicine_clauses}
+            pharmacy_lookup = build_pharmacy_lookup(query)
+            stats = run_embedding_pipeline(
+                medicines_collection, lambda doc: render_medicine_text(doc, pharmacy_lookup),
+                MEDICINE_NAME_FIELDS, "SYNC-PHARMACY", batch_size=self.max_batch,
+                changed_only=True, query=query, extra_fields_fn=medicine_filter_fields,
+            )
+            self.stats["reembedded"] += stats["docs"]
+            if stats["docs"] or stats["fields_updated"]:
+                changed_scopes.add("pharmacy")
+
+        for scope in sorted(changed_scopes):
+            self._notify(scope)
+        self.stats["flushes"] += 1
+        self._reset_pending()
+
+    def _notify(self, scope, local_only=False):
+        if not local_only:
+            try:
+                record_flush(scope)
+            except Exception as e:
+                print(f"[SYNC WARN] Could not record flush for standbys: {e}")
+        for callback in self.on_flush:
+            try:
+                callback(scope)
+            except Exception as e:
+                print(f"[SYNC WARN] on_flush callback failed: {e}")
+
+    def catch_up(self):
+        """Changed-only pass over both collections, for edits made while no
+        change stream covered them; deletes are picked up by notifying both scopes."""
+        print("[SYNC] Catching up with a --changed-only pass...")
+        create_hospital_embeddings(batch_size=self.max_batch, changed_only=True)
+        create_pharmacy_embeddings(batch_size=self.max_batch, changed_only=True)
+        for scope in ("hospital", "pharmacy"):
+            self._notify(scope)
+
+    def poll_leader_flushes(self):
+        """Standby side: run on_flush for scopes the leader flushed since the last poll."""
+        flushed = load_flush_times()
+        if self._seen_flushes is not None:
+            for scope, flushed_at in flushed.items():
+                if flushed_at != self._seen_flushes.get(scope):
+                    self._notify(scope, local_only=True)
+        self._seen_flushes = flushed
+
+    def hold_lease(self):
+        """Acquire or renew the lease, logging leadership changes."""
+        try:
+            held = acquire_lease(self.owner, self.lease_sec)
+        except Exception as e:
+            print(f"[SYNC WARN] Lease check failed: {e}")
+            held = False
+        if held and not self.is_leader:
+            print(f"[SYNC] {self.owner} holds the watcher lease")
+        elif not held and self.is_leader:
+            print(f"[SYNC WARN] {self.owner} lost the watcher lease; standing by")
+        elif not held and self._seen_flushes is None:
+            print(f"[SYNC] Another process holds the watcher lease; {self.owner} standing by")
+        self.is_leader = held
+        return held
+
+    def run(self):
+        """Follow the change stream until stop() is called."""
+        pipeline = [{"$match": {
+            "operationType": {"$in": ["insert", "update", "replace", "delete"]},
+            "$or": [{"ns.db": db_name, "ns.coll": coll_name} for db_name, coll_name in WATCHED_NAMESPACES],
+        }}]
+        renew_every = self.lease_sec / 3
+        needs_catch_up = False
+        while not self.stop_event.is_set():
+            if not self.hold_lease():
+                try:
+                    self.poll_leader_flushes()
+                except Exception as e:
+                    print(f"[SYNC WARN] Could not read leader flushes: {e}")
+                self.stop_event.wait(renew_every)
+                continue
+            # The previous leader may have advanced the token; always start from the stored one
+            resume_token = load_resume_token()
+            print(f"[SYNC] Watching {len(WATCHED_NAMESPACES)} collections "
+                  f"({'resuming' if resume_token else 'starting fresh'})...")
+            renewed_at = time.monotonic()
+            try:
+                with client.watch(pipeline, resume_after=resume_token,
+                                  max_await_time_ms=int(self.max_wait_sec * 1000)) as stream:
+                    if needs_catch_up:
+                        # The new stream is already open, so nothing edited during the pass is missed
+                        self.catch_up()
+                        needs_catch_up = False
+                    while not self.stop_event.is_set():
+                        if time.monotonic() - renewed_at >= renew_every:
+                            if not self.hold_lease():
+                                # Unflushed events are left to the new leader (token not advanced)
+                                self._reset_pending()
+                                break
+                            renewed_at = time.monotonic()
+                        change = stream.try_next()
+                        if change is not None:
+                            self.handle_change(change)
+                        if self.flush_due():
+                            self.flush()
+                        # Only advance the stored token once everything before it is embedded,
+                        # so a restart resumes without skipping unflushed events.
+                        if not self.pending_count() and stream.resume_token != resume_token:
+                            resume_token = stream.resume_token
+                            save_resume_token(resume_token)
+            except OperationFailure as e:
+                if e.code not in HISTORY_LOST_CODES:
+                    print(f"[SYNC FAIL] Change stream error: {e}; reconnecting in 5s...")
+                    self._reset_pending()
+                    self.stop_event.wait(5)
+                    continue
+                # Retrying the same token can never succeed; start a fresh stream instead
+                print(f"[SYNC WARN] Resume token is no longer in the oplog ({e}); starting fresh")
+                clear_resume_token()
+                needs_catch_up = True
+                self._reset_pending()
+            except Exception as e:
+                print(f"[SYNC FAIL] Change stream error: {e}; reconnecting in 5s...")
+                self._reset_pending()
+                self.stop_event.wait(5)
+        if self.is_leader:
+            release_lease(self.owner)
+        print(f"[SYNC] Stopped. Stats: {self.stats}")
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def start_embedding_sync(on_flush=None):
+    """Start the watcher on a daemon thread; returns the watcher so it can be stopped."""
+    watcher = EmbeddingSyncWatcher(on_flush=on_flush)
+    thread = threading.Thread(target=watcher.run, name="embedding-sync", daemon=True)
+    thread.start()
+    return watcher
+
+
+if __name__ == "__main__":
+    watcher = EmbeddingSyncWatcher()
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        watcher.stop()
+        print("\n[EXIT] Exiting by Ctrl-C")
@@ -0,0 +1,240 @@
+"""
+Deterministic answers for structured lookups, tried before the RAG chains.
+
+Some questions are really a single field lookup. Examples: "is paracetamol in
+stock", "which cardiologists are available", "what is Dr. Joshi's phone
+number". Those are matched by strict whole-question patterns and answered
+from the data with templated, localized replies. No retrieval and no LLM
+call are involved.
+
+  stock       medicines by filters.name_key / filters.generic_key (indexed,
+              written by the ingest); the live quantity/expiry are re-read
+              from the matched documents
+  specialty   doctors from the in-memory DoctorNameIndex, by specialty stem
+  phone       a doctor's phone number via the same index
+
+answer() returns None whenever it is not sure, so that question goes to RAG
+as before: no pattern matched, no or too many matches, or the fields
+needed are missing.
+"""
+import re
+import threading
+from collections import Counter
+from datetime import datetime
+
+# Specialist word in the question -> (plural for replies, stems looked for in the doctor's specialty field)
+SPECIALTY_STEMS = {
+    "cardiologist": ("cardiologists", ["cardio", "heart"]),
+    "neurologist": ("neurologists", ["neuro"]),
+    "orthopedic": ("orthopedic doctors", ["ortho", "bone"]),
+    "orthopaedic": ("orthopaedic doctors", ["ortho", "bone"]),
+    "dermatologist": ("dermatologists", ["derma", "skin"]),
+    "pediatrician": ("pediatricians", ["pediatr", "paediatr", "child"]),
+    "paediatrician": ("paediatricians", ["pediatr", "paediatr", "child"]),
+    "gynecologist": ("gynecologists", ["gyn", "obstet"]),
+    "gynaecologist": ("gynaecologists", ["gyn", "obstet"]),
+    "ent specialist": ("ENT specialists", ["ent", "otolaryng"]),
+    "dentist": ("dentists", ["dent"]),
+    "psychiatrist": ("psychiatrists", ["psychiat"]),
+    "oncologist": ("oncologists", ["onco", "cancer"]),
+    "urologist": ("urologists", ["uro"]),
+    "gastroenterologist": ("gastroenterologists", ["gastro"]),
+    "nephrologist": ("nephrologists", ["nephro", "kidney"]),
+    "pulmonologist": ("pulmonologists", ["pulmo", "chest"]),
+    "endocrinologist": ("endocrinologists", ["endocrin", "diabet"]),
+    "ophthalmologist": ("ophthalmologists", ["ophthal", "eye"]),
+    "general physician": ("general physicians", ["general", "physician"]),
+    "surgeon": ("surgeons", ["surg"]),
+}
+_SPECIALISTS = "|".join(sorted((re.escape(s) for s in SPECIALTY_STEMS), key=len, reverse=True))
+
+STOCK_PATTERNS = [
+    re.compile(r"(?:is|are)\s+(?P<name>.+?)\s+(?:in stock|available|availble)(?:\s+(?:now|today|in (?:the |your )?pharmacy))?"),
+    re.compile(r"(?:do|does)\s+(?:you|the pharmacy)\s+(?:have|stock|sell)\s+(?P<name>.+?)(?:\s+in stock)?(?:\s+(?:now|today))?"),
+    re.compile(r"(?:stock|availability)\s+(?:of|for)\s+(?P<name>.+)"),
+    re.compile(r"(?P<name>.+?)\s+(?:in stock|stock mein hai|uplabdh hai|available hai)(?:\s+kya)?"),
+]
+SPECIALTY_PATTERNS = [
+    re.compile(r"(?:which|what|list|show(?: me)?|are there|is there|who are|any)(?:\s+(?:all|the|any|an|a))*\s+(?P<spec>" + _SPECIALISTS
+               + r")s?(?:\s+doctors?)?(?:\s+(?:are|is))?(?:\s+(?:available|there|on duty|working|in (?:the )?hospital))?(?:\s+(?:today|now))?"),
+    re.compile(r"(?:available\s+)?(?P<spec>" + _SPECIALISTS + r")s?(?:\s+doctors?)?(?:\s+available)?(?:\s+(?:today|now))?"),
+]
+PHONE_PATTERNS = [
+    re.compile(r"(?:(?:what(?:'s| is)|give me|tell me|share|send)\s+)?(?:the\s+)?(?:phone|contact|mobile)(?:\s+(?:number|no\.?|details))?\s+(?:of|for)\s+(?P<name>.+)"),
+    re.compile(r"(?:what(?:'s| is)\s+)?(?P<name>.+?)(?:'s|s')\s+(?:phone|contact|mobile)(?:\s+(?:number|no\.?|details))?"),
+    re.compile(r"(?:how (?:can|do) i|how to)\s+(?:contact|call|reach)\s+(?P<name>.+)"),
+]
+
+FILLER_WORDS = {"a", "an", "the", "any", "some", "your", "medicine", "tablet", "tablets", "capsule", "capsules",
+                "syrup", "injection", "drug"}
+PHONE_FIELDS = ['phone', 'phoneNumber', 'phone_number', 'contact', 'mobile']
+SHIFT_FIELDS = ['shift', 'working_hours', 'schedule', 'timing']
+
+TEMPLATES = {
+    "en": {
+        "stock_in": "Yes, {name} is in stock ({quantity} available).",
+        "stock_out": "Sorry, {name} is currently out of stock.",
+        "prescription": " A prescription is required.",
+        "stock_list_header": "Here is what I found for '{query}':",
+        "stock_list_in": "- {name}: in stock ({quantity} available)",
+        "stock_list_out": "- {name}: out of stock",
+        "specialty_list": "Available {specialty}:\n{doctors}",
+        "specialty_none": "Sorry, none of our {specialty} are available right now.",
+        "doctor_phone": "You can reach {name} at {phone}.",
+    },
+    "hi": {
+        "stock_in": "जी हाँ, {name} स्टॉक में है ({quantity} उपलब्ध)।",
+        "stock_out": "माफ़ कीजिए, {name} अभी स्टॉक में नहीं है।",
+        "prescription": " इसके लिए डॉक्टर का पर्चा ज़रूरी है।",
+        "stock_list_header": "'{query}' के लिए यह मिला:",
+        "stock_list_in": "- {name}: स्टॉक में ({quantity} उपलब्ध)",
+        "stock_list_out": "- {name}: स्टॉक में नहीं",
+        "specialty_list": "उपलब्ध {specialty}:\n{doctors}",
+        "specialty_none": "माफ़ कीजिए, अभी कोई भी {specialty} उपलब्ध नहीं है।",
+        "doctor_phone": "{name} से {phone} पर संपर्क कर सकते हैं।",
+    },
+}
+
+
+def name_key(text):
+    """Lowercased alphanumeric tokens joined by single spaces ("Dolo-650 " -> "dolo 650")."""
+    return " ".join(re.findall(r"[a-z0-9]+", str(text or "").lower()))
+
+
+def detect_language(text, default="en"):
+    """Script-based guess, enough to pick a template set."""
+    if re.search(r"[\u0900-\u097F]", text):
+        return "hi"
+    return default
+
+
+def clean_question(text):
+    text = text.strip().lower()
+    text = re.sub(r"^(?:please|pls|hi|hello|hey)[,\s]+", "", text)
+    text = re.sub(r"[\s,]*(?:please|pls)$", "", text)
+    return re.sub(r"\s+", " ", text.rstrip(" ?.!"))
+
+
+def first_field(doc, names):
+    return next((doc[f] for f in names if doc.get(f) not in (None, "", "N/A")), None)
+
+
+class FastPathRouter:
+    def __init__(self, medicines_collection, doctor_index, medicine_fields_fn, medicine_name_fields,
+                 specialty_fields, max_listed=5):
+        self.medicines = medicines_collection
+        self.doctor_index = doctor_index
+        self.medicine_fields_fn = medicine_fields_fn  # live doc -> {"filters": {quantity, in_stock, expiry, ...}}
+        self.medicine_name_fields = medicine_name_fields
+        self.specialty_fields = specialty_fields
+        self.max_listed = max_listed
+        self._lock = threading.Lock()
+        self.counters = Counter()
+
+    def ensure_indexes(self):
+        self.medicines.create_index("filters.name_key", name="medicine_name_key")
+        self.medicines.create_index("filters.generic_key", name="medicine_generic_key")
+
+    def _count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def answer(self, question, language=None):
+        """(answer, scope) for a structured lookup, or None to fall back to RAG."""
+        text = clean_question(question)
+        templates = TEMPLATES.get(language or detect_language(question), TEMPLATES["en"])
+        for intent, patterns, handler, scope in (
+            ("phone", PHONE_PATTERNS, self._doctor_phone, "hospital"),
+            ("specialty", SPECIALTY_PATTERNS, self._specialty, "hospital"),
+            ("stock", STOCK_PATTERNS, self._stock, "pharmacy"),
+        ):
+            for pattern in patterns:
+                match = pattern.fullmatch(text)
+                if not match:
+                    continue
+                try:
+                    answer = handler(match, templates)
+                except Exception as e:
+                    print(f"[FAST PATH WARN] {intent} lookup failed: {e}")
+                    answer = None
+                if answer:
+                    self._count(f"{intent}_answered")
+                    return answer, scope
+                self._count(f"{intent}_fallback")
+                return None
+        return None
+
+    # --- intents -----------------------------------------------------------------
+    def _doctor_phone(self, match, templates):
+        raw_name = match.group("name")
+        doc, match_type = self.doctor_index.lookup(raw_name)
+        # Fuzzy matches only when the user clearly named a doctor
+        if not doc or (match_type == "fuzzy" and not re.match(r"(?:dr\.?|doctor)\s", raw_name)):
+            return None
+        phone = first_field(doc, PHONE_FIELDS)
+        name = first_field(doc, self.doctor_index.name_fields)
+        if not phone or not name:
+            return None
+        return templates["doctor_phone"].format(name=name, phone=phone)
+
+    def _specialty(self, match, templates):
+        label, stems = SPECIALTY_STEMS[match.group("spec")]
+        stems = [re.compile(r"\b" + re.escape(stem)) for stem in stems]
+        matching = [
+            doc for doc in self.doctor_index.documents()
+            if any(stem.search(str(first_field(doc, self.specialty_fields) or "").lower()) for stem in stems)
+        ]
+        if not matching:
+            return None  # the data may word it differently; let retrieval try
+        available = [doc for doc in matching if doc.get("isAvailable", True) is not False and doc.get("isActive", True) is not False]
+        if not available:
+            return templates["specialty_none"].format(specialty=label)
+        lines = []
+        for doc in available:
+            shift = first_field(doc, SHIFT_FIELDS)
+            name = first_field(doc, self.doctor_index.name_fields)
+            lines.append(f"- {name}" + (f" ({shift})" if isinstance(shift, str) else ""))
+        return templates["specialty_list"].format(specialty=label, doctors="\n".join(sorted(lines)))
+
+    def _find_medicines(self, key):
+        projection = {"embeddings": 0, "text": 0, "text_hash": 0}
+        limit = self.max_listed + 1
+        docs = list(self.medicines.find({"$or": [{"filters.name_key": key}, {"filters.generic_key": key}]}, projection).limit(limit))
+        if not docs:
+            # Anchored, case-sensitive prefix on whole tokens: still an index range scan
+            prefix = {"$regex": "^" + re.escape(key) + "(?: |$)"}
+            docs = list(self.medicines.find({"$or": [{"filters.name_key": prefix}, {"filters.generic_key": prefix}]}, projection).limit(limit))
+        return docs
+
+    def _stock(self, match, templates):
+        raw_name = match.group("name")
+        if re.match(r"(?:dr\.?|doctor)\s", raw_name):
+            return None
+        key = name_key(" ".join(t for t in name_key(raw_name).split() if t not in FILLER_WORDS))
+        if not key:
+            return None
+        docs = self._find_medicines(key)
+        if not docs or len(docs) > self.max_listed:
+            return None
+        today = datetime.now()
+        rows = []
+        for doc in docs:
+            fields = self.medicine_fields_fn(doc)["filters"]
+            if fields["quantity"] is None:
+                return None  # stock unknown: the LLM can at least show what the record says
+            sellable = fields["quantity"] > 0 and fields["expiry"] >= today
+            rows.append((first_field(doc, self.medicine_name_fields) or raw_name, fields["quantity"], sellable,
+                         fields["prescription_required"]))
+        if len(rows) == 1:
+            name, quantity, sellable, prescription = rows[0]
+            if not sellable:
+                return templates["stock_out"].format(name=name)
+            return templates["stock_in"].format(name=name, quantity=quantity) + (templates["prescription"] if prescription else "")
+        lines = [templates["stock_list_header"].format(query=raw_name)]
+        for name, quantity, sellable, _ in rows:
+            lines.append(templates["stock_list_in" if sellable else "stock_list_out"].format(name=name, quantity=quantity))
+        return "\n".join(lines)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
@@ -0,0 +1,230 @@
+"""
+Hybrid lexical + vector retrieval (RETRIEVAL_MODE=hybrid).
+
+MiniLM similarity over the whole rendered `text` blob often misranks exact
+brand and doctor names ("Dolo 650", "Dr. Manoj Joshi"). A small BM25 index
+over the name / generic name / specialty fields catches those, and its
+ranking is merged with the vector ranking by reciprocal rank fusion (RRF).
+The two stages are timed separately.
+
+Both retrievers here take an optional filter_fn returning a Mongo-style
+pre-filter (e.g. only in-stock, unexpired medicines). It is evaluated per
+query and applied to both stages before ranking.
+
+Page content for the fused top-k comes from memory: vector hits carry the
+text of the vector store's current snapshot, and lexical-only hits use the
+text the BM25 index read at its last refresh (LEXICAL_REFRESH_SEC). With
+fetch_current=True the winners' text is instead re-read from Mongo in one
+`_id $in` lookup per query, at the cost of a round trip.
+"""
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List
+
+from bson import ObjectId
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import Field
+
+from local_vector_store import matches_filter
+
+# Honorifics carry no signal for matching names
+STOPWORDS = {"dr", "doctor", "mr", "mrs", "ms", "prof", "the", "of", "and"}
+
+
+def tokenize(text):
+    return [t for t in re.findall(r"[a-z0-9]+", str(text).lower()) if t not in STOPWORDS]
+
+
+def id_variants(key):
+    """Raw _id values a string key from a retriever hit may stand for."""
+    return [ObjectId(key), key] if ObjectId.is_valid(key) else [key]
+
+
+class BM25Index:
+    """Inverted BM25 index over selected fields of a Mongo collection."""
+
+    def __init__(self, collection, field_groups, text_key="text", k1=1.5, b=0.75, filter_key="filters"):
+        self.collection = collection
+        self.field_groups = field_groups  # list of alias lists, e.g. [DOCTOR_NAME_FIELDS, SPECIALTY_FIELDS]
+        self.text_key = text_key
+        self.filter_key = filter_key
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        # postings, ids, texts, doc lengths, avg length, filter fields, row by id
+        self._state = ({}, [], [], [], 0.0, [], {})
+        self.refresh()
+
+    def refresh(self):
+        """Rebuild the index from the collection (a few ms for our corpus sizes).
+        Returns True if the indexed documents, their text or filter fields changed."""
+        started = time.perf_counter()
+        projection = {self.text_key: 1, self.filter_key: 1}
+        for aliases in self.field_groups:
+            projection.update({name: 1 for name in aliases})
+        postings = defaultdict(list)  # token -> [(row, term frequency)]
+        ids, texts, lengths, row_fields = [], [], [], []
+        for doc in self.collection.find({self.text_key: {"$exists": True}}, projection):
+            tokens = []
+            for aliases in self.field_groups:
+                for name in aliases:
+                    if doc.get(name) is not None:
+                        tokens.extend(tokenize(doc[name]))
+                        break
+            row = len(ids)
+            for token, tf in Counter(tokens).items():
+                postings[token].append((row, tf))
+            ids.append(str(doc["_id"]))
+            texts.append(doc.get(self.text_key, ""))
+            lengths.append(len(tokens))
+            row_fields.append({self.filter_key: doc.get(self.filter_key)})
+        avg_length = sum(lengths) / len(lengths) if lengths else 0.0
+        postings = dict(postings)
+        with self._lock:
+            old_postings, old_ids, old_texts, _, _, old_fields, _ = self._state
+            changed = (old_ids, old_texts, old_fields, old_postings) != (ids, texts, row_fields, postings)
+            self._state = (postings, ids, texts, lengths, avg_length, row_fields,
+                           {doc_id: row for row, doc_id in enumerate(ids)})
+        if changed:
+            print(f"[LEXICAL] {self.collection.name}: indexed {len(ids)} docs, {len(postings)} terms "
+                  f"in {(time.perf_counter() - started) * 1000:.0f}ms")
+        return changed
+
+    def start_auto_refresh(self, interval_sec, on_change=None):
+        """Rebuild on a daemon thread every interval_sec seconds; on_change() runs
+        after a rebuild that saw added, removed or edited documents."""
+        def loop():
+            while True:
+                time.sleep(interval_sec)
+                try:
+                    if self.refresh() and on_change:
+                        on_change()
+                except Exception as e:
+                    print(f"[LEXICAL WARN] Refresh of {self.collection.name} failed: {e}")
+        threading.Thread(target=loop, name=f"lexical-refresh-{self.collection.name}", daemon=True).start()
+
+    def search(self, query, k, pre_filter=None):
+        """[(_id string, bm25 score)] for the k best matches, best first."""
+        postings, ids, _, lengths, avg_length, row_fields, _ = self._state
+        if not ids:
+            return []
+        scores = defaultdict(float)
+        n_docs = len(ids)
+        for token in set(tokenize(query)):
+            matches = postings.get(token)
+            if not matches:
+                continue
+            idf = math.log(1 + (n_docs - len(matches) + 0.5) / (len(matches) + 0.5))
+            for row, tf in matches:
+                if pre_filter and not matches_filter(row_fields[row], pre_filter):
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * lengths[row] / (avg_length or 1))
+                scores[row] += idf * tf * (self.k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: -item[1])[:k]
+        return [(ids[row], score) for row, score in best]
+
+    def text(self, key):
+        """Text of a document as of the last refresh(), or None if not indexed."""
+        _, _, texts, _, _, _, rows = self._state
+        row = rows.get(key)
+        return texts[row] if row is not None else None
+
+    def load_current(self, keys, pre_filter=None):
+        """{_id string: text} as stored in Mongo right now, for the keys that
+        still exist and still pass pre_filter (fetch_current=True only)."""
+        raw_ids = [raw for key in keys for raw in id_variants(key)]
+        current = {}
+        for doc in self.collection.find({"_id": {"$in": raw_ids}}, {self.text_key: 1, self.filter_key: 1}):
+            fields = {self.filter_key: doc.get(self.filter_key)}
+            if pre_filter and not matches_filter(fields, pre_filter):
+                continue
+            current[str(doc["_id"])] = doc.get(self.text_key, "")
+        return current
+
+
+def doc_key(document):
+    return str(document.metadata.get("_id", document.page_content))
+
+
+class HybridRetriever(BaseRetriever):
+    """Fuses BM25 and vector rankings with RRF: score = sum(1 / (rrf_k + rank))."""
+
+    vectorstore: Any
+    lexical_index: Any
+    k: int = 3
+    candidate_k: int = 10
+    rrf_k: int = 60
+    filter_fn: Any = None
+    # Re-read the winners' text from Mongo on every query instead of using the in-memory copies
+    fetch_current: bool = False
+    stats: Dict[str, float] = Field(default_factory=lambda: {"queries": 0, "lexical_ms": 0.0, "vector_ms": 0.0,
+                                                             "fetches": 0, "fetch_ms": 0.0})
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        pre_filter = self.filter_fn() if self.filter_fn else None
+        search_kwargs = {"pre_filter": pre_filter} if pre_filter else {}
+        started = time.perf_counter()
+        lexical = [key for key, _ in self.lexical_index.search(query, self.candidate_k, pre_filter=pre_filter)]
+        lexical_done = time.perf_counter()
+        vector = self.vectorstore.similarity_search(query, k=self.candidate_k, **search_kwargs)
+        vector_done = time.perf_counter()
+
+        fused, by_key = defaultdict(float), {}
+        for ranking in (lexical, [doc_key(document) for document in vector]):
+            for rank, key in enumerate(ranking):
+                fused[key] += 1.0 / (self.rrf_k + rank + 1)
+        for document in vector:
+            by_key.setdefault(doc_key(document), document)
+        ranked = sorted(fused, key=lambda key: -fused[key])
+
+        if self.fetch_current:
+            # Winners' text as stored right now; deleted or no longer eligible documents drop out
+            current = self.lexical_index.load_current(ranked[:self.k * 2], pre_filter=pre_filter)
+            if len(current) < self.k and len(ranked) > self.k * 2:
+                current.update(self.lexical_index.load_current(ranked[self.k * 2:], pre_filter=pre_filter))
+            self.stats["fetches"] += 1
+            self.stats["fetch_ms"] += (time.perf_counter() - vector_done) * 1000
+        else:
+            # Vector hits carry the store's current text; lexical-only hits use the index's copy
+            current = {key: by_key[key].page_content if key in by_key else self.lexical_index.text(key)
+                       for key in ranked}
+        best = [key for key in ranked if current.get(key) is not None][:self.k]
+
+        self.stats["queries"] += 1
+        self.stats["lexical_ms"] += (lexical_done - started) * 1000
+        self.stats["vector_ms"] += (vector_done - lexical_done) * 1000
+        return [Document(page_content=current[key],
+                         metadata={**(by_key[key].metadata if key in by_key else {}), "_id": key})
+                for key in best]
+
+    def refresh(self):
+        return self.lexical_index.refresh()
+
+    def timing_stats(self):
+        queries = self.stats["queries"] or 1
+        stats = {
+            "queries": self.stats["queries"],
+            "avg_lexical_ms": round(self.stats["lexical_ms"] / queries, 3),
+            "avg_vector_ms": round(self.stats["vector_ms"] / queries, 3),
+        }
+        if self.stats["fetches"]:
+            stats["avg_fetch_ms"] = round(self.stats["fetch_ms"] / self.stats["fetches"], 3)
+        return stats
+
+
+class FilteredVectorRetriever(BaseRetriever):
+    """Vector-only retriever whose pre-filter is recomputed for every query
+    (as_retriever() would freeze search_kwargs, e.g. 'today', at startup)."""
+
+    vectorstore: Any
+    k: int = 3
+    filter_fn: Any = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        pre_filter = self.filter_fn() if self.filter_fn else None
+        search_kwargs = {"pre_filter": pre_filter} if pre_filter else {}
+        return self.vectorstore.similarity_search(query, k=self.k, **search_kwargs)
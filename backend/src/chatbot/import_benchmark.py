@@ -0,0 +1,108 @@
+"""
+Import-time benchmark for the chatbot modules, based on `python -X importtime`.
+
+Each module is imported in a fresh interpreter (--repeat times, best run kept)
+and the per-module timings Python writes to stderr are summed up. Besides the
+total it lists the slowest imports and flags heavy libraries that should only
+load on first use (torch, sentence-transformers, LangChain chains, OpenAI,
+speech_recognition), plus whether the import opened a Mongo connection.
+
+    python import_benchmark.py
+    python import_benchmark.py --module api --top 25
+    python import_benchmark.py --max-ms 1500     # exit 1 if any module is slower
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Top-level packages that must not be imported as a side effect of `import chatbot_rag`
+HEAVY_PACKAGES = [
+    "torch", "sentence_transformers", "transformers", "langchain_huggingface", "langchain_openai",
+    "openai", "langchain_mongodb", "speech_recognition", "whisper", "elevenlabs",
+]
+
+LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+# Run in the child after the import: report pymongo clients that were created
+PROBE = (
+    "import sys, gc\n"
+    "clients = 0\n"
+    "if 'pymongo' in sys.modules:\n"
+    "    from pymongo import MongoClient\n"
+    "    clients = sum(isinstance(o, MongoClient) for o in gc.get_objects())\n"
+    "print('MONGO_CLIENTS', clients)\n"
+)
+
+
+def import_once(module):
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}\n{PROBE}"],
+        cwd=HERE, env=env, capture_output=True, text=True,
+    )
+    rows = []
+    other_stderr = []
+    for line in proc.stderr.splitlines():
+        m = LINE.match(line)
+        if m:
+            self_us, cumulative_us, indent, name = m.groups()
+            rows.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+        elif line.strip() and not line.startswith("import time:"):
+            other_stderr.append(line)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n" + "\n".join(other_stderr[-15:]))
+    mongo_clients = int(re.search(r"MONGO_CLIENTS (\d+)", proc.stdout).group(1))
+    return rows, mongo_clients
+
+
+def summarize(module, rows, mongo_clients, top):
+    # Top-level entries (depth 0) partition the whole import
+    total_us = sum(cumulative for _, _, cumulative, depth in rows if depth == 0)
+    loaded = {name.split(".")[0] for name, _, _, _ in rows}
+    heavy = [pkg for pkg in HEAVY_PACKAGES if pkg in loaded]
+    print(f"\n== import {module}: {total_us / 1000:.0f} ms, {len(rows)} modules, "
+          f"{mongo_clients} MongoClient(s) created")
+    print(f"   heavy packages loaded: {', '.join(heavy) if heavy else 'none'}")
+    print("   slowest by cumulative time:")
+    # Cumulative time of a package includes its children; show each package once
+    by_package = {}
+    for name, _, cumulative, _ in rows:
+        package = name.split(".")[0]
+        by_package[package] = max(by_package.get(package, 0), cumulative)
+    for package, cumulative in sorted(by_package.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"     {cumulative / 1000:8.1f} ms  {package}")
+    return total_us / 1000, heavy, mongo_clients
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", action="append", help="module to import (repeatable; default chatbot_rag and api)")
+    parser.add_argument("--repeat", type=int, default=3, help="fresh interpreters per module; the fastest run is reported")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-ms", type=float, default=None, help="fail if a module takes longer than this")
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.module or ["chatbot_rag", "api"]:
+        try:
+            runs = [import_once(module) for _ in range(max(1, args.repeat))]
+        except RuntimeError as e:
+            print(f"\n[FAIL] {e}")
+            failed = True
+            continue
+        rows, mongo_clients = min(runs, key=lambda run: sum(c for _, _, c, d in run[0] if d == 0))
+        total_ms, heavy, mongo_clients = summarize(module, rows, mongo_clients, args.top)
+        if heavy or mongo_clients:
+            print(f"   [WARN] import of {module} is not side-effect free")
+        if args.max_ms is not None and total_ms > args.max_ms:
+            print(f"   [FAIL] {total_ms:.0f} ms exceeds the {args.max_ms:.0f} ms budget")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Load test for /api/chat: fires the same mix of queries at increasing
+concurrency levels and reports throughput and latency for each level.
+
+With the chat path non-blocking, requests/sec should grow with concurrency
+until the LLM provider or the DB executor becomes the bottleneck.
+
+    python -m uvicorn api:app --port 5002      # in another shell
+    python load_test.py --url http://127.0.0.1:5002 --levels 1,4,16 --requests 32
+"""
+import argparse
+import asyncio
+import json
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+SAMPLE_QUERIES = [
+    "I need a cardiologist",
+    "Is paracetamol tablet available?",
+    "Which doctors work the morning shift?",
+    "hello",
+]
+
+
+def post_chat(url, query, session_id):
+    body = json.dumps({"query": query, "session_id": session_id}).encode("utf-8")
+    req = urllib.request.Request(f"{url}/api/chat", data=body, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=120) as resp:
+        resp.read()
+        return resp.status
+
+
+async def run_level(url, concurrency, total_requests):
+    semaphore = asyncio.Semaphore(concurrency)
+    # urllib is blocking: give every in-flight request its own client thread
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=concurrency))
+    latencies, failures = [], 0
+
+    async def one(i):
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                # One session per request so the per-session lock doesn't serialize them
+                await asyncio.to_thread(post_chat, url, SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)], f"load-{concurrency}-{i}")
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                failures += 1
+                print(f"  [FAIL] request {i}: {e}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total_requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] if latencies else 0.0
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0
+    print(f"concurrency={concurrency:>3}  ok={len(latencies):>4}  failed={failures:>3}  "
+          f"rps={len(latencies) / elapsed:6.2f}  p50={p50 * 1000:7.0f}ms  p95={p95 * 1000:7.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5002")
+    parser.add_argument("--levels", default="1,2,4,8,16", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=32, help="requests per level")
+    args = parser.parse_args()
+
+    for level in [int(x) for x in args.levels.split(",")]:
+        asyncio.run(run_level(args.url, level, args.requests))
+
+
+if __name__ == "__main__":
+    main()
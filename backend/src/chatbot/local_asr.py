@@ -0,0 +1,83 @@
+"""
+Local Whisper speech recognition, loaded once and kept resident.
+
+transcribe_with_local_whisper() used to call whisper.load_model("large-v3")
+for every utterance. LocalWhisper now wraps one loaded model (chatbot_rag
+builds it once through its resource container) and transcribes in-memory
+audio: WAV bytes straight from the microphone, or a float32 array, with no
+temp files and no ffmpeg.
+
+Engines:
+  "openai"  openai-whisper (PyTorch); sizes tiny ... large-v3
+  "faster"  faster-whisper (CTranslate2); same sizes plus distil-large-v3,
+            with compute_type "int8" (CPU), "int8_float16" or "float16" (GPU)
+"""
+import io
+import threading
+import wave
+
+import numpy as np
+
+WHISPER_SAMPLE_RATE = 16000
+WHISPER_ENGINES = ("openai", "faster")
+
+
+def wav_bytes_to_array(wav_bytes, sample_rate=WHISPER_SAMPLE_RATE):
+    """Mono float32 samples in [-1, 1] at sample_rate from an in-memory WAV file."""
+    with wave.open(io.BytesIO(wav_bytes)) as wav:
+        channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2:
+        samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+    elif width == 4:
+        samples = np.frombuffer(frames, dtype="<i4").astype(np.float32) / 2147483648.0
+    else:
+        raise ValueError(f"unsupported WAV sample width: {width * 8} bits")
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    if rate != sample_rate and len(samples):
+        # Linear resampling is plenty for speech going into Whisper's log-mel frontend
+        positions = np.arange(int(len(samples) * sample_rate / rate)) * (rate / sample_rate)
+        samples = np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+    return samples
+
+
+class LocalWhisper:
+    def __init__(self, model_size="large-v3", engine="openai", compute_type="int8", threads=0, device="cpu"):
+        if engine not in WHISPER_ENGINES:
+            raise ValueError(f"unknown whisper engine '{engine}' (expected one of {WHISPER_ENGINES})")
+        self.engine = engine
+        self.model_size = model_size
+        self.device = device
+        if engine == "faster":
+            from faster_whisper import WhisperModel
+            self.model = WhisperModel(model_size, device=device, compute_type=compute_type, cpu_threads=threads or 0)
+            self.compute_type = compute_type
+        else:
+            import whisper
+            if threads:
+                import torch
+                torch.set_num_threads(threads)
+            self.model = whisper.load_model(model_size, device=device)
+            self.compute_type = "float32" if device == "cpu" else "float16"
+        # Neither model is safe to run from two threads at once
+        self._lock = threading.Lock()
+
+    def transcribe(self, audio, language=None):
+        """(text, detected language) for WAV bytes or 16 kHz float32 samples."""
+        samples = wav_bytes_to_array(audio) if isinstance(audio, (bytes, bytearray)) else np.asarray(audio, dtype=np.float32)
+        with self._lock:
+            if self.engine == "faster":
+                segments, info = self.model.transcribe(samples, language=language)
+                # segments is a generator; decoding happens while it is consumed
+                text = "".join(segment.text for segment in segments)
+                detected_lang = info.language
+            else:
+                result = self.model.transcribe(samples, language=language, fp16=self.device != "cpu")
+                text, detected_lang = result.get("text") or "", result.get("language")
+        return text.strip(), detected_lang
+
+    def describe(self):
+        return f"{self.engine}:{self.model_size}:{self.compute_type}"
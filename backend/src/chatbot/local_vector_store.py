@@ -0,0 +1,368 @@
+"""
+In-process vector index over a Mongo collection, as a drop-in alternative to
+MongoDBAtlasVectorSearch (VECTOR_BACKEND=local).
+
+The hospital and medicine corpora are small, so their embeddings are loaded
+once into a contiguous float32 matrix (rows L2-normalized) and searched with
+a single matrix-vector product + argpartition. refresh() only fetches vectors
+whose text_hash changed since the last load, so it is cheap to call often.
+
+The embedding pipeline also writes a snapshot per collection (write_snapshot):
+a .npy matrix of normalized rows plus a .meta.json header holding the model,
+dtype, ids, texts and text hashes. The store np.load()s the matrix with
+mmap_mode="r", so cold start skips pulling BSON float lists out of Mongo and
+every uvicorn worker shares the same page-cache pages.
+
+refresh() never copies a mapped matrix. Changed and new documents go into a
+small private delta matrix searched next to the mapped base, and their old
+base rows (and deleted ones) are masked out. The delta is folded in when
+the embedding pipeline writes the next snapshot: refresh() sees the new
+.meta.json, maps the new file and starts with an empty delta again.
+Without a snapshot the base is private memory anyway and is rebuilt in place.
+"""
+import os
+import json
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from bson import ObjectId
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from vector_codec import decode_vector
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+def encode_id(doc_id):
+    if isinstance(doc_id, ObjectId):
+        return ["oid", str(doc_id)]
+    return ["raw", doc_id]
+
+
+def decode_id(encoded):
+    kind, value = encoded
+    return ObjectId(value) if kind == "oid" else value
+
+
+def field_value(fields, path):
+    value = fields
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def matches_filter(fields, mongo_filter):
+    """Evaluate the subset of Mongo filter syntax used for retrieval pre-filters
+    (equality, $eq/$ne/$gt/$gte/$lt/$lte/$in, dotted paths, implicit AND)."""
+    for path, condition in (mongo_filter or {}).items():
+        value = field_value(fields, path)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, target in condition.items():
+            if op == "$eq":
+                ok = value == target
+            elif op == "$ne":
+                ok = value != target
+            elif op == "$in":
+                ok = value in target
+            elif value is None:
+                ok = False
+            elif op == "$gt":
+                ok = value > target
+            elif op == "$gte":
+                ok = value >= target
+            elif op == "$lt":
+                ok = value < target
+            elif op == "$lte":
+                ok = value <= target
+            else:
+                raise ValueError(f"Unsupported pre-filter operator: {op}")
+            if not ok:
+                return False
+    return True
+
+
+def snapshot_name(collection):
+    return f"{collection.database.name}.{collection.name}"
+
+
+def snapshot_paths(snapshot_dir, name):
+    return os.path.join(snapshot_dir, f"{name}.npy"), os.path.join(snapshot_dir, f"{name}.meta.json")
+
+
+def write_snapshot(collection, snapshot_dir, model_name, dtype="float32",
+                   text_key="text", embedding_key="embeddings"):
+    """Dump a collection's embeddings to <dir>/<db>.<collection>.npy + .meta.json.
+    Files are written to temp names and renamed, so readers never see half a file."""
+    os.makedirs(snapshot_dir, exist_ok=True)
+    rows, ids, texts, hashes = [], [], [], []
+    for doc in collection.find({embedding_key: {"$exists": True, "$ne": []}},
+                               {text_key: 1, embedding_key: 1, "text_hash": 1}):
+        vector = decode_vector(doc[embedding_key])
+        if rows and vector.shape != rows[0].shape:
+            continue
+        norm = np.linalg.norm(vector)
+        rows.append(vector / norm if norm else vector)
+        ids.append(encode_id(doc["_id"]))
+        texts.append(doc.get(text_key, ""))
+        hashes.append(doc.get("text_hash"))
+    matrix = np.stack(rows).astype(dtype) if rows else np.zeros((0, 0), dtype=dtype)
+
+    matrix_path, meta_path = snapshot_paths(snapshot_dir, snapshot_name(collection))
+    with open(matrix_path + ".tmp", "wb") as f:
+        np.save(f, matrix)
+    meta = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "model": model_name,
+        "dtype": str(matrix.dtype),
+        "count": int(matrix.shape[0]),
+        "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "created_at": datetime.now().isoformat(),
+        "ids": ids,
+        "texts": texts,
+        "text_hashes": hashes,
+    }
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(matrix_path + ".tmp", matrix_path)
+    os.replace(meta_path + ".tmp", meta_path)
+    size_mb = os.path.getsize(matrix_path) / (1024 * 1024)
+    print(f"[SNAPSHOT] {collection.name}: {meta['count']} x {meta['dim']} {meta['dtype']} "
+          f"-> {matrix_path} ({size_mb:.2f} MB)")
+    return matrix_path
+
+
+def load_snapshot(snapshot_dir, name, model_name):
+    """Memory-map a snapshot; returns (matrix, ids, texts, hashes) or None if
+    missing, from another model or an unknown format version."""
+    matrix_path, meta_path = snapshot_paths(snapshot_dir, name)
+    if not (os.path.exists(matrix_path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format_version") != SNAPSHOT_FORMAT_VERSION or meta.get("model") != model_name:
+        print(f"[SNAPSHOT] Ignoring {meta_path}: built for {meta.get('model')} (v{meta.get('format_version')})")
+        return None
+    matrix = np.load(matrix_path, mmap_mode="r")
+    ids = [decode_id(encoded) for encoded in meta["ids"]]
+    hashes = dict(zip(ids, meta["text_hashes"]))
+    return matrix, ids, meta["texts"], hashes
+
+
+class LocalVectorStore(VectorStore):
+    def __init__(self, collection, embedding, text_key="text", embedding_key="embeddings",
+                 snapshot_dir=None, model_name=None, filter_key="filters"):
+        self.collection = collection
+        self._embedding = embedding
+        self.text_key = text_key
+        self.embedding_key = embedding_key
+        self.filter_key = filter_key
+        self.snapshot_dir = snapshot_dir
+        self.model_name = model_name
+        self._snapshot_mtime = None
+        self._refresh_lock = threading.Lock()
+        # Immutable snapshot, swapped atomically so searches never see a half-built index:
+        # (base matrix, delta matrix, ids, texts, hashes, per-row filter fields, live-row mask,
+        # pre-filter mask cache). Rows are numbered base first, then delta; ids/texts/filter
+        # fields follow that order. Each snapshot has its own mask cache, so a swap drops it.
+        self._snapshot = self._make_snapshot(np.zeros((0, 0), dtype=np.float32), [], [], {})
+        self._load_snapshot_file()
+        # Only documents changed since the snapshot are fetched from Mongo
+        self.refresh()
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    # --- index maintenance -------------------------------------------------
+    @staticmethod
+    def _make_snapshot(base, ids, texts, hashes):
+        return (base, np.zeros((0, base.shape[1] if base.ndim == 2 else 0), dtype=np.float32), list(ids), list(texts),
+                dict(hashes), [None] * len(ids), np.ones(len(ids), dtype=bool), {})
+
+    def _load_snapshot_file(self):
+        """Map the snapshot file if it is new since the last load; True if it was (re)loaded."""
+        if not self.snapshot_dir:
+            return False
+        _, meta_path = snapshot_paths(self.snapshot_dir, snapshot_name(self.collection))
+        try:
+            mtime = os.path.getmtime(meta_path)
+        except OSError:
+            return False
+        if mtime == self._snapshot_mtime:
+            return False
+        started = time.perf_counter()
+        loaded = load_snapshot(self.snapshot_dir, snapshot_name(self.collection), self.model_name)
+        self._snapshot_mtime = mtime
+        if not loaded:
+            return False
+        matrix, ids, texts, hashes = loaded
+        # Only the current snapshot's rows; refresh() fills in filter fields and the delta
+        self._snapshot = self._make_snapshot(matrix, ids, texts, {doc_id: hashes[doc_id] for doc_id in ids})
+        print(f"[VECTOR] {self.collection.name}: mapped {len(ids)} vectors from snapshot "
+              f"in {(time.perf_counter() - started) * 1000:.0f}ms")
+        return True
+
+    def refresh(self):
+        """Sync with the collection, fetching only new/changed vectors into the
+        delta. Filter fields are small and re-read for every document each time.
+        Returns the number of vectors fetched or dropped."""
+        with self._refresh_lock:
+            started = time.perf_counter()
+            self._load_snapshot_file()
+            base, delta, ids, texts, hashes, row_fields, live, _ = self._snapshot
+            current = {
+                doc["_id"]: doc
+                for doc in self.collection.find({self.embedding_key: {"$exists": True, "$ne": []}},
+                                                {"text_hash": 1, self.filter_key: 1})
+            }
+            # A missing hash (legacy docs) compares equal to itself, so those rows are
+            # fetched once and then kept, not refetched on every refresh
+            changed = [doc_id for doc_id, doc in current.items()
+                       if doc_id not in hashes or hashes[doc_id] != doc.get("text_hash")]
+            removed = [doc_id for doc_id in hashes if doc_id not in current]
+            if not changed and not removed:
+                new_row_fields = [{self.filter_key: current[doc_id].get(self.filter_key)} if is_live else None
+                                  for doc_id, is_live in zip(ids, live)]
+                if new_row_fields != row_fields:
+                    self._snapshot = (base, delta, ids, texts, hashes, new_row_fields, live, {})
+                return 0
+
+            fresh = {}
+            for doc in self.collection.find({"_id": {"$in": changed}},
+                                            {self.text_key: 1, self.embedding_key: 1, "text_hash": 1}):
+                fresh[doc["_id"]] = doc
+
+            # Base rows stay mapped; replaced or deleted ones are only masked out
+            n_base = len(base)
+            stale = set(changed) | set(removed)
+            base_live = np.array([bool(is_live) and doc_id not in stale
+                                  for doc_id, is_live in zip(ids[:n_base], live[:n_base])], dtype=bool)
+            dim = base.shape[1] if n_base else (delta.shape[1] if len(delta) else None)
+            delta_rows, delta_ids, delta_texts = [], [], []
+            for row, (doc_id, is_live) in enumerate(zip(ids[n_base:], live[n_base:])):
+                if is_live and doc_id not in stale:
+                    delta_rows.append(delta[row])
+                    delta_ids.append(doc_id)
+                    delta_texts.append(texts[n_base + row])
+            for doc_id, doc in fresh.items():
+                vector = decode_vector(doc[self.embedding_key])
+                if dim is not None and vector.shape != (dim,):
+                    continue  # embedded with a different model; skip rather than break the matrix
+                dim = vector.shape[0]
+                norm = np.linalg.norm(vector)
+                delta_rows.append((vector / norm if norm else vector).astype(np.float32))
+                delta_ids.append(doc_id)
+                delta_texts.append(doc.get(self.text_key, ""))
+
+            new_ids = ids[:n_base] + delta_ids
+            new_texts = texts[:n_base] + delta_texts
+            new_live = np.concatenate([base_live, np.ones(len(delta_ids), dtype=bool)])
+            new_delta = np.stack(delta_rows) if delta_rows else np.zeros((0, dim or 0), dtype=np.float32)
+            if not isinstance(base, np.memmap):
+                # Nothing shared to preserve: fold the delta into a private base right away
+                rows = [base[new_live[:n_base]], new_delta] if n_base else [new_delta]
+                kept = [doc_id for doc_id, is_live in zip(new_ids, new_live) if is_live]
+                kept_texts = [text for text, is_live in zip(new_texts, new_live) if is_live]
+                base = np.ascontiguousarray(np.concatenate(rows)) if kept else np.zeros((0, 0), dtype=np.float32)
+                new_ids, new_texts, new_live = kept, kept_texts, np.ones(len(kept), dtype=bool)
+                new_delta = np.zeros((0, base.shape[1] if base.ndim == 2 else 0), dtype=np.float32)
+            new_hashes = {doc_id: current[doc_id].get("text_hash")
+                          for doc_id, is_live in zip(new_ids, new_live) if is_live}
+            new_row_fields = [{self.filter_key: current[doc_id].get(self.filter_key)} if is_live else None
+                              for doc_id, is_live in zip(new_ids, new_live)]
+            self._snapshot = (base, new_delta, new_ids, new_texts, new_hashes, new_row_fields, new_live, {})
+            print(f"[VECTOR] {self.collection.name}: {len(new_hashes)} vectors "
+                  f"({len(fresh)} fetched, {len(removed)} removed, {len(new_delta)} in delta) "
+                  f"in {(time.perf_counter() - started) * 1000:.0f}ms")
+            return len(changed) + len(removed)
+
+    def start_auto_refresh(self, interval_sec, on_change=None):
+        """Refresh on a daemon thread every interval_sec seconds; on_change() runs
+        after a refresh that changed vectors or filter fields."""
+        def loop():
+            while True:
+                time.sleep(interval_sec)
+                try:
+                    before = self._snapshot
+                    self.refresh()
+                    if on_change and self._snapshot is not before:
+                        on_change()
+                except Exception as e:
+                    print(f"[VECTOR WARN] Refresh of {self.collection.name} failed: {e}")
+        threading.Thread(target=loop, name=f"vector-refresh-{self.collection.name}", daemon=True).start()
+
+    def __len__(self):
+        return len(self._snapshot[4])
+
+    # --- search --------------------------------------------------------------
+    def filter_mask(self, snapshot, pre_filter):
+        """Boolean row mask for a pre-filter, cached on the snapshot it was computed from."""
+        cache = snapshot[7]
+        key = repr(sorted(pre_filter.items()))
+        mask = cache.get(key)
+        if mask is None:
+            # Dead rows have no filter fields, so they never match
+            mask = np.array([fields is not None and matches_filter(fields, pre_filter) for fields in snapshot[5]],
+                            dtype=bool)
+            if len(cache) > 32:
+                cache.clear()
+            cache[key] = mask
+        return mask
+
+    def top_k(self, query_vector, k, pre_filter=None, snapshot=None):
+        """(row indices, cosine scores) of the k best rows, best first."""
+        snapshot = snapshot or self._snapshot
+        base, delta, live = snapshot[0], snapshot[1], snapshot[6]
+        if not len(live):
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        query = query / norm if norm else query
+        scores = base @ query if len(base) else np.zeros(0, dtype=np.float32)
+        if len(delta):
+            scores = np.concatenate([scores, delta @ query])
+        if pre_filter:
+            # Excluded rows can never rank, so top-k slots only go to eligible documents
+            scores = np.where(self.filter_mask(snapshot, pre_filter), scores, -np.inf)
+        elif not live.all():
+            scores = np.where(live, scores, -np.inf)
+        k = min(k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        best = best[np.isfinite(scores[best])]
+        return best, scores[best]
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4, pre_filter=None, **kwargs):
+        snapshot = self._snapshot
+        ids, texts = snapshot[2], snapshot[3]
+        rows, scores = self.top_k(embedding, k, pre_filter=pre_filter, snapshot=snapshot)
+        return [
+            (Document(page_content=texts[row], metadata={"_id": str(ids[row])}), float(score))
+            for row, score in zip(rows, scores)
+        ]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k=k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, **kwargs)]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score
+
+    # Documents are written by the embedding pipeline, never through the store
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError("LocalVectorStore is read-only; run the embedding pipeline instead.")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("LocalVectorStore is built from a Mongo collection, not from texts.")
@@ -0,0 +1,106 @@
+"""
+ONNX Runtime backend for the all-MiniLM-L6-v2 sentence embeddings.
+
+Same vectors as HuggingFaceEmbeddings (mean pooling over the token states,
+then L2 normalization, as in the sentence-transformers pipeline), but the
+transformer runs as an int8 dynamically quantized ONNX graph. Serving then
+needs only onnxruntime, tokenizers and NumPy; PyTorch is not loaded, which
+is where most of the worker's memory went.
+
+The model directory is produced once by export_onnx_model() (needs torch and
+transformers, dev machine only):
+
+    python embedding_backend_benchmark.py export
+    python embedding_backend_benchmark.py check     # cosine vs the PyTorch model
+    EMBEDDING_BACKEND=onnx EMBEDDING_THREADS=2 uvicorn api:app
+"""
+import os
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+ONNX_INPUTS = ["input_ids", "attention_mask", "token_type_ids"]
+FP32_FILE = "model.onnx"
+INT8_FILE = "model_int8.onnx"
+
+
+def export_onnx_model(model_name, output_dir, quantize=True, max_length=256, opset=14):
+    """Export the Hugging Face model to ONNX (+ an int8 copy) with its tokenizer.json."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name, model_max_length=max_length)
+    model = AutoModel.from_pretrained(model_name).eval()
+    sample = tokenizer(["export sample", "a somewhat longer export sample sentence"], padding=True, return_tensors="pt")
+    fp32_path = os.path.join(output_dir, FP32_FILE)
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in ONNX_INPUTS + ["last_hidden_state"]}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in ONNX_INPUTS),
+            fp32_path,
+            input_names=ONNX_INPUTS,
+            output_names=["last_hidden_state", "pooler_output"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+    tokenizer.save_pretrained(output_dir)
+    print(f"[ONNX] Exported {model_name} to {fp32_path}")
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        int8_path = os.path.join(output_dir, INT8_FILE)
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        print(f"[ONNX] int8 model: {os.path.getsize(int8_path) / 1e6:.1f} MB "
+              f"(fp32 {os.path.getsize(fp32_path) / 1e6:.1f} MB)")
+    return output_dir
+
+
+class OnnxEmbeddings(Embeddings):
+    def __init__(self, model_dir, model_file=INT8_FILE, threads=None, batch_size=32, max_length=256):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        options = ort.SessionOptions()
+        # 0 lets ONNX Runtime use every core; set it lower when several workers share a box
+        options.intra_op_num_threads = threads or 0
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.model_path = os.path.join(model_dir, model_file)
+        self.session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        pad_token = "[PAD]"
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id(pad_token) or 0, pad_token=pad_token)
+        self.threads = threads
+        self.batch_size = batch_size
+
+    def _embed_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(list(texts))
+        inputs = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {name: inputs[name] for name in self.input_names})[0]
+        mask = inputs["attention_mask"][:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.clip(norms, 1e-12, None)
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        # Batch texts of similar length together so little time goes into padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self._embed_batch([texts[i] for i in batch])):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text):
+        return self._embed_batch([text])[0].tolist()
@@ -0,0 +1,80 @@
+"""
+Recall-vs-size benchmark for the EMBEDDING_STORAGE formats on our own data.
+
+Loads the stored hospital and medicine vectors and uses each one in turn as
+a query against the rest. For every format it reports the BSON size per
+vector, recall@k against exact float64 search, and the mean cosine between
+the original and the decoded vector.
+
+    python quantization_benchmark.py --k 3 --max-queries 500
+"""
+import argparse
+
+import numpy as np
+import bson
+
+from chatbot_rag import hospital_collection, medicines_collection
+from vector_codec import encode_vector, decode_vector, EMBEDDING_STORAGE_FORMATS
+
+
+def load_vectors(collection):
+    rows = []
+    for doc in collection.find({"embeddings": {"$exists": True, "$ne": []}}, {"embeddings": 1, "embedding_storage": 1}):
+        if doc.get("embedding_storage", "float") != "float":
+            print(f"  [WARN] {collection.name} is stored as {doc['embedding_storage']}; "
+                  "the baseline is already quantized. Re-embed with EMBEDDING_STORAGE=float for a fair run.")
+        rows.append(np.asarray(decode_vector(doc["embeddings"]), dtype=np.float64))
+    if not rows:
+        return np.zeros((0, 0))
+    dim = rows[0].shape[0]
+    return np.stack([r for r in rows if r.shape[0] == dim])
+
+
+def normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k_excluding_self(matrix, queries, query_rows, k):
+    scores = queries @ matrix.T
+    scores[np.arange(len(query_rows)), query_rows] = -np.inf
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def benchmark_collection(name, reference, k, max_queries):
+    if len(reference) <= k:
+        print(f"\n[{name}] only {len(reference)} vectors; need more than k={k}. Skipping.")
+        return
+    rng = np.random.default_rng(0)
+    query_rows = rng.permutation(len(reference))[:max_queries]
+    reference_unit = normalize(reference)
+    queries = reference_unit[query_rows]
+    truth = top_k_excluding_self(reference_unit, queries, query_rows, k)
+
+    print(f"\n[{name}] {len(reference)} vectors x {reference.shape[1]} dims, {len(query_rows)} queries, k={k}")
+    print(f"  {'format':<8} {'bytes/vec':>10} {'total MB':>9} {'recall@k':>9} {'mean cos':>9}")
+    for storage in EMBEDDING_STORAGE_FORMATS:
+        encoded = [encode_vector(row.tolist(), storage) for row in reference]
+        bytes_per_vec = np.mean([len(bson.encode({"embeddings": e})) for e in encoded])
+        decoded = np.stack([decode_vector(e) for e in encoded]).astype(np.float64)
+        decoded_unit = normalize(decoded)
+        found = top_k_excluding_self(decoded_unit, queries, query_rows, k)
+        recall = np.mean([len(set(t) & set(f)) / k for t, f in zip(truth, found)])
+        mean_cos = float(np.mean(np.sum(reference_unit * decoded_unit, axis=1)))
+        total_mb = bytes_per_vec * len(reference) / (1024 * 1024)
+        print(f"  {storage:<8} {bytes_per_vec:>10.0f} {total_mb:>9.2f} {recall:>9.4f} {mean_cos:>9.5f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=3, help="top-k used by the retrievers")
+    parser.add_argument("--max-queries", type=int, default=500)
+    args = parser.parse_args()
+
+    for name, collection in [("HOSPITAL", hospital_collection), ("PHARMACY", medicines_collection)]:
+        benchmark_collection(name, load_vectors(collection), args.k, args.max_queries)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Lazily built process-wide resources (Mongo client, embedding models, ...).
+
+Importing chatbot_rag used to open a MongoClient and load the MiniLM model as
+a side effect, so every API worker start, reload and script import paid for
+both. Each heavy resource is now registered here as a named factory and built
+once per process: on first use, or up front with init() during startup.
+
+Module-level names keep working through proxies that resolve on first access:
+
+  container.handle("mongo_client")  forwards attribute and item access to
+                                    the built resource
+  LazyDatabase(client, "rag_db")    knows its name; db["x"] is a LazyCollection
+  LazyCollection                    knows its database and name, opens nothing
+                                    until the first query
+
+So `hospital_collection.find(...)` or `client.admin.command("ping")` behave
+exactly as before, just without connecting at import time.
+"""
+import threading
+import time
+
+
+class ResourceContainer:
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._errors = {}
+        self._build_sec = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory):
+        """factory() builds the resource; it may get() other resources."""
+        self._factories[name] = factory
+        self._locks[name] = threading.RLock()
+
+    def get(self, name):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        # One lock per resource so the client can connect while the model loads
+        with self._locks[name]:
+            if name not in self._instances:
+                started = time.perf_counter()
+                try:
+                    instance = self._factories[name]()
+                except Exception as e:
+                    with self._lock:
+                        self._errors[name] = str(e)
+                    raise
+                with self._lock:
+                    self._instances[name] = instance
+                    self._build_sec[name] = time.perf_counter() - started
+                    self._errors.pop(name, None)
+                print(f"[RESOURCE] {name} ready in {self._build_sec[name]:.2f}s")
+            return self._instances[name]
+
+    def built(self, name):
+        return name in self._instances
+
+    def handle(self, name):
+        return ResourceHandle(self, name)
+
+    def init(self, names=None):
+        """Build the given resources (default: all) now. Failures are logged and
+        reported in the returned status instead of raised."""
+        for name in names or list(self._factories):
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"[RESOURCE FAIL] {name}: {e}")
+        return self.status()
+
+    def status(self):
+        with self._lock:
+            report = {}
+            for name in self._factories:
+                if name in self._instances:
+                    report[name] = {"state": "ready", "build_sec": round(self._build_sec[name], 3)}
+                elif name in self._errors:
+                    report[name] = {"state": "failed", "error": self._errors[name]}
+                else:
+                    report[name] = {"state": "not_built"}
+            return report
+
+
+class ResourceHandle:
+    """Stand-in for a registered resource; builds it on first real use."""
+
+    def __init__(self, container, name):
+        self._container = container
+        self._name = name
+
+    def resolve(self):
+        return self._container.get(self._name)
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.resolve(), attr)
+
+    def __getitem__(self, key):
+        return self.resolve()[key]
+
+    def __repr__(self):
+        state = "built" if self._container.built(self._name) else "not built"
+        return f"<ResourceHandle {self._name} ({state})>"
+
+
+class LazyDatabase:
+    def __init__(self, client, name):
+        self._client = client
+        self.name = name
+
+    def resolve(self):
+        return self._client[self.name]
+
+    def __getitem__(self, collection_name):
+        return LazyCollection(self, collection_name)
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.resolve(), attr)
+
+    def __repr__(self):
+        return f"<LazyDatabase {self.name}>"
+
+
+class LazyCollection:
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self._collection = None
+
+    @property
+    def full_name(self):
+        return f"{self.database.name}.{self.name}"
+
+    def resolve(self):
+        if self._collection is None:
+            self._collection = self.database.resolve()[self.name]
+        return self._collection
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.resolve(), attr)
+
+    def __repr__(self):
+        return f"<LazyCollection {self.full_name}>"
+
+
+def resolve(obj):
+    """The real object behind a handle or lazy collection (obj itself otherwise),
+    for libraries that want a genuine pymongo Collection or Embeddings."""
+    return obj.resolve() if isinstance(obj, (ResourceHandle, LazyDatabase, LazyCollection)) else obj
@@ -0,0 +1,296 @@
+"""
+Per-session state for the chat API: each session owns its own booking flow
+and its own hospital/pharmacy chat memories, so history never leaks between
+users.
+
+Two backends are available (SESSION_BACKEND):
+  - "memory": sessions live in this process, LRU + idle-TTL evicted.
+  - "mongo":  sessions are serialized into a Mongo collection with a TTL
+              index, so any uvicorn worker or replica can serve the next turn.
+              A per-session lease in the same document keeps two workers from
+              running turns of one session at the same time.
+"""
+import os
+import asyncio
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+from chatbot_rag import PatientBookingSystem, new_chat_memory, hospital_db
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")  # "memory" or "mongo"
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "1000"))
+SESSION_IDLE_TTL_SEC = float(os.getenv("SESSION_IDLE_TTL_SEC", "1800"))
+# Mongo backend: a turn's lease on its session expires after this long (covers a
+# worker dying mid-turn); a second request waits up to SESSION_LOCK_WAIT_SEC for it
+SESSION_LOCK_LEASE_SEC = float(os.getenv("SESSION_LOCK_LEASE_SEC", "120"))
+SESSION_LOCK_WAIT_SEC = float(os.getenv("SESSION_LOCK_WAIT_SEC", "30"))
+SESSION_LOCK_POLL_SEC = 0.05
+
+
+class SessionBusyError(RuntimeError):
+    """Another worker is still running a turn for this session."""
+
+
+def new_session():
+    return {
+        "booking_system": PatientBookingSystem(),
+        "hospital_memory": new_chat_memory(),
+        "pharmacy_memory": new_chat_memory(),
+        "last_seen": time.monotonic(),
+    }
+
+
+def estimate_session_bytes(session):
+    """Rough size of what a session holds: chat messages plus booking fields."""
+    size = 0
+    for key in ("hospital_memory", "pharmacy_memory"):
+        for message in session[key].chat_memory.messages:
+            size += len(str(message.content))
+    for value in session["booking_system"].booking_data.values():
+        size += len(str(value))
+    return size
+
+
+def serialize_memory(memory):
+    """Keep only the messages inside the memory window, as [role, text] pairs."""
+    messages = memory.chat_memory.messages[-2 * memory.k:]
+    return [["h" if message.type == "human" else "a", message.content] for message in messages]
+
+
+def deserialize_memory(pairs):
+    memory = new_chat_memory()
+    for role, content in pairs or []:
+        if role == "h":
+            memory.chat_memory.add_user_message(content)
+        else:
+            memory.chat_memory.add_ai_message(content)
+    return memory
+
+
+def serialize_session(session):
+    return {
+        "booking": session["booking_system"].to_state(),
+        "hospital_memory": serialize_memory(session["hospital_memory"]),
+        "pharmacy_memory": serialize_memory(session["pharmacy_memory"]),
+    }
+
+
+def deserialize_session(state):
+    return {
+        "booking_system": PatientBookingSystem.from_state(state.get("booking")),
+        "hospital_memory": deserialize_memory(state.get("hospital_memory")),
+        "pharmacy_memory": deserialize_memory(state.get("pharmacy_memory")),
+        "last_seen": time.monotonic(),
+    }
+
+
+class SessionBackend:
+    """load() a session at the start of a turn, save() it at the end, and hold
+    lock_for() around both so turns of one session don't interleave."""
+
+    def __init__(self):
+        # Only sessions with a turn in flight keep their lock alive
+        self._locks = weakref.WeakValueDictionary()
+        self._locks_guard = threading.Lock()
+
+    def lock_for(self, session_id):
+        with self._locks_guard:
+            lock = self._locks.get(session_id)
+            if lock is None:
+                lock = asyncio.Lock()
+                self._locks[session_id] = lock
+            return lock
+
+    def ensure_indexes(self):
+        """Called once at startup, never at import."""
+
+    def load(self, session_id):
+        raise NotImplementedError
+
+    def save(self, session_id, session):
+        raise NotImplementedError
+
+    def stats(self):
+        raise NotImplementedError
+
+
+class InProcessSessionBackend(SessionBackend):
+    def __init__(self, max_sessions=SESSION_MAX_COUNT, idle_ttl_sec=SESSION_IDLE_TTL_SEC):
+        super().__init__()
+        self.max_sessions = max_sessions
+        self.idle_ttl_sec = idle_ttl_sec
+        self.sessions = OrderedDict()  # session_id -> session dict, least recently used first
+        self.lock = threading.Lock()
+        self.created = 0
+        self.evicted_idle = 0
+        self.evicted_lru = 0
+
+    def load(self, session_id):
+        """Return the session for session_id, creating it if needed, and mark it used."""
+        now = time.monotonic()
+        with self.lock:
+            self._evict_idle(now)
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = new_session()
+                self.sessions[session_id] = session
+                self.created += 1
+                while len(self.sessions) > self.max_sessions:
+                    self.sessions.popitem(last=False)
+                    self.evicted_lru += 1
+            else:
+                self.sessions.move_to_end(session_id)
+            session["last_seen"] = now
+            return session
+
+    def save(self, session_id, session):
+        # The live objects were mutated in place; nothing to write back
+        pass
+
+    def _evict_idle(self, now):
+        # LRU order means the idle sessions are all at the front
+        while self.sessions:
+            oldest_id, oldest = next(iter(self.sessions.items()))
+            if now - oldest["last_seen"] < self.idle_ttl_sec:
+                break
+            del self.sessions[oldest_id]
+            self.evicted_idle += 1
+
+    def __contains__(self, session_id):
+        return session_id in self.sessions
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def stats(self):
+        with self.lock:
+            self._evict_idle(time.monotonic())
+            memory_bytes = sum(estimate_session_bytes(s) for s in self.sessions.values())
+            return {
+                "backend": "memory",
+                "live_sessions": len(self.sessions),
+                "max_sessions": self.max_sessions,
+                "idle_ttl_sec": self.idle_ttl_sec,
+                "created": self.created,
+                "evicted_idle": self.evicted_idle,
+                "evicted_lru": self.evicted_lru,
+                "memory_bytes": memory_bytes,
+            }
+
+
+class MongoSessionBackend(SessionBackend):
+    """Sessions stored as {_id: session_id, state, updated_at, lock_owner,
+    lock_expires_at}; Mongo's TTL monitor removes sessions idle for longer
+    than idle_ttl_sec.
+
+    lock_for() takes the in-process lock and then a lease on the session
+    document, so turns of one session are serialized across workers too.
+    save() only writes while this worker still holds the lease; a turn that
+    outlived it is dropped rather than overwriting the newer one."""
+
+    def __init__(self, collection=None, idle_ttl_sec=SESSION_IDLE_TTL_SEC,
+                 lease_sec=SESSION_LOCK_LEASE_SEC, wait_sec=SESSION_LOCK_WAIT_SEC):
+        super().__init__()
+        self.collection = collection if collection is not None else hospital_db["chat_sessions"]
+        self.idle_ttl_sec = idle_ttl_sec
+        self.lease_sec = lease_sec
+        self.wait_sec = wait_sec
+        self._leases = {}  # session_id -> lease token held by this worker
+        self.created = 0
+        self.loaded = 0
+        self.saved = 0
+        self.lock_waits = 0
+        self.lost_leases = 0
+
+    def acquire_lease(self, session_id, token):
+        """True if this worker now holds the session's lease."""
+        now = datetime.now(timezone.utc)
+        try:
+            self.collection.update_one(
+                {"_id": session_id, "$or": [{"lock_expires_at": {"$lt": now}}, {"lock_expires_at": None}]},
+                {"$set": {"lock_owner": token, "lock_expires_at": now + timedelta(seconds=self.lease_sec),
+                          "updated_at": now}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False  # the document exists and its lease is still live
+        return True
+
+    def release_lease(self, session_id, token):
+        self.collection.update_one(
+            {"_id": session_id, "lock_owner": token},
+            {"$unset": {"lock_owner": "", "lock_expires_at": ""}},
+        )
+
+    @asynccontextmanager
+    async def lock_for(self, session_id):
+        async with super().lock_for(session_id):
+            token = uuid.uuid4().hex
+            deadline = time.monotonic() + self.wait_sec
+            while not await asyncio.to_thread(self.acquire_lease, session_id, token):
+                if time.monotonic() >= deadline:
+                    raise SessionBusyError(f"session {session_id} is busy in another worker")
+                self.lock_waits += 1
+                await asyncio.sleep(SESSION_LOCK_POLL_SEC)
+            self._leases[session_id] = token
+            try:
+                yield
+            finally:
+                self._leases.pop(session_id, None)
+                await asyncio.to_thread(self.release_lease, session_id, token)
+
+    def ensure_indexes(self):
+        try:
+            self.collection.create_index("updated_at", expireAfterSeconds=int(self.idle_ttl_sec), name="session_ttl")
+        except Exception as e:
+            print(f"[WARN] Could not create session TTL index: {e}")
+
+    def load(self, session_id):
+        doc = self.collection.find_one({"_id": session_id}, {"state": 1})
+        if not doc or "state" not in doc:  # the lease alone creates the document
+            self.created += 1
+            return new_session()
+        self.loaded += 1
+        return deserialize_session(doc.get("state") or {})
+
+    def save(self, session_id, session):
+        token = self._leases.get(session_id)
+        query = {"_id": session_id} if token is None else {"_id": session_id, "lock_owner": token}
+        result = self.collection.update_one(
+            query,
+            {"$set": {"state": serialize_session(session), "updated_at": datetime.now(timezone.utc)}},
+            upsert=token is None,
+        )
+        if token is not None and not result.matched_count:
+            self.lost_leases += 1
+            print(f"[WARN] Session {session_id}: lease expired mid-turn, newer state kept")
+            return
+        self.saved += 1
+
+    def stats(self):
+        return {
+            "backend": "mongo",
+            "live_sessions": self.collection.estimated_document_count(),
+            "idle_ttl_sec": self.idle_ttl_sec,
+            # Counters below are for this worker only
+            "created": self.created,
+            "loaded": self.loaded,
+            "saved": self.saved,
+            "lock_waits": self.lock_waits,
+            "lost_leases": self.lost_leases,
+        }
+
+
+def create_session_backend(name=SESSION_BACKEND):
+    if name == "mongo":
+        return MongoSessionBackend()
+    if name != "memory":
+        print(f"[WARN] Unknown SESSION_BACKEND '{name}', using in-process sessions.")
+    return InProcessSessionBackend()
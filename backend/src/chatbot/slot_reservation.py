@@ -0,0 +1,166 @@
+"""
+Atomic slot reservation for the booking flow.
+
+Every appointment document that occupies a slot carries `slot` (the hourly
+slot, "10:00") and `slot_active: True`. A unique index on
+(doctor_name, appointment_date, slot) that is partial on slot_active lets
+at most one live document hold a given slot. Taking a slot is then a
+single insert that either succeeds or raises DuplicateKeyError, and there
+is no read-then-write window between two patients.
+
+  hold()     when the user picks a time: inserts the appointment as
+             status "held", with hold_expires_at = now + hold_sec
+  confirm()  turns the hold into a "scheduled" appointment in one update,
+             or re-reserves atomically if the hold has already lapsed
+  release()  deletes a hold (user said no / restarted / picked another time)
+  cancel()   cancels an appointment and frees its slot (slot_active unset)
+
+Lapsed holds are removed by a TTL index on hold_expires_at. Because that
+monitor only runs about once a minute, an expired hold that blocks a new
+reservation is also deleted on the spot and the insert is retried once.
+A confirmed appointment has hold_expires_at unset, so the TTL index never
+touches it.
+"""
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from availability import ACTIVE_STATUSES, HELD_STATUS, as_date, slot_hour, slot_label, utc_now
+
+SLOT_INDEX = "unique_active_slot"
+
+
+def slot_fields(doctor_name, day, time_str):
+    return {
+        "doctor_name": doctor_name,
+        "appointment_date": as_date(day).isoformat(),
+        "slot": slot_label(slot_hour(time_str)),
+    }
+
+
+class SlotReservations:
+    def __init__(self, appointments_collection, hold_sec=300):
+        self.collection = appointments_collection
+        self.hold_sec = hold_sec
+
+    def ensure_indexes(self):
+        self.collection.create_index(
+            [("doctor_name", 1), ("appointment_date", 1), ("slot", 1)],
+            name=SLOT_INDEX,
+            unique=True,
+            partialFilterExpression={"slot_active": True},
+        )
+        self.collection.create_index("hold_expires_at", name="slot_hold_ttl", expireAfterSeconds=0)
+        self.backfill_active_slots()
+
+    def backfill_active_slots(self):
+        """Claim slots for upcoming appointments booked before slot_active existed.
+        Duplicates that were already double-booked are reported, not merged."""
+        today = datetime.now().date().isoformat()
+        claimed, clashes = 0, 0
+        for apt in self.collection.find(
+            {"status": {"$in": ACTIVE_STATUSES}, "slot_active": {"$exists": False}, "appointment_date": {"$gte": today}},
+            {"doctor_name": 1, "appointment_date": 1, "appointment_time": 1, "appointment_id": 1},
+        ):
+            if slot_hour(apt.get("appointment_time")) is None:
+                continue
+            try:
+                self.collection.update_one(
+                    {"_id": apt["_id"]},
+                    {"$set": {**slot_fields(apt.get("doctor_name"), apt["appointment_date"], apt["appointment_time"]),
+                              "slot_active": True}},
+                )
+                claimed += 1
+            except DuplicateKeyError:
+                clashes += 1
+                print(f"[SLOT WARN] Appointment {apt.get('appointment_id')} is double-booked with another one "
+                      f"({apt.get('doctor_name')} {apt['appointment_date']} {apt.get('appointment_time')})")
+        if claimed or clashes:
+            print(f"[SLOT] Backfilled {claimed} upcoming appointments ({clashes} clashes)")
+
+    def _is_slot_clash(self, error, document):
+        """True if the DuplicateKeyError came from the slot index (and not,
+        say, from the unique appointment_id index)."""
+        details = error.details or {}
+        if details.get("keyPattern"):
+            return "slot" in details["keyPattern"]
+        message = str(details.get("errmsg") or error)
+        if "index:" in message:
+            return SLOT_INDEX in message
+        # No details to go on (e.g. mongomock): check for a live holder of the slot
+        return self.collection.count_documents({
+            "doctor_name": document["doctor_name"],
+            "appointment_date": document["appointment_date"],
+            "slot": document["slot"],
+            "slot_active": True,
+        }, limit=1) > 0
+
+    def _insert_claim(self, document):
+        """Insert a slot-occupying document; False if the slot is taken.
+        Other duplicate keys (an appointment_id already in use) are re-raised."""
+        for attempt in range(2):
+            try:
+                self.collection.insert_one(dict(document))
+                return True
+            except DuplicateKeyError as e:
+                if not self._is_slot_clash(e, document):
+                    raise
+                # A lapsed hold the TTL monitor hasn't removed yet doesn't count
+                cleared = self.collection.delete_one({
+                    "doctor_name": document["doctor_name"],
+                    "appointment_date": document["appointment_date"],
+                    "slot": document["slot"],
+                    "status": HELD_STATUS,
+                    "hold_expires_at": {"$lte": utc_now()},
+                })
+                if not cleared.deleted_count:
+                    return False
+        return False
+
+    def hold(self, appointment_id, doctor_name, day, time_str, extra=None):
+        """Reserve the slot for hold_sec seconds. False if someone else has it;
+        raises DuplicateKeyError if appointment_id is already in use."""
+        now = datetime.now()
+        document = {
+            **(extra or {}),
+            **slot_fields(doctor_name, day, time_str),
+            "appointment_id": appointment_id,
+            "appointment_time": time_str,
+            "status": HELD_STATUS,
+            "slot_active": True,
+            "hold_expires_at": utc_now() + timedelta(seconds=self.hold_sec),
+            "created_at": now,
+            "updated_at": now,
+        }
+        return self._insert_claim(document)
+
+    def confirm(self, appointment_id, record):
+        """Turn the hold into the booked appointment `record`. Returns False if
+        the hold lapsed and the slot has been taken since."""
+        fields = {**record, **slot_fields(record["doctor_name"], record["appointment_date"], record["appointment_time"]),
+                  "slot_active": True, "updated_at": datetime.now()}
+        confirmed = self.collection.find_one_and_update(
+            {"appointment_id": appointment_id, "status": HELD_STATUS},
+            {"$set": fields, "$unset": {"hold_expires_at": ""}},
+            projection={"_id": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if confirmed:
+            return True
+        # Hold already expired (and was removed): take the slot directly if it is still free
+        return self._insert_claim({**fields, "appointment_id": appointment_id})
+
+    def release(self, appointment_id):
+        """Drop a hold; confirmed appointments are left alone."""
+        return self.collection.delete_one({"appointment_id": appointment_id, "status": HELD_STATUS}).deleted_count > 0
+
+    def cancel(self, appointment_id):
+        """Cancel an active or held appointment and free its slot. Returns the
+        document as it was before the update (None if there is no such
+        appointment, or it was already cancelled or completed)."""
+        return self.collection.find_one_and_update(
+            {"appointment_id": appointment_id, "status": {"$in": ACTIVE_STATUSES + [HELD_STATUS]}},
+            {"$set": {"status": "cancelled", "updated_at": datetime.now()}, "$unset": {"slot_active": ""}},
+            projection={"doctor_name": 1, "appointment_date": 1, "appointment_time": 1, "status": 1},
+        )
@@ -0,0 +1,131 @@
+"""
+Concurrent booking stress test for slot_reservation.py against a local mongod.
+
+Many threads race to book the same few slots of one doctor. Each booking
+either goes through SlotReservations (hold, then confirm or give up) or, with
+--mode naive, through the old read-then-insert path. At the end every slot
+must hold at most one live appointment. The naive mode shows why that needs
+the unique index.
+
+Some holds are abandoned on purpose (--abandon-rate) and are either released
+or left to lapse after --hold-sec, so holds expiring under contention are
+covered too. Uses a scratch database, which is dropped afterwards.
+
+    mongod --dbpath /tmp/mongo-stress &
+    python slot_stress.py --workers 32 --attempts 50 --slots 8
+    python slot_stress.py --mode naive
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import date, timedelta
+
+from pymongo import MongoClient
+
+from availability import ACTIVE_STATUSES, HELD_STATUS, utc_now
+from slot_reservation import SlotReservations
+
+DOCTOR = "Dr. Stress Test"
+
+
+def naive_book(collection, day, time_str):
+    """What create_appointment_record() used to do: check, then insert."""
+    taken = collection.find_one({"doctor_name": DOCTOR, "appointment_date": day.isoformat(),
+                                 "appointment_time": time_str, "status": {"$in": ACTIVE_STATUSES}})
+    if taken:
+        return False
+    collection.insert_one({"appointment_id": uuid.uuid4().hex[:8].upper(), "doctor_name": DOCTOR,
+                           "appointment_date": day.isoformat(), "appointment_time": time_str, "status": "scheduled"})
+    return True
+
+
+def worker(args, reservations, slots, results, barrier, rng_seed):
+    rng = random.Random(rng_seed)
+    barrier.wait()  # start everyone at once for maximum contention
+    for _ in range(args.attempts):
+        day, time_str = rng.choice(slots)
+        started = time.perf_counter()
+        if args.mode == "naive":
+            outcome = "booked" if naive_book(reservations.collection, day, time_str) else "taken"
+        else:
+            appointment_id = uuid.uuid4().hex[:8].upper()
+            if not reservations.hold(appointment_id, DOCTOR, day, time_str):
+                outcome = "taken"
+            elif rng.random() < args.abandon_rate:
+                # Patient walks away: half say "no", half just leave the hold to lapse
+                if rng.random() < 0.5:
+                    reservations.release(appointment_id)
+                outcome = "abandoned"
+            else:
+                record = {"appointment_id": appointment_id, "doctor_name": DOCTOR, "appointment_date": day.isoformat(),
+                          "appointment_time": time_str, "status": "scheduled"}
+                outcome = "booked" if reservations.confirm(appointment_id, record) else "lost"
+        results.append((outcome, time.perf_counter() - started))
+
+
+def live_counts(collection):
+    """Live appointments per (date, hour) slot; holds count only until they lapse."""
+    now = utc_now()
+    counts = Counter()
+    for apt in collection.find({"doctor_name": DOCTOR, "status": {"$in": ACTIVE_STATUSES + [HELD_STATUS]}}):
+        if apt["status"] == HELD_STATUS and apt["hold_expires_at"] <= now:
+            continue
+        counts[(apt["appointment_date"], apt["appointment_time"].split(":")[0])] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="slot_stress")
+    parser.add_argument("--mode", choices=["atomic", "naive"], default="atomic")
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--attempts", type=int, default=50, help="bookings tried per worker")
+    parser.add_argument("--slots", type=int, default=8, help="distinct slots everyone competes for")
+    parser.add_argument("--hold-sec", type=int, default=2)
+    parser.add_argument("--abandon-rate", type=float, default=0.2)
+    parser.add_argument("--keep", action="store_true", help="don't drop the scratch database")
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo_uri, serverSelectionTimeoutMS=3000)
+    client.drop_database(args.db)
+    collection = client[args.db]["appointments"]
+    reservations = SlotReservations(collection, hold_sec=args.hold_sec)
+    if args.mode == "atomic":
+        reservations.ensure_indexes()
+
+    day = date.today() + timedelta(days=1)
+    slots = [(day + timedelta(days=i // 8), f"{9 + i % 8:02d}:00") for i in range(args.slots)]
+    results, barrier = [], threading.Barrier(args.workers)
+    threads = [threading.Thread(target=worker, args=(args, reservations, slots, results, barrier, i))
+               for i in range(args.workers)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    outcomes = Counter(outcome for outcome, _ in results)
+    latencies = sorted(latency for _, latency in results)
+    counts = live_counts(collection)
+    double_booked = {slot: n for slot, n in counts.items() if n > 1}
+    print(f"[{args.mode}] {len(results)} attempts by {args.workers} workers on {args.slots} slots in {elapsed:.2f}s")
+    print(f"  outcomes: {dict(outcomes)}")
+    print(f"  latency p50={latencies[len(latencies) // 2] * 1000:.1f}ms "
+          f"p95={latencies[int(len(latencies) * 0.95)] * 1000:.1f}ms")
+    print(f"  slots with a live appointment: {len(counts)}/{args.slots}, double-booked: {len(double_booked)}")
+    for (slot_day, hour), n in sorted(double_booked.items()):
+        print(f"    {slot_day} {hour}:00 -> {n} appointments")
+
+    if not args.keep:
+        client.drop_database(args.db)
+    sys.exit(1 if double_booked else 0)
+
+
+if __name__ == "__main__":
+    main()
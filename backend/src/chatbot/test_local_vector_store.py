@@ -0,0 +1,125 @@
+"""
+Tests for LocalVectorStore against mongomock (no Atlas needed).
+
+    pip install pytest mongomock
+    cd backend/src/chatbot && python -m pytest -q test_local_vector_store.py
+"""
+import numpy as np
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from local_vector_store import LocalVectorStore, write_snapshot
+
+# Hand-picked 3-d vectors, so the expected ranking is obvious
+VECTORS = {
+    "north": [1.0, 0.0, 0.0],
+    "north-east": [0.8, 0.6, 0.0],
+    "east": [0.0, 1.0, 0.0],
+    "up": [0.0, 0.0, 1.0],
+}
+
+
+class FixedEmbeddings:
+    def embed_query(self, text):
+        return VECTORS[text]
+
+    def embed_documents(self, texts):
+        return [VECTORS[text] for text in texts]
+
+
+@pytest.fixture
+def collection():
+    coll = mongomock.MongoClient().rag_db["documents"]
+    for name, vector in VECTORS.items():
+        coll.insert_one({"_id": name, "text": name, "text_hash": name, "embeddings": vector,
+                         "filters": {"in_stock": True}})
+    return coll
+
+
+def texts(results):
+    return [document.page_content for document in results]
+
+
+def set_vector(coll, doc_id, vector, text_hash):
+    coll.update_one({"_id": doc_id}, {"$set": {"embeddings": vector, "text_hash": text_hash}})
+
+
+def test_top_k_order(collection):
+    store = LocalVectorStore(collection, FixedEmbeddings())
+    assert len(store) == 4
+    assert texts(store.similarity_search("north", k=3)) == ["north", "north-east", "east"]
+
+    scored = store.similarity_search_with_score("north", k=2)
+    assert [round(score, 3) for _, score in scored] == [1.0, 0.8]
+    assert scored[0][0].metadata["_id"] == "north"
+
+
+def test_incremental_refresh_fetches_only_changes(collection):
+    store = LocalVectorStore(collection, FixedEmbeddings())
+    assert store.refresh() == 0
+
+    set_vector(collection, "up", [0.9, 0.1, 0.0], "up-v2")
+    collection.insert_one({"_id": "west", "text": "west", "text_hash": "west", "embeddings": [-1.0, 0.0, 0.0],
+                           "filters": {"in_stock": True}})
+    assert store.refresh() == 2
+    assert len(store) == 5
+    assert texts(store.similarity_search("north", k=2)) == ["north", "up"]
+    assert store.refresh() == 0
+
+
+def test_documents_without_text_hash_are_fetched_once(collection):
+    collection.update_many({}, {"$unset": {"text_hash": ""}})
+    store = LocalVectorStore(collection, FixedEmbeddings())
+    assert len(store) == 4
+    assert store.refresh() == 0
+
+
+def test_deleted_and_replaced_rows_are_tombstoned_on_mapped_snapshot(collection, tmp_path):
+    write_snapshot(collection, str(tmp_path), "test-model")
+    store = LocalVectorStore(collection, FixedEmbeddings(), snapshot_dir=str(tmp_path), model_name="test-model")
+    assert isinstance(store._snapshot[0], np.memmap)
+
+    collection.delete_one({"_id": "north"})
+    set_vector(collection, "east", [1.0, 0.0, 0.0], "east-v2")
+    assert store.refresh() == 2
+
+    # The mapped base is kept; the replaced row lives in the delta and the old rows never rank
+    assert isinstance(store._snapshot[0], np.memmap)
+    assert len(store._snapshot[1]) == 1
+    assert len(store) == 3
+    assert texts(store.similarity_search("north", k=4)) == ["east", "north-east", "up"]
+
+
+def test_new_snapshot_folds_the_delta(collection, tmp_path):
+    write_snapshot(collection, str(tmp_path), "test-model")
+    store = LocalVectorStore(collection, FixedEmbeddings(), snapshot_dir=str(tmp_path), model_name="test-model")
+    set_vector(collection, "up", [0.9, 0.1, 0.0], "up-v2")
+    store.refresh()
+    assert len(store._snapshot[1]) == 1
+
+    write_snapshot(collection, str(tmp_path), "test-model")
+    store._snapshot_mtime = None  # same-second rewrite; mtime alone may not change
+    store.refresh()
+    assert len(store._snapshot[1]) == 0
+    assert texts(store.similarity_search("north", k=2)) == ["north", "up"]
+
+
+def test_pre_filter_mask_follows_filter_only_updates(collection):
+    store = LocalVectorStore(collection, FixedEmbeddings())
+    in_stock = {"filters.in_stock": True}
+    assert texts(store.similarity_search("north", k=2, pre_filter=in_stock)) == ["north", "north-east"]
+
+    # Same rows, only the filter fields change: the cached mask must not survive
+    collection.update_one({"_id": "north"}, {"$set": {"filters.in_stock": False}})
+    assert store.refresh() == 0
+    assert texts(store.similarity_search("north", k=2, pre_filter=in_stock)) == ["north-east", "east"]
+
+    collection.update_one({"_id": "north"}, {"$set": {"filters.in_stock": True}})
+    store.refresh()
+    assert texts(store.similarity_search("north", k=1, pre_filter=in_stock)) == ["north"]
+
+
+def test_pre_filter_can_exclude_everything(collection):
+    store = LocalVectorStore(collection, FixedEmbeddings())
+    assert store.similarity_search("north", k=3, pre_filter={"filters.in_stock": False}) == []
@@ -0,0 +1,148 @@
+"""
+Round-trip tests for MongoSessionBackend against mongomock.
+
+    pip install pytest mongomock
+    cd backend/src/chatbot && python -m pytest -q test_session_manager.py
+"""
+import asyncio
+from datetime import date
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+import chatbot_rag
+from chatbot_rag import PatientBookingSystem
+from session_manager import MongoSessionBackend, SessionBusyError, serialize_session
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = mongomock.MongoClient().rag_db
+    # from_state() reloads the chosen doctor from the hospital collection
+    monkeypatch.setattr(chatbot_rag, "hospital_collection", database["documents"])
+    return database
+
+
+@pytest.fixture
+def doctor(db):
+    doc = {"_id": "doc-1", "doctor_name": "Dr. Manoj Joshi", "specialty": "Cardiology"}
+    db["documents"].insert_one(doc)
+    return doc
+
+
+def booking_in_progress(doctor):
+    booking = PatientBookingSystem()
+    booking.current_booking_step = 3
+    booking.booking_data = {
+        "patient_name": "Asha",
+        "doctor": doctor,
+        "appointment_date": date(2026, 11, 2),
+    }
+    return booking
+
+
+def test_booking_state_round_trip(db, doctor):
+    state = booking_in_progress(doctor).to_state()
+    assert state == {
+        "step": 3,
+        "data": {"patient_name": "Asha", "doctor_id": "doc-1", "appointment_date": "2026-11-02"},
+    }
+
+    restored = PatientBookingSystem.from_state(state)
+    assert restored.current_booking_step == 3
+    assert restored.booking_data["doctor"]["doctor_name"] == "Dr. Manoj Joshi"
+    assert restored.booking_data["appointment_date"] == date(2026, 11, 2)
+
+
+def test_from_state_restarts_when_doctor_was_removed(db):
+    restored = PatientBookingSystem.from_state({"step": 3, "data": {"doctor_id": "gone"}})
+    assert restored.current_booking_step == 0
+    assert restored.booking_data == {}
+
+
+def test_save_and_load(db, doctor):
+    backend = MongoSessionBackend(collection=db["chat_sessions"])
+    session = backend.load("s1")
+    assert backend.created == 1
+    session["booking_system"] = booking_in_progress(doctor)
+    session["hospital_memory"].chat_memory.add_user_message("I need a cardiologist")
+    session["hospital_memory"].chat_memory.add_ai_message("Dr. Manoj Joshi is available.")
+    backend.save("s1", session)
+
+    stored = db["chat_sessions"].find_one({"_id": "s1"})
+    assert stored["state"] == serialize_session(session)
+    assert stored["updated_at"] is not None
+
+    loaded = backend.load("s1")
+    assert backend.loaded == 1
+    assert loaded["booking_system"].to_state() == session["booking_system"].to_state()
+    messages = loaded["hospital_memory"].chat_memory.messages
+    assert [m.content for m in messages] == ["I need a cardiologist", "Dr. Manoj Joshi is available."]
+
+
+def test_ensure_indexes_creates_ttl_index(db):
+    backend = MongoSessionBackend(collection=db["chat_sessions"], idle_ttl_sec=900)
+    backend.ensure_indexes()
+    index = db["chat_sessions"].index_information()["session_ttl"]
+    assert index["key"] == [("updated_at", 1)]
+    assert index["expireAfterSeconds"] == 900
+
+
+def test_booking_step_resumed_by_second_backend(db, doctor):
+    first = MongoSessionBackend(collection=db["chat_sessions"])
+    second = MongoSessionBackend(collection=db["chat_sessions"])
+
+    async def turn(backend, advance):
+        async with backend.lock_for("s1"):
+            session = backend.load("s1")
+            advance(session)
+            backend.save("s1", session)
+            return session
+
+    def start_booking(session):
+        session["booking_system"] = booking_in_progress(doctor)
+
+    def next_step(session):
+        assert session["booking_system"].current_booking_step == 3
+        assert session["booking_system"].booking_data["doctor"]["_id"] == "doc-1"
+        session["booking_system"].current_booking_step += 1
+
+    asyncio.run(turn(first, start_booking))
+    asyncio.run(turn(second, next_step))
+    assert first.load("s1")["booking_system"].current_booking_step == 4
+
+
+def test_lease_blocks_other_worker(db):
+    first = MongoSessionBackend(collection=db["chat_sessions"])
+    second = MongoSessionBackend(collection=db["chat_sessions"], wait_sec=0.2)
+
+    async def overlapping_turns():
+        async with first.lock_for("s1"):
+            with pytest.raises(SessionBusyError):
+                async with second.lock_for("s1"):
+                    pass
+        async with second.lock_for("s1"):
+            pass
+
+    asyncio.run(overlapping_turns())
+    assert "lock_owner" not in db["chat_sessions"].find_one({"_id": "s1"})
+
+
+def test_save_after_lost_lease_keeps_newer_state(db, doctor):
+    slow = MongoSessionBackend(collection=db["chat_sessions"], lease_sec=0)
+    fast = MongoSessionBackend(collection=db["chat_sessions"])
+
+    async def slow_turn():
+        async with slow.lock_for("s1"):
+            session = slow.load("s1")
+            # The lease has already expired, so another worker runs a full turn meanwhile
+            async with fast.lock_for("s1"):
+                newer = fast.load("s1")
+                newer["booking_system"] = booking_in_progress(doctor)
+                fast.save("s1", newer)
+            slow.save("s1", session)
+
+    asyncio.run(slow_turn())
+    assert slow.lost_leases == 1
+    assert db["chat_sessions"].find_one({"_id": "s1"})["state"]["booking"]["step"] == 3
@@ -0,0 +1,53 @@
+"""
+Storage codecs for the `embeddings` field.
+
+  "float"   - BSON array of doubles (what Atlas $vectorSearch indexes)
+  "float16" - BSON binary: 1 byte format tag + little-endian float16 values
+  "int8"    - BSON binary: 1 byte format tag + float32 scale + int8 values,
+              with scale = max(|v|) / 127 chosen per vector
+
+The quantized formats are only readable by our own retriever
+(VECTOR_BACKEND=local), which calls decode_vector() on load.
+"""
+import struct
+
+import numpy as np
+from bson.binary import Binary
+
+EMBEDDING_STORAGE_FORMATS = ("float", "float16", "int8")
+
+# User-defined BSON binary subtype so these are never mistaken for other blobs
+VECTOR_BINARY_SUBTYPE = 0x80
+_TAG_FLOAT16 = 1
+_TAG_INT8 = 2
+
+
+def encode_vector(values, storage="float"):
+    """Encode an embedding for storage in Mongo in the given format."""
+    if storage == "float" or not len(values):
+        return [float(v) for v in values]
+    vector = np.asarray(values, dtype=np.float32)
+    if storage == "float16":
+        payload = bytes([_TAG_FLOAT16]) + vector.astype("<f2").tobytes()
+    elif storage == "int8":
+        peak = float(np.max(np.abs(vector)))
+        scale = peak / 127.0 if peak else 1.0
+        quantized = np.clip(np.rint(vector / scale), -127, 127).astype(np.int8)
+        payload = bytes([_TAG_INT8]) + struct.pack("<f", scale) + quantized.tobytes()
+    else:
+        raise ValueError(f"Unknown embedding storage format: {storage}")
+    return Binary(payload, VECTOR_BINARY_SUBTYPE)
+
+
+def decode_vector(stored):
+    """float32 ndarray from any supported stored format (array or binary)."""
+    if isinstance(stored, (bytes, Binary)):
+        data = bytes(stored)
+        tag = data[0]
+        if tag == _TAG_FLOAT16:
+            return np.frombuffer(data, dtype="<f2", offset=1).astype(np.float32)
+        if tag == _TAG_INT8:
+            (scale,) = struct.unpack_from("<f", data, 1)
+            return np.frombuffer(data, dtype=np.int8, offset=5).astype(np.float32) * scale
+        raise ValueError(f"Unknown embedding binary tag: {tag}")
+    return np.asarray(stored, dtype=np.float32)